@@ -1,10 +1,11 @@
 import os
-import time
 import threading
 import numpy as np
 import pyvista as pv
 from pyvistaqt import QtInteractor
 from simulate import SimpleCam
+from engineProcess import EngineProcess, LocalEngine, ResultChannel
+from cutterLibrary import CutterSpec
 import requests
 import pandas as pd
 from projectManager import ProjectManager
@@ -13,7 +14,7 @@ from PyQt5.QtWidgets import (
     QWidget, QVBoxLayout, QHBoxLayout, QGridLayout, QPushButton,
     QProgressBar, QLabel, QTextEdit, QFrame, QSlider, QMessageBox, QSizePolicy
 )
-from PyQt5.QtCore import Qt, QTimer, QCoreApplication
+from PyQt5.QtCore import Qt, QTimer, QCoreApplication, QObject, pyqtSignal
 from PyQt5.QtGui import QColor, QTextCursor, QTextCharFormat
 
 # Matplotlib
@@ -22,12 +23,57 @@ from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
 from matplotlib.backends.backend_qt5agg import NavigationToolbar2QT as NavigationToolbar
 
 
+class ProgressSignal(QObject):
+    """
+    給模擬執行緒的進度物件 (setValue / setFormat / value 同 QProgressBar)：
+    經 Qt 訊號在介面執行緒更新進度條，數值或文字改變時才發出，不在工作執行緒中操作元件。
+    """
+    value_changed = pyqtSignal(int)
+    format_changed = pyqtSignal(str)
+
+    def __init__(self, progress_bar):
+        super().__init__()
+        self._value = progress_bar.value()
+        self._format = ''
+        self.value_changed.connect(progress_bar.setValue)
+        self.format_changed.connect(progress_bar.setFormat)
+
+    def setValue(self, value):
+        if value != self._value:
+            self._value = value
+            self.value_changed.emit(value)
+
+    def setFormat(self, text):
+        if text != self._format:
+            self._format = text
+            self.format_changed.emit(text)
+
+    def value(self):
+        return self._value
+
+
 class SimulationWidget(QWidget):
     """可嵌入的模拟界面组件"""
+    # 模擬執行緒 -> 介面執行緒 (queued connection)
+    rows_ready = pyqtSignal()
+    preview_ready = pyqtSignal(object)
+    simulation_done = pyqtSignal(object)
+
     def __init__(self, parent=None):
         super().__init__(parent)
         self.setup_ui()
         self.cnc = SimpleCam()
+        self.running_cnc = self.cnc  # 執行中的模擬 (漸進模擬顯示預覽時 self.cnc 為預覽，暫停 / 取消仍作用在此)
+        self.engine = EngineProcess()
+        self.local_engine = LocalEngine()
+        self.progress = ProgressSignal(self.progress_bar)
+        self.result_channel = ResultChannel(self.rows_ready.emit)
+        self.live_parameters = None  # 模擬中已完成的 cutting parameters (即時顯示，live_buffer 已填入的部分)
+        self.live_buffer = np.zeros((0, 11))
+        self.live_lines = None       # 即時顯示的 2D 圖曲線: {圖: (ax, Line2D, canvas, 欄位, [y 最小, y 最大])}
+        self.rows_ready.connect(self.on_rows_ready)
+        self.preview_ready.connect(self.show_preview)
+        self.simulation_done.connect(self.on_simulation_done)
         self.pj_manager = ProjectManager()
         self.settings = {
             'Workpiece': '',
@@ -43,6 +89,24 @@ class SimulationWidget(QWidget):
             'tool_for_anime': '',
             'simulation_step': 0.9,
             'Simulation Mode': 'Simplified',
+            'Stock Engine': 'Mesh',
+            'Stock Resolution': 0.5,
+            'Sweep Batch Steps': 1,
+            'Tile Size': 20.0,
+            'Remesh Tolerance': 0.01,
+            'Geometry Kernel': 'manifold3d',
+            'Tool Model': 'STL',
+            'Path Compression Tolerance': 0.0,
+            'Adaptive Step': False,
+            'Min Step': 0.1,
+            'Max Step': 3.0,
+            'Max Chord Error': 0.02,
+            'Parallel Workers': 1,
+            'Checkpoint Interval': 2000,
+            'Incremental Simulation': True,
+            'Result Cache Size': 2048,
+            'Progressive Preview': False,
+            'Engine Process': True,
             'STH data Synchronized range': ['', '']
         }
         self.workpiece_isPrepared = False
@@ -323,7 +387,18 @@ class SimulationWidget(QWidget):
                 width: 10px;
             }
         """)
-        layout.addWidget(self.progress_bar, 0, 1, 1, 2)  # 跨1行2列
+        # 執行中模擬的暫停 / 繼續與取消
+        self.btn_pause = QPushButton("Pause")
+        self.btn_pause.setEnabled(False)
+        self.btn_pause.clicked.connect(self.PauseButton_Onclick)
+        self.btn_cancel = QPushButton("Cancel")
+        self.btn_cancel.setEnabled(False)
+        self.btn_cancel.clicked.connect(self.CancelButton_Onclick)
+        progress_layout = QHBoxLayout()
+        progress_layout.addWidget(self.progress_bar)
+        progress_layout.addWidget(self.btn_pause)
+        progress_layout.addWidget(self.btn_cancel)
+        layout.addLayout(progress_layout, 0, 1, 1, 2)  # 跨1行2列
     
     def create_3d_plot(self, layout):
         """创建PyVista 3D绘图 (1,0) 跨1行2列"""
@@ -644,7 +719,9 @@ class SimulationWidget(QWidget):
         self.plot_workpiece_mesh()
         self.workpiece_isPrepared = True
     def to_STH_index(self, input_index):
-        input_workpiece_coordinate = self.cnc.cutting_parameters[input_index, :3]
+        # 模擬中 self.cnc.cutting_parameters 仍是逐步的列表，改用即時結果
+        cutting_parameters = self.cnc.cutting_parameters if self.live_parameters is None else self.live_parameters
+        input_workpiece_coordinate = cutting_parameters[input_index, :3]
         output_index = self.find_nearest_index(self.XYZ_data, input_workpiece_coordinate)
         return output_index
     
@@ -697,11 +774,11 @@ class SimulationWidget(QWidget):
         df.to_csv(export_filepath, index=False)
         QMessageBox.information(self, "匯出成功", f"已成功匯出至:\n{export_filepath}")
         
-    def plot_tool_mesh(self, filepath):
+    def plot_tool_mesh(self, filepath, tool_info=None):
         # filepath = self.settings['Tool']
-        if filepath == '':
+        if filepath == '' and CutterSpec.from_toolname(tool_info) is None:
             return
-        self.cnc.alignment_tool_and_offset(filepath, self.settings['Workpiece Offset'])
+        self.cnc.alignment_tool_and_offset(filepath, self.settings['Workpiece Offset'], tool_info)
         t_vertices = self.cnc.tool.vertices
         t_faces = self.cnc.tool.faces
         mesh_pv = self.trimesh_to_pv(t_vertices, t_faces)
@@ -709,33 +786,31 @@ class SimulationWidget(QWidget):
             self.plotter_3d.remove_actor(self.actor_tool)
         self.actor_tool = self.plotter_3d.add_mesh(mesh_pv, color='lightblue', show_edges=False)
         
-    def import_tool(self):
-        filepath = list(self.settings['Tool'].values())[0][0]
-        is_verified = True
+    def verify_tool(self, filepath, tool_info):
+        """刀具檔存在，或沒有刀具檔但刀具資訊可解析為參數化刀具"""
         if filepath == '':
+            if CutterSpec.from_toolname(tool_info) is not None:
+                return True
             QMessageBox.warning(self, '提示', 'Tool has not imported!')
-            is_verified = False
-        elif not os.path.exists(filepath):
+            return False
+        if not os.path.exists(filepath) and CutterSpec.from_toolname(tool_info) is None:
             QMessageBox.warning(self, '提示', 'Tool FilePath does\'t exist!')
-            is_verified = False
-        if not is_verified:
+            return False
+        return True
+
+    def import_tool(self):
+        filepath, tool_info = list(self.settings['Tool'].values())[0]
+        if not self.verify_tool(filepath, tool_info):
             return
-        self.plot_tool_mesh(filepath)
+        self.plot_tool_mesh(filepath, tool_info)
         self.tool_isPrepared = True
      
     def set_workpiece_offset(self):
-        filepath = list(self.settings['Tool'].values())[0][0]
-        is_verified = True
-        if filepath == '':
-            QMessageBox.warning(self, '提示', 'Tool has not imported!')
-            is_verified = False
-        elif not os.path.exists(filepath):
-            QMessageBox.warning(self, '提示', 'Tool FilePath does\'t exist!')
-            is_verified = False
-        if not is_verified:
+        filepath, tool_info = list(self.settings['Tool'].values())[0]
+        if not self.verify_tool(filepath, tool_info):
             return False
         else:
-            self.cnc.alignment_tool_and_offset(filepath, self.settings['Workpiece Offset'])
+            self.cnc.alignment_tool_and_offset(filepath, self.settings['Workpiece Offset'], tool_info)
             self.Workpiece_Offset_isPrepared = True
             return True
         
@@ -792,27 +867,31 @@ class SimulationWidget(QWidget):
         t_vertices = self.cnc.tool_for_anime[index][0]
         t_faces = self.cnc.tool_for_anime[index][1]
         
-        if isinstance(self.cnc.cutting_parameters, list):
+        if self.live_parameters is not None:
+            result = self.live_parameters
+        elif isinstance(self.cnc.cutting_parameters, list):
             result = np.concatenate(self.cnc.cutting_parameters, axis=0)
         else:
             result = self.cnc.cutting_parameters
         line_number = int(result[index, 8])
         self.highlight_line(line_number-1)
 
+        # 模擬中且之前未畫過 STH 訊號的圖時沒有 STH_time，以該步的時間標示
+        has_STH_time = getattr(self, 'STH_time', None) is not None
         if self.axvline1:
             self.axvline1.remove()
-        if self.settings['2DPlot_Column_choose'][0] in (3, 4, 5, 6):
+        if self.settings['2DPlot_Column_choose'][0] in (3, 4, 5, 6) and has_STH_time:
             self.axvline1 = self.ax1.axvline(x=self.STH_time[self.to_STH_index(index)], color='red')
         else:
-            self.axvline1 = self.ax1.axvline(x=self.cnc.cutting_parameters[index, 9], color='red')
+            self.axvline1 = self.ax1.axvline(x=result[index, 9], color='red')
         self.canvas1.draw()
         
         if self.axvline2:
             self.axvline2.remove()
-        if self.settings['2DPlot_Column_choose'][1] in (3, 4, 5, 6):
+        if self.settings['2DPlot_Column_choose'][1] in (3, 4, 5, 6) and has_STH_time:
             self.axvline2 = self.ax2.axvline(x=self.STH_time[self.to_STH_index(index)], color='red')
         else:
-            self.axvline2 = self.ax2.axvline(x=self.cnc.cutting_parameters[index, 9], color='red')
+            self.axvline2 = self.ax2.axvline(x=result[index, 9], color='red')
         self.canvas2.draw()
         
         self.plot_mesh(self.cnc.workpiece, self.cnc.tool,
@@ -839,15 +918,21 @@ class SimulationWidget(QWidget):
         else:
             self.actor_tool = self.plotter_3d.add_mesh(mesh_pv, color='lightblue', show_edges=False)
 
-    def Calculate_thread(self):
-        text = self.text_edit.toPlainText()
-        if self.gcode_is_altered:
-            self.settings['Gcode'] = text
-        self.cnc.calculate_cutting_volume(self.settings['Simulation Mode'], self.progress_bar, self.settings['Workpiece'], 
-                                          self.settings['Tool'], self.settings['Workpiece Orientation'], 
-                                          self.settings['Workpiece Offset'], text.strip().split('\n'), 
-                                          self.settings['Controller'], self.settings['Tool'], self.gcode_is_altered)
-        self.gcode_is_altered = False
+    def Calculate_thread(self, gcode, gcode_is_altered):
+        # 工作執行緒不直接操作元件: 進度、預覽、即時結果與完成都經由訊號交給介面執行緒
+        cnc = self.running_cnc
+        progressive = self.settings.get('Progressive Preview', False)
+        # 子程序模擬時介面不與模擬競爭 GIL，結果完成後放入 cnc
+        engine = self.engine if self.settings.get('Engine Process', True) else self.local_engine
+        engine.calculate(cnc, self.settings, self.progress, gcode, gcode_is_altered,
+                         self.preview_ready.emit if progressive else None,
+                         None if progressive else self.result_channel)
+        self.simulation_done.emit(cnc)
+
+    def show_preview(self, preview):
+        """顯示粗略預覽的結果 (完整模擬仍在進行，模擬按鈕維持停用)"""
+        self.cnc = preview
+        self.plot_cutted_details()
         
     def CalculateButton_Onclick(self):
         if self.check_filePath():
@@ -856,22 +941,107 @@ class SimulationWidget(QWidget):
             self.btn_simulate.setEnabled(False)
             self.frame_slider.setEnabled(False)
             self.progress_bar.setValue(0)
+            self.progress.setValue(0)
             if self.settings['Gcode'] != '':
                 self.gcode_isPrepared = True
+            text = self.text_edit.toPlainText()
+            if self.gcode_is_altered:
+                self.settings['Gcode'] = text
                 
-            self.cnc.simulation_step = self.settings['simulation_step']
-            threading.Thread(target=self.Calculate_thread).start()
-            
-            threading.Thread(target=self.wait_for_plot_cutted_details).start()
+            self.cnc.apply_settings(self.settings)
+            self.btn_pause.setText("Pause")
+            self.btn_pause.setEnabled(True)
+            self.btn_cancel.setEnabled(True)
+            # 漸進模擬以預覽的結果顯示，不即時顯示完整模擬的結果
+            self.result_channel.reset()
+            self.live_parameters = None if self.settings.get('Progressive Preview', False) else np.zeros((0, 11))
+            self.live_buffer = np.zeros((0, 11))
+            self.live_lines = None
+            self.running_cnc = self.cnc
+            self.calculate_thread = threading.Thread(target=self.Calculate_thread,
+                                                     args=(text.strip().split('\n'), self.gcode_is_altered))
+            self.gcode_is_altered = False
+            self.calculate_thread.start()
+
+    def PauseButton_Onclick(self):
+        if self.running_cnc.control.paused:
+            self.running_cnc.control.resume()
+            self.btn_pause.setText("Pause")
+        else:
+            self.running_cnc.control.pause()
+            self.btn_pause.setText("Resume")
+
+    def CancelButton_Onclick(self):
+        # 協同式取消: 模擬在下一步開始前結束，已完成的 cutting parameters 與動畫幀保留
+        self.running_cnc.control.cancel()
+        self.btn_pause.setEnabled(False)
+        self.btn_cancel.setEnabled(False)
+
+    def simulation_finished(self):
+        self.btn_simulate.setEnabled(True)
+        self.btn_pause.setText("Pause")
+        self.btn_pause.setEnabled(False)
+        self.btn_cancel.setEnabled(False)
 
-    def wait_for_plot_cutted_details(self):
-        while True:
-            if self.progress_bar.value() >= 1000:
-                self.frame_slider.setRange(0, len(self.cnc.workpiece_for_anime)-1)
-                self.frame_slider.setEnabled(True)
-                self.btn_simulate.setEnabled(True)
-                break
-            time.sleep(0.5)
+    def on_rows_ready(self):
+        """模擬中新完成的步: 加到即時結果，更新 2D 圖與可拖曳的幀範圍"""
+        rows = self.result_channel.take()
+        if len(rows) == 0 or self.live_parameters is None:
+            return
+        count = len(self.live_parameters)
+        if count + len(rows) > len(self.live_buffer):
+            # 容量不足時加倍，每批只複製新的列，不重新串接全部的結果
+            buffer = np.empty((max(2 * len(self.live_buffer), count + len(rows), 1024), rows.shape[1]))
+            buffer[:count] = self.live_parameters
+            self.live_buffer = buffer
+        self.live_buffer[count:count + len(rows)] = rows
+        self.live_parameters = self.live_buffer[:count + len(rows)]
+        self.update_live_plots(rows)
+        # 平行模式的動畫幀在工作程序中，模擬結束後才能讀取
+        frames = min(self.result_channel.frames, len(self.live_parameters))
+        if frames and self.settings.get('Parallel Workers', 1) <= 1:
+            self.frame_slider.setRange(0, frames - 1)
+            self.frame_slider.setEnabled(True)
+
+    def update_live_plots(self, rows):
+        """模擬中的 2D 圖: 第一批畫出曲線，之後以 set_data 更新曲線的資料並擴大座標範圍，不重新建立曲線"""
+        if self.live_lines is None:
+            self.plot_cutting_parameters(self.live_parameters, live=True)
+            self.live_lines = {}
+            plots = ((self.ax1, self.line_plot1, self.canvas1), (self.ax2, self.line_plot2, self.canvas2))
+            for plot, (ax, lines, canvas) in enumerate(plots):
+                column_choose = self.settings['2DPlot_Column_choose'][plot]
+                if column_choose in (0, 1, 2, 7):  # STH 訊號的圖在模擬完成後才畫
+                    column = 10 if column_choose == 7 else column_choose + 5
+                    y = self.live_parameters[:, column]
+                    self.live_lines[plot] = (ax, lines[0], canvas, column, [y.min(), y.max()])
+            return
+        for ax, line, canvas, column, y_range in self.live_lines.values():
+            line.set_data(self.live_parameters[:, 9], self.live_parameters[:, column])
+            y_range[0] = min(y_range[0], rows[:, column].min())
+            y_range[1] = max(y_range[1], rows[:, column].max())
+            y_min, y_max = y_range
+            ax.set_xlim(0, self.live_parameters[-1, 9])
+            if y_min == y_max:
+                buffer = 1 if y_min == 0 else abs(y_min * 0.05)
+                ax.set_ylim(y_min - buffer, y_max + buffer)
+            else:
+                ax.set_ylim(y_min - y_min*0.1, y_max + y_max*0.1)
+            canvas.draw_idle()
+
+    def on_simulation_done(self, cnc):
+        if not self.cnc.cancelled:  # 漸進模擬在預覽時就取消則保留預覽的結果
+            self.cnc = cnc
+        else:
+            self.cnc.control = cnc.control  # 保留的預覽之後再模擬時使用一般的控制 (不再以已取消的模擬為上層)
+        self.live_parameters = None
+        self.live_lines = None
+        self.simulation_finished()
+        self.plot_cutted_details()
+
+    def plot_cutted_details(self):
+        self.frame_slider.setRange(0, len(self.cnc.workpiece_for_anime)-1)
+        self.frame_slider.setEnabled(True)
             
         if isinstance(self.cnc.cutting_parameters, list):
             if self.cnc.cutting_parameters == []:
@@ -879,17 +1049,20 @@ class SimulationWidget(QWidget):
             cutting_parameters = np.concatenate(self.cnc.cutting_parameters, axis=0)
         else:
             cutting_parameters = self.cnc.cutting_parameters
-        
+        self.plot_cutting_parameters(cutting_parameters)
+
+    def plot_cutting_parameters(self, cutting_parameters, live=False):
+        """依 2DPlot_Column_choose 畫兩張 2D 圖；live (模擬中) 時 STH 訊號的圖在模擬完成後才畫"""
         if self.settings['2DPlot_Column_choose'][0] == 0 or self.settings['2DPlot_Column_choose'][0] == 1 or self.settings['2DPlot_Column_choose'][0] == 2:
             self.update_2d_plot1(cutting_parameters[:, 9], cutting_parameters[:, self.settings['2DPlot_Column_choose'][0]+5])
-        elif self.settings['2DPlot_Column_choose'][0] in (3, 4, 5, 6):
+        elif self.settings['2DPlot_Column_choose'][0] in (3, 4, 5, 6) and not live:
             self.update_2d_plot1(self.create_STH_time_array(), self.STH_data[:, self.settings['2DPlot_Column_choose'][0]-3])
         elif self.settings['2DPlot_Column_choose'][0] == 7:
             self.update_2d_plot1(cutting_parameters[:, 9], cutting_parameters[:, 10])
             
         if self.settings['2DPlot_Column_choose'][1] == 0 or self.settings['2DPlot_Column_choose'][1] == 1 or self.settings['2DPlot_Column_choose'][1] == 2:
             self.update_2d_plot2(cutting_parameters[:, 9], cutting_parameters[:, self.settings['2DPlot_Column_choose'][1]+5])
-        elif self.settings['2DPlot_Column_choose'][1] in (3, 4, 5, 6):
+        elif self.settings['2DPlot_Column_choose'][1] in (3, 4, 5, 6) and not live:
             self.update_2d_plot2(self.create_STH_time_array(), self.STH_data[:, self.settings['2DPlot_Column_choose'][1]-3])
         elif self.settings['2DPlot_Column_choose'][1] == 7:
             self.update_2d_plot2(cutting_parameters[:, 9], cutting_parameters[:, 10])
@@ -0,0 +1,157 @@
+import copy
+import multiprocessing
+import os
+import queue
+import signal
+import time
+import numpy as np
+import pandas as pd
+from projectFile import read_project
+from headlessRunner import run_settings
+try:
+    import resource  # 只有 POSIX 系統有，Windows 上不限制資源
+except ImportError:
+    resource = None
+
+SUMMARY_COLUMNS = ['Job', 'Status', 'Steps', 'Cycle Time (s)', 'Peak Force', 'Peak Engagement (mm^2)', 'Elapsed (s)', 'Error']
+
+
+def project_jobs(project_paths):
+    """每個專案檔 (.camproj) 一個工作。返回: [(名稱, 設定字典), ...]"""
+    return unique_names([(os.path.splitext(os.path.basename(path))[0], read_project(path)) for path in project_paths])
+
+
+def gcode_jobs(setup_path, gcode_paths):
+    """
+    共用一個專案檔的工件、刀具與模擬設定 (setup_path)，每個 G-code 檔一個工作。
+    返回: [(名稱, 設定字典), ...]
+    """
+    setup = read_project(setup_path)
+    jobs = []
+    for path in gcode_paths:
+        settings = copy.deepcopy(setup)
+        with open(path, 'r', encoding='utf-8') as f:
+            settings['Gcode'] = f.read()
+        jobs.append((os.path.splitext(os.path.basename(path))[0], settings))
+    return unique_names(jobs)
+
+
+def unique_names(jobs):
+    """名稱重複的工作加上序號，每個工作的結果資料夾不互相覆蓋"""
+    counts = {}
+    for name, _ in jobs:
+        counts[name] = counts.get(name, 0) + 1
+    return [(f"{name}_{i + 1}" if counts[name] > 1 else name, settings) for i, (name, settings) in enumerate(jobs)]
+
+
+def apply_limits(cpu_seconds, memory_mb):
+    """限制目前程序的 CPU 時間 (秒) 與虛擬記憶體 (MB)，0 為不限制"""
+    if resource is None:
+        if cpu_seconds or memory_mb:
+            print("Resource limits are not supported on this platform, running without limits.")
+        return
+    if cpu_seconds:
+        # 超過軟限制時收到 SIGXCPU (預設結束程序)，硬限制多留 5 秒確保程序一定結束
+        resource.setrlimit(resource.RLIMIT_CPU, (int(cpu_seconds), int(cpu_seconds) + 5))
+    if memory_mb:
+        limit = int(memory_mb) * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+def worker_settings(settings):
+    """
+    工作程序使用的設定: 'Parallel Workers' 固定為 1。
+    工作之間已經平行執行；工作程序若再建立空間分割的子程序，資源限制只作用在工作程序本身，
+    工作程序被限制終止時子程序也會留下
+    """
+    return dict(settings, **{'Parallel Workers': 1})
+
+
+def summarize(cnc):
+    """一次模擬的摘要: 步數、加工時間、最大切削力、最大切削截面積"""
+    cutting_parameters = np.asarray(cnc.cutting_parameters)
+    if len(cutting_parameters) == 0:
+        return {'Steps': 0, 'Cycle Time (s)': 0.0, 'Peak Force': 0.0, 'Peak Engagement (mm^2)': 0.0}
+    return {'Steps': len(cutting_parameters),
+            'Cycle Time (s)': float(cutting_parameters[-1, 9]),
+            'Peak Force': float(cutting_parameters[:, 10].max()),
+            'Peak Engagement (mm^2)': float(cutting_parameters[:, 7].max())}
+
+
+def job_worker(index, settings, output_dir, cpu_seconds, memory_mb, results):
+    """工作程序: 套用資源限制後模擬一個工作，結果寫到 output_dir，摘要或錯誤訊息放入 results"""
+    apply_limits(cpu_seconds, memory_mb)
+    try:
+        os.makedirs(output_dir, exist_ok=True)
+        results.put((index, summarize(run_settings(worker_settings(settings), None, output_dir)), None))
+    except MemoryError:
+        results.put((index, None, 'memory limit exceeded'))
+    except Exception as e:
+        results.put((index, None, f"{type(e).__name__}: {e}"))
+
+
+def exit_reason(exitcode):
+    """工作程序沒有回傳結果就結束時的原因"""
+    if hasattr(signal, 'SIGXCPU') and exitcode == -signal.SIGXCPU:
+        return 'CPU time limit exceeded'
+    if hasattr(signal, 'SIGKILL') and exitcode == -signal.SIGKILL:
+        return 'killed (CPU time limit or out of memory)'
+    if exitcode == -signal.SIGSEGV:
+        return 'crashed (possibly memory limit)'
+    return f'worker exited with code {exitcode}'
+
+
+def run_batch(jobs, output_root, workers=None, cpu_seconds=0, memory_mb=0, on_result=None):
+    """
+    以最多 workers 個程序同時模擬多個工作 (jobs: [(名稱, 設定字典), ...])，每個工作在新的程序中執行，
+    各自套用 CPU 時間與記憶體限制；程序被限制終止或發生例外只讓該工作失敗。
+    每個工作的結果 (與單次模擬相同的 CSV/STL) 在 output_root/名稱/TemporarySaved，
+    摘要表另存為 output_root/batch_summary.csv。on_result(摘要列) 在每個工作完成時呼叫。
+    返回: 摘要表 (pandas.DataFrame，依 jobs 的順序)
+    """
+    workers = workers or os.cpu_count() or 1
+    os.makedirs(output_root, exist_ok=True)
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    pending = list(range(len(jobs)))
+    running = {}    # index -> (process, 開始時間)
+    rows = {}
+
+    def finish(index, summary, error):
+        process, start = running.pop(index)
+        process.join()
+        row = {'Job': jobs[index][0], 'Status': 'failed' if error else 'ok', 'Elapsed (s)': round(time.time() - start, 2),
+               'Error': error or ''}
+        row.update(summary or {})
+        rows[index] = row
+        if on_result is not None:
+            on_result(row)
+
+    while pending or running:
+        while pending and len(running) < workers:
+            index = pending.pop(0)
+            name, settings = jobs[index]
+            process = context.Process(target=job_worker, daemon=True,
+                                      args=(index, settings, os.path.join(output_root, name), cpu_seconds, memory_mb, results))
+            process.start()
+            running[index] = (process, time.time())
+        try:
+            index, summary, error = results.get(timeout=0.5)
+            finish(index, summary, error)
+            continue
+        except queue.Empty:
+            pass
+        for index, (process, _) in list(running.items()):
+            if index in running and not process.is_alive():
+                # 程序結束前放入的結果可能還在佇列中，確認沒有之後才判定失敗
+                try:
+                    while True:
+                        finish(*results.get(timeout=0.1))
+                except queue.Empty:
+                    pass
+                if index in running:
+                    finish(index, None, exit_reason(process.exitcode))
+
+    summary = pd.DataFrame([rows[i] for i in range(len(jobs))], columns=SUMMARY_COLUMNS)
+    summary.to_csv(os.path.join(output_root, 'batch_summary.csv'), index=False)
+    return summary
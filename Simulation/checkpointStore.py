@@ -0,0 +1,65 @@
+import glob
+import os
+import pickle
+import tempfile
+
+
+class CheckpointStore:
+    """
+    模擬檢查點的存放處，每個模擬 (signature) 一個檔案 (<signature>.pkl)，只保留該模擬最新的一份。
+    先寫入唯一的暫存檔再以 os.replace 取代，寫到一半中斷 (當機、關閉程式) 也不會破壞上一份檢查點，
+    多個分頁或漸進預覽同時模擬也不會寫入同一個暫存檔、互相覆蓋或清除對方的檢查點。
+    檢查點內容為序列化的 {'signature', 'snapshot' (SimpleCam.capture_snapshot), 'cutting_parameters'}，
+    signature 不同 (輸入或設定已改變) 時不可接續。目錄中最多保留 max_files 份檢查點，較舊的在寫入時刪除。
+    """
+    def __init__(self, directory, signature, max_files=8):
+        self.directory = directory
+        self.path = os.path.join(directory, f"{signature}.pkl")
+        self.max_files = max_files
+
+    def save(self, data):
+        os.makedirs(self.directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(suffix='.tmp', dir=self.directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, self.path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        self.prune()
+
+    def prune(self):
+        """刪除最舊的檢查點 (不含本模擬的)，目錄中最多保留 max_files 份"""
+        paths = [path for path in glob.glob(os.path.join(self.directory, '*.pkl')) if path != self.path]
+        try:
+            paths.sort(key=os.path.getmtime)
+        except OSError:
+            return  # 其他模擬正在取代或清除檔案，下次寫入時再整理
+        for path in paths[:max(0, len(paths) + 1 - self.max_files)]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def load(self, signature):
+        """讀取最新的檢查點，不存在、無法讀取或 signature 不符時返回 None"""
+        if not os.path.exists(self.path):
+            return None
+        try:
+            with open(self.path, 'rb') as f:
+                checkpoint = pickle.load(f)
+        except Exception as e:
+            print(f"Checkpoint {self.path} could not be loaded: {e}")
+            return None
+        if checkpoint.get('signature') != signature:
+            return None
+        return checkpoint
+
+    def clear(self):
+        """只刪除本模擬的檢查點"""
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
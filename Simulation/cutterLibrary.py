@@ -0,0 +1,98 @@
+import re
+import numpy as np
+import trimesh
+from stockEngine import ToolProfile
+
+# toolname 註解格式: <型式><直徑>[R<圓角半徑>][A<單邊錐度角>]-<刃長>_<全長>[_<其他>]
+#   D10R1-50_100_MST : 直徑 10、圓角 R1 的圓鼻刀，刃長 50、全長 100
+#   D10-30_75        : 直徑 10 的平刀
+#   B6-20_60         : 直徑 6 的球刀 (圓角半徑 = D/2)
+#   D6R3A2-20_60     : 刀尖直徑 6、球頭、單邊錐度 2° 的錐度球刀
+TOOLNAME_PATTERN = re.compile(r'([DB])(\d+(?:\.\d+)?)(?:R(\d+(?:\.\d+)?))?(?:A(\d+(?:\.\d+)?))?'
+                              r'(?:-(\d+(?:\.\d+)?))?(?:_(\d+(?:\.\d+)?))?', re.IGNORECASE)
+TOOLNAME_COMMENT = re.compile(r'toolname\s*=\s*([^\s)]+)', re.IGNORECASE)
+
+
+class CutterSpec:
+    """
+    參數化刀具 (平刀、球刀、圓鼻刀、錐度刀)，由 toolname 註解或刀具表的刀具資訊建立。
+    刀具輪廓為精確的迴轉輪廓，材料模型引擎不需刀具 STL；網格引擎與動畫用的刀具網格由輪廓迴轉產生。
+    """
+    def __init__(self, diameter, corner_radius=0.0, taper_angle=0.0, flute_length=None, length=None, name=''):
+        self.diameter = float(diameter)
+        self.corner_radius = float(corner_radius)
+        self.taper_angle = float(taper_angle)   # 單邊錐度角 (deg)
+        # 刃長至少涵蓋刀尖圓角，未指定時取 3D，全長未指定時再加 2D 的刀柄
+        self.flute_length = max(float(flute_length or 3 * self.diameter), self.corner_radius)
+        self.length = max(float(length or self.flute_length + 2 * self.diameter), self.flute_length)
+        self.name = name
+
+    @classmethod
+    def from_toolname(cls, text):
+        """解析 toolname 註解 (或刀具表的刀具資訊)，無法解析時返回 None"""
+        if not text:
+            return None
+        comment = TOOLNAME_COMMENT.search(text)
+        name = comment.group(1) if comment else text.strip()
+        match = TOOLNAME_PATTERN.match(name)
+        if match is None:
+            return None
+        kind, diameter, corner, taper, flute, length = match.groups()
+        diameter = float(diameter)
+        corner_radius = diameter / 2 if kind.upper() == 'B' else float(corner or 0.0)
+        if diameter <= 0 or corner_radius > diameter / 2:
+            print(f"Invalid toolname '{name}': corner radius must be between 0 and D/2.")
+            return None
+        return cls(diameter, corner_radius, float(taper or 0.0),
+                   float(flute) if flute else None, float(length) if length else None, name)
+
+    @property
+    def kind(self):
+        if self.taper_angle > 0:
+            return 'taper'
+        if self.corner_radius <= 0:
+            return 'flat'
+        if self.corner_radius >= self.diameter / 2:
+            return 'ball'
+        return 'bull-nose'
+
+    @property
+    def cutting_radius(self):
+        """刃長頂端的刀具半徑 (錐度刀大於刀尖半徑)"""
+        return self.profile_points()[1][-1]
+
+    def profile_points(self, segments=16):
+        """迴轉輪廓 (t, r)：刀尖為原點，依序為底面、圓角圓弧、錐度段 (刃長)、刀柄 (全長)"""
+        R = self.corner_radius
+        a = np.deg2rad(self.taper_angle)
+        r_bottom = self.diameter / 2 - R
+        if R > 0:
+            # 圓角圓弧中心 (r_bottom, R)，由刀尖 (-90°) 到與錐度線相切處 (-a)
+            phi = np.linspace(-np.pi / 2, -a, segments + 1)
+            t = R * (1 + np.sin(phi))
+            r = r_bottom + R * np.cos(phi)
+        else:
+            t, r = np.array([0.0]), np.array([r_bottom])
+        r_flute = r[-1] + (self.flute_length - t[-1]) * np.tan(a)
+        t = np.concatenate((t, [self.flute_length, self.length]))
+        r = np.concatenate((r, [r_flute, r_flute]))
+        keep = np.concatenate(([True], np.diff(t) > 1e-9))
+        return t[keep], r[keep]
+
+    def profile(self):
+        if getattr(self, '_profile', None) is None:
+            self._profile = ToolProfile(*self.profile_points())
+        return self._profile
+
+    def mesh(self, sections=64):
+        """由迴轉輪廓產生刀具網格 (刀尖在原點，刀軸 +Z)"""
+        t, r = self.profile_points()
+        linestring = [(rho, z) for rho, z in zip(r, t)]
+        if r[0] > 0:
+            linestring.insert(0, (0.0, 0.0))
+        linestring.append((0.0, self.length))
+        return trimesh.creation.revolve(np.array(linestring), sections=sections)
+
+    def __repr__(self):
+        return (f"CutterSpec({self.kind}, D={self.diameter:g}, R={self.corner_radius:g}, A={self.taper_angle:g}, "
+                f"flute={self.flute_length:g}, length={self.length:g})")
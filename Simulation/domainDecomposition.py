@@ -0,0 +1,254 @@
+import multiprocessing
+from bisect import bisect_right
+from collections import deque
+import numpy as np
+import trimesh
+from trimesh.boolean import boolean_manifold
+from stockEngine import TiledMeshStock, build_stock_model
+
+
+def merge_removals(removals):
+    """合併同一步在各區域的切削結果: 體積相加、重心依體積加權、取樣點串接"""
+    removals = [removal for removal in removals if removal is not None]
+    if len(removals) < 2:
+        return removals[0] if removals else None
+    volumes = np.array([removal['volume'] for removal in removals])
+    centroids = np.array([removal['centroid'] for removal in removals])
+    centroid = np.average(centroids, axis=0, weights=volumes) if volumes.sum() > 0 else centroids.mean(axis=0)
+    return {'volume': float(volumes.sum()), 'centroid': centroid,
+            'points': np.concatenate([removal['points'] for removal in removals])}
+
+
+def split_regions(mesh, count, align, halo=0.0):
+    """
+    沿工件 XY 較長的一軸把工件切成 count 個區域 (切面對齊 align 的整數倍，使各區域的格點與整體一致)。
+    每個區域的網格在內側切面再向外延伸 halo (相鄰區域重疊)，重疊部分的切削量只由擁有該範圍的區域回報。
+    返回: axis, [(擁有範圍 lower, upper, 區域網格), ...] (不含材料的區域略過)
+    """
+    bounds = mesh.bounds
+    axis = int(np.argmax(bounds[1][:2] - bounds[0][:2]))
+    length = bounds[1][axis] - bounds[0][axis]
+    cells = max(int(np.ceil(length / align - 1e-9)), 1)
+    cuts = bounds[0][axis] + np.round(np.linspace(0, cells, min(count, cells) + 1)) * align
+    cuts[0], cuts[-1] = -np.inf, np.inf
+    regions = []
+    for lower, upper in zip(cuts[:-1], cuts[1:]):
+        box_bounds = np.array([bounds[0] - 1.0, bounds[1] + 1.0])
+        box_bounds[:, axis] = max(lower - halo, box_bounds[0][axis]), min(upper + halo, box_bounds[1][axis])
+        piece = boolean_manifold([mesh, trimesh.creation.box(bounds=box_bounds)], operation='intersection', check_volume=False)
+        if not piece.is_empty:
+            regions.append((lower, upper, piece))
+    return axis, regions
+
+
+def region_worker(requests, results, engine, regions, split_axis, options):
+    """
+    工作程序: 建立所擁有區域的材料模型 (regions: [(lower, upper, 網格), ...])，依序處理刀具與切削訊息。
+    ('tool', tool, profile)  : 換刀
+    ('cut', [(step, indices, tip, axis, pose), ...]) : 依序在指定區域移除刀具，一次回傳每步各區域的切削結果
+    ('finish',)              : 回傳各區域材料模型與其動畫紀錄對應的步序後結束
+    """
+    stocks = []
+    for lower, upper, mesh in regions:
+        stock = build_stock_model(engine, mesh, **options)
+        if not isinstance(stock, TiledMeshStock):
+            stock.report_bounds = (np.full(3, -np.inf), np.full(3, np.inf))
+            stock.report_bounds[0][split_axis], stock.report_bounds[1][split_axis] = lower, upper
+        stock.frames.record()
+        stocks.append(stock)
+    steps = [[-1] for _ in stocks]
+    tool = profile = None
+    while True:
+        message = requests.get()
+        if message[0] == 'tool':
+            _, tool, profile = message
+        elif message[0] == 'cut':
+            batch = []
+            for step, indices, tip, axis, pose in message[1]:
+                removals = []
+                for region in indices:
+                    stock = stocks[region]
+                    if isinstance(stock, TiledMeshStock):
+                        mesh = tool.copy()
+                        mesh.apply_transform(pose)
+                        removal = stock.remove_mesh(mesh)
+                    else:
+                        removal = stock.remove_tool(tip, profile, axis)
+                    if removal is not None:
+                        stock.frames.record()
+                        steps[region].append(step)
+                    removals.append(removal)
+                batch.append(removals)
+            results.put(batch)
+        else:
+            results.put((stocks, steps))
+            return
+
+
+class FinishedDomain:
+    """模擬結束後的空間分解: 只保留各區域的材料模型與其動畫紀錄對應的步序 (DomainFrames 序列化時取代 DomainDecomposedStock)"""
+    def __init__(self, region_stocks):
+        self._region_stocks = region_stocks
+
+    def region_stocks(self):
+        return self._region_stocks
+
+
+class DomainFrames:
+    """
+    平行模式的逐步動畫紀錄。主程序只記錄每步的轉換矩陣，各區域的紀錄在工作程序中，模擬結束後取回；
+    讀取某一幀時取各區域在該步之前的最後一幀串接，介面與 StockFrames 相同。
+    """
+    def __init__(self, domain):
+        self.domain = domain
+        self._transforms = []
+        self._cache_index = None
+        self._cache_mesh = None
+
+    def record(self, transform=None):
+        self._transforms.append(None if transform is None else np.array(transform, dtype=np.float64))
+
+    def __len__(self):
+        return len(self._transforms)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self._transforms)
+        if not 0 <= index < len(self._transforms):
+            raise IndexError(index)
+        if index != self._cache_index:
+            vertices, faces, offset = [], [], 0
+            for stock, steps in self.domain.region_stocks():
+                v, f = stock.frames[bisect_right(steps, index) - 1]
+                vertices.append(v)
+                faces.append(np.asarray(f) + offset)
+                offset += len(v)
+            vertices = np.concatenate(vertices) if vertices else np.zeros((0, 3))
+            faces = np.concatenate(faces) if faces else np.zeros((0, 3), dtype=np.int64)
+            if self._transforms[index] is not None:
+                vertices = trimesh.transformations.transform_points(vertices, self._transforms[index])
+            self._cache_mesh = (vertices, faces)
+            self._cache_index = index
+        return self._cache_mesh
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def __getstate__(self):
+        # 序列化 (結果快取) 時不含工作程序與 Queue，只保留取回的各區域材料模型
+        state = self.__dict__.copy()
+        state['domain'] = FinishedDomain(self.domain.region_stocks())
+        state['_cache_index'] = state['_cache_mesh'] = None
+        return state
+
+
+class DomainDecomposedStock:
+    """
+    空間分解的平行材料模型。工件切成 workers * regions_per_worker 個區域，交錯分配給各工作程序，
+    每個區域是獨立的材料模型 (engine)，格點引擎的相鄰區域重疊 3 格，使區域邊界的切削與網格都連續
+    (Tiled Mesh 的區域切面即 tile 邊界，不需重疊)。每一步只送到刀具 AABB 與其區域重疊的工作程序，
+    主程序不等待結果即可繼續下一步；collect 依送出的步序取回並合併各區域的切削結果。
+    各工作程序依序處理自己的訊息，同一區域的切削順序與逐步模擬相同。
+    座標皆為材料模型 (工件) 座標系。
+    """
+    def __init__(self, mesh, engine, workers, resolution=0.5, tile_size=20.0, remesh_tolerance=0.0,
+                 regions_per_worker=2, batch_size=16):
+        self.engine = engine
+        self.frames = DomainFrames(self)
+        align = tile_size if engine == 'Tiled Mesh' else resolution
+        halo = 0.0 if engine == 'Tiled Mesh' else 3 * resolution
+        self.axis, regions = split_regions(mesh, workers * regions_per_worker, align, halo)
+        self.workers = min(workers, len(regions))
+        # 區域 r 由工作程序 r % workers 擁有，在該程序中的索引為 r // workers；刀具碰到區域含重疊的範圍即送出
+        self.bounds = np.array([(lower - halo - align, upper + halo + align) for lower, upper, _ in regions])
+        self.owner = np.arange(len(regions)) % self.workers
+        self.local = np.arange(len(regions)) // self.workers
+        options = {'resolution': resolution, 'tile_size': tile_size, 'remesh_tolerance': remesh_tolerance}
+        context = multiprocessing.get_context('spawn')
+        self.requests, self.results, self.processes = [], [], []
+        for w in range(self.workers):
+            requests, results = context.Queue(), context.Queue()
+            process = context.Process(target=region_worker, daemon=True,
+                                      args=(requests, results, engine, regions[w::self.workers], self.axis, options))
+            process.start()
+            self.requests.append(requests)
+            self.results.append(results)
+            self.processes.append(process)
+        # 切削訊息累積 batch_size 步 (或需要結果時) 才一起送出，結果也整批取回，減少行程間通訊的次數
+        self.batch_size = batch_size
+        self.outbox = [[] for _ in range(self.workers)]
+        self.inbox = [deque() for _ in range(self.workers)]
+        self.pending = deque()
+        self.step = 0
+        self._region_stocks = None
+
+    def flush(self, worker):
+        if self.outbox[worker]:
+            self.requests[worker].put(('cut', self.outbox[worker]))
+            self.outbox[worker] = []
+
+    def set_tool(self, tool, profile):
+        # Queue 在背景執行緒才序列化，刀具網格之後會被原地移動，送出複本
+        tool = tool.copy()
+        for w, requests in enumerate(self.requests):
+            self.flush(w)
+            requests.put(('tool', tool, profile))
+
+    def submit(self, bounds, tip, axis, pose, context=None):
+        """
+        送出一步: bounds 為刀具在材料模型座標系的 AABB (lower, upper)，None 表示空切不需移除。
+        pose 為刀具網格到材料模型座標系的轉換 (Tiled Mesh)，context 隨結果一併由 collect 返回。
+        """
+        workers = []
+        if bounds is not None:
+            lower, upper = bounds[0][self.axis], bounds[1][self.axis]
+            hit = np.nonzero((self.bounds[:, 0] <= upper) & (self.bounds[:, 1] >= lower))[0]
+            for w in np.unique(self.owner[hit]):
+                w = int(w)
+                self.outbox[w].append((self.step, [int(r) for r in self.local[hit[self.owner[hit] == w]]], tip, axis, pose))
+                if len(self.outbox[w]) >= self.batch_size:
+                    self.flush(w)
+                workers.append(w)
+        self.pending.append((workers, context))
+        self.step += 1
+
+    def collect(self, max_pending=0):
+        """依步序取回已送出的步直到未完成的步不超過 max_pending。產生: (合併的切削結果或 None, context)"""
+        while len(self.pending) > max_pending:
+            workers, context = self.pending.popleft()
+            removals = []
+            for w in workers:
+                if not self.inbox[w]:
+                    self.flush(w)
+                    self.inbox[w].extend(self.results[w].get())
+                removals.extend(self.inbox[w].popleft())
+            yield merge_removals(removals), context
+
+    def finish(self):
+        """結束工作程序並取回各區域的材料模型 (未取回的步直接捨棄)"""
+        if self._region_stocks is not None:
+            return
+        for _ in self.collect(0):
+            pass
+        self._region_stocks = []
+        for requests, results, process in zip(self.requests, self.results, self.processes):
+            requests.put(('finish',))
+            stocks, steps = results.get()
+            self._region_stocks.extend(zip(stocks, steps))
+            process.join()
+
+    def region_stocks(self):
+        self.finish()
+        return self._region_stocks
+
+    def to_trimesh(self):
+        meshes = [stock.to_trimesh() for stock, _ in self.region_stocks()]
+        meshes = [mesh for mesh in meshes if len(mesh.faces)]
+        if len(meshes) < 2:
+            return meshes[0] if meshes else trimesh.Trimesh()
+        try:
+            return boolean_manifold(meshes, operation='union', check_volume=False)
+        except Exception as e:
+            print(f"Region union failed ({e}), exporting concatenated regions.")
+            return trimesh.util.concatenate(meshes)
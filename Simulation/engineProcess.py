@@ -0,0 +1,590 @@
+import os
+import sys
+import queue
+import atexit
+import threading
+import traceback
+import multiprocessing
+from multiprocessing import shared_memory, resource_tracker
+import numpy as np
+import trimesh
+from progressReporter import as_progress
+
+ROW_COLUMNS = 11            # cutting parameters 每列的欄數
+SOURCES = ('final', 'preview')
+_attach_lock = threading.Lock()
+
+
+def attach_shared_memory(name):
+    """
+    主程序附加到子程序建立的共享記憶體區塊。區塊由子程序建立與 unlink，附加端不登記到 resource tracker
+    (Python 3.13 起以 track=False；之前的版本附加時也會登記，暫時停用登記)，
+    避免 resource tracker 警告或 unlink 不屬於主程序的區塊。
+    """
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    with _attach_lock:
+        register = resource_tracker.register
+        resource_tracker.register = lambda name, rtype: None
+        try:
+            return shared_memory.SharedMemory(name=name)
+        finally:
+            resource_tracker.register = register
+
+
+def frame_snapshot(frames):
+    """
+    模擬中的動畫紀錄在此刻的複本，供另一執行緒讀取 (模擬執行緒仍在記錄新的幀)。
+    刀具的列表直接複製；平行模式的紀錄 (DomainFrames) 在工作程序中，模擬結束前無法讀取，返回 None
+    """
+    if hasattr(frames, 'snapshot'):
+        return frames.snapshot()
+    if type(frames) is list:
+        return list(frames)
+    return None
+
+
+class SharedRowWriter:
+    """
+    子程序端: cutting parameters 逐列寫入共享記憶體區塊 (float64，每列 ROW_COLUMNS 欄)，不經序列化。
+    區塊寫滿時再配置一塊 (總容量加倍)，區塊名稱以 ('rows', source, name, start, capacity) 通知主程序；
+    資料寫完後才更新 counts 中的列數，主程序只讀取已寫完的列。
+    counts: [各 source 的列數..., 各 source 可讀取的動畫幀數...]
+    """
+    def __init__(self, source, events, counts):
+        self.source = source
+        self.events = events
+        self.counts = counts
+        self.index = SOURCES.index(source)
+        self.blocks = []    # [(start, capacity, SharedMemory), ...]
+        self.count = 0
+        self.counts[self.index] = 0
+        self.counts[len(SOURCES) + self.index] = 0
+
+    def append(self, rows, frames=None):
+        rows = np.asarray(rows, dtype=np.float64).reshape(-1, ROW_COLUMNS)
+        written = 0
+        while written < len(rows):
+            if not self.blocks or self.count >= self.blocks[-1][0] + self.blocks[-1][1]:
+                self.allocate()
+            start, capacity, block = self.blocks[-1]
+            n = min(len(rows) - written, start + capacity - self.count)
+            array = np.ndarray((capacity, ROW_COLUMNS), dtype=np.float64, buffer=block.buf)
+            array[self.count - start:self.count - start + n] = rows[written:written + n]
+            del array
+            written += n
+            self.count += n
+        self.counts[self.index] = self.count
+        if frames is not None:
+            self.counts[len(SOURCES) + self.index] = frames
+
+    def allocate(self):
+        capacity = max(4096, self.count)
+        block = shared_memory.SharedMemory(create=True, size=capacity * ROW_COLUMNS * 8)
+        self.blocks.append((self.count, capacity, block))
+        self.events.put(('rows', self.source, block.name, self.count, capacity))
+
+    def release(self):
+        for _, _, block in self.blocks:
+            block.close()
+            block.unlink()
+        self.blocks = []
+
+
+class SharedRowReader:
+    """主程序端: 依 SharedRowWriter 通知的區塊讀取已寫完的列 (複製出來，不持有共享記憶體的參考)"""
+    def __init__(self):
+        self.blocks = []
+
+    def attach(self, name, start, capacity):
+        self.blocks.append((start, capacity, attach_shared_memory(name)))
+
+    def available(self, count):
+        """count 列中已知區塊涵蓋的列數 (新區塊的通知可能晚於列數更新)"""
+        if not self.blocks:
+            return 0
+        start, capacity, _ = self.blocks[-1]
+        return min(count, start + capacity)
+
+    def read(self, count, first=0):
+        """讀取第 first 列到第 count 列 (不含)"""
+        count = self.available(count)
+        parts = []
+        for start, capacity, block in self.blocks:
+            lower, upper = max(first, start), min(count, start + capacity)
+            if lower < upper:
+                array = np.ndarray((capacity, ROW_COLUMNS), dtype=np.float64, buffer=block.buf)
+                parts.append(array[lower - start:upper - start].copy())
+                del array
+        return np.concatenate(parts) if parts else np.zeros((0, ROW_COLUMNS))
+
+    def close(self):
+        for _, _, block in self.blocks:
+            block.close()
+        self.blocks = []
+
+
+class ResultChannel:
+    """
+    模擬結果的雙緩衝通道 (模擬端 -> 介面)。模擬端以 append 把新完成的 cutting parameters 列放入後緩衝，
+    介面以 take 交換前後緩衝一次取走累積的列，兩端只在交換時短暫持有鎖，模擬端不等待介面繪圖。
+    後緩衝由空變為非空時呼叫 notify 一次 (例如發出 Qt 訊號)，介面取走之前不重複通知。
+    count 為已送入的總列數，frames 為目前可讀取的動畫幀數。
+    """
+    def __init__(self, notify=None):
+        self.notify = notify
+        self._lock = threading.Lock()
+        self._back = []
+        self._front = []
+        self.count = 0
+        self.frames = 0
+
+    def reset(self):
+        with self._lock:
+            self._back = []
+            self.count = 0
+            self.frames = 0
+
+    def append(self, rows, frames=None):
+        rows = np.asarray(rows, dtype=np.float64).reshape(-1, ROW_COLUMNS)
+        with self._lock:
+            notify = not self._back
+            self._back.append(rows)
+            self.count += len(rows)
+            if frames is not None:
+                self.frames = frames
+        if notify and self.notify is not None:
+            self.notify()
+
+    def take(self):
+        """取走目前累積的列 (N, ROW_COLUMNS)，沒有新的列時為空陣列"""
+        with self._lock:
+            self._front, self._back = self._back, self._front
+        rows = np.concatenate(self._front) if self._front else np.zeros((0, ROW_COLUMNS))
+        self._front.clear()
+        return rows
+
+
+class RowPublisher(threading.Thread):
+    """
+    每 interval 秒把模擬中 SimpleCam 新增的 cutting parameters (逐段的列表或完成後的陣列) 交給 writer
+    (SharedRowWriter 或 ResultChannel)，同時附上已有 cutting parameters 的動畫幀數。
+    """
+    def __init__(self, cam, writer, interval=0.2):
+        super().__init__(name='row-publisher', daemon=True)
+        self.cam = cam
+        self.writer = writer
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.start()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.publish()
+
+    def publish(self, running=True):
+        # 動畫幀在列之前記錄 (管線模式的列較晚寫入)，先取幀數；模擬中無法讀取的紀錄 (平行模式) 不送出幀數
+        workpiece_frames = self.cam.workpiece_for_anime
+        frames = min(len(workpiece_frames), len(self.cam.tool_for_anime))
+        if running and not (hasattr(workpiece_frames, 'snapshot') or type(workpiece_frames) is list):
+            frames = 0
+        parameters = self.cam.cutting_parameters
+        published = self.writer.count
+        if isinstance(parameters, np.ndarray):
+            rows = parameters[published:]
+        else:
+            rows, offset = [], 0
+            for chunk in list(parameters):
+                n = len(chunk)  # 模擬中的段仍在增加，以此刻的長度為準
+                if offset + n > published:
+                    rows.extend(chunk[max(published - offset, 0):n])
+                offset += n
+        if len(rows):
+            self.writer.append(rows, min(frames, published + len(rows)))
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+        self.publish(running=False)
+
+
+class SharedProgress:
+    """子程序端的進度: setValue 寫入共享的整數 (0-1000)，顯示文字由主程序產生"""
+    def __init__(self, shared):
+        self.shared = shared
+
+    def setValue(self, value):
+        self.shared.value = value
+
+    def setFormat(self, text):
+        pass
+
+    def value(self):
+        return self.shared.value
+
+
+class EngineServer:
+    """
+    子程序中的模擬引擎。主執行緒依序執行模擬 ('run')，另一執行緒處理主程序的要求:
+    ('fetch', source, name, index)         : 把動畫的一幀或工件網格寫入共享記憶體，回覆 ('mesh', 區塊名稱, 頂點數, 面數)
+    ('pause',) / ('resume',) / ('cancel',) : 執行中模擬的暫停 / 繼續 / 取消
+    ('stop',)                              : 結束子程序
+    SimpleCam 在多次模擬之間保留，增量模擬的快照與上一次的結果都留在子程序中。
+    """
+    def __init__(self, requests, events, replies, progress, counts):
+        from simulate import SimpleCam
+        self.requests = requests
+        self.events = events
+        self.replies = replies
+        self.progress = SharedProgress(progress)
+        self.counts = counts
+        self.cam = SimpleCam()
+        self.sources = {}       # source -> 結果所在的 SimpleCam (預覽或完整模擬)
+        self.writers = {}
+        self.publisher = None
+        self.gcode = None
+        self.mesh_block = None
+        self.running = False    # 模擬執行中，讀取動畫紀錄前要先複製 (frame_snapshot)
+        self.runs = queue.Queue()
+
+    def serve(self):
+        threading.Thread(target=self.listen, name='engine-requests', daemon=True).start()
+        while True:
+            message = self.runs.get()
+            if message is None:
+                break
+            self.running = True
+            try:
+                self.run(*message)
+            finally:
+                self.running = False
+        for writer in self.writers.values():
+            writer.release()
+        if self.mesh_block is not None:
+            self.mesh_block.close()
+            self.mesh_block.unlink()
+
+    def listen(self):
+        parent = multiprocessing.parent_process()
+        while True:
+            try:
+                message = self.requests.get(timeout=1.0)
+            except queue.Empty:
+                if parent is not None and not parent.is_alive():
+                    os._exit(1)  # 主程序已結束 (例如被強制關閉)，不留下孤兒程序
+                continue
+            command = message[0]
+            if command == 'run':
+                self.runs.put(message[1:])
+            elif command == 'fetch':
+                self.fetch(*message[1:])
+            elif command in ('pause', 'resume', 'cancel'):
+                getattr(self.cam.control, command)()
+            elif command == 'stop':
+                self.runs.put(None)
+                return
+
+    def run(self, settings, gcode, gcode_is_altered, progressive):
+        # 上一次的結果主程序已複製完，釋放其共享記憶體
+        for writer in self.writers.values():
+            writer.release()
+        self.writers, self.sources = {}, {}
+        cam = self.cam
+        try:
+            cam.apply_settings(settings)
+            filepath, tool_info = list(settings['Tool'].values())[0]
+            cam.alignment_tool_and_offset(filepath, settings['Workpiece Offset'], tool_info)
+            cam.alignment_workpiece_and_offset(settings['Workpiece'], settings['Workpiece Orientation'])
+            # 子程序有自己的解析結果，G-code 與上次送來的不同時也要重新解析
+            gcode_is_altered = gcode_is_altered or gcode != self.gcode
+            self.gcode = gcode
+            args = (settings['Simulation Mode'], self.progress, settings['Workpiece'], settings['Tool'],
+                    settings['Workpiece Orientation'], settings['Workpiece Offset'], gcode, settings['Controller'],
+                    settings['Tool'], gcode_is_altered)
+            if progressive:
+                cam.calculate_progressive(*args, self.publish_preview)
+            else:
+                self.start_publisher('final', cam)
+                cam.calculate_cutting_volume(*args)
+        except Exception:
+            self.stop_publisher()
+            self.events.put(('error', traceback.format_exc()))
+            return
+        self.stop_publisher()
+        if 'final' not in self.sources:  # 預覽時就取消
+            return
+        self.events.put(('done', len(cam.workpiece_for_anime), len(cam.tool_for_anime), cam.cancelled))
+
+    def start_publisher(self, source, cam):
+        cam.cutting_parameters = []  # 模擬開始前不要送出上一次的結果
+        cam.workpiece_for_anime, cam.tool_for_anime = [], []
+        self.sources[source] = cam
+        self.writers[source] = SharedRowWriter(source, self.events, self.counts)
+        self.publisher = RowPublisher(cam, self.writers[source])
+
+    def stop_publisher(self):
+        if self.publisher is not None:
+            self.publisher.stop()
+            self.publisher = None
+
+    def publish_preview(self, preview):
+        self.sources['preview'] = preview
+        self.writers['preview'] = SharedRowWriter('preview', self.events, self.counts)
+        self.writers['preview'].append(preview.cutting_parameters)
+        self.events.put(('preview', len(preview.workpiece_for_anime), len(preview.tool_for_anime), preview.cancelled))
+        if not preview.cancelled:
+            self.start_publisher('final', self.cam)
+
+    def fetch(self, source, name, index):
+        try:
+            item = getattr(self.sources[source], name)
+            if index is not None and self.running:
+                item = frame_snapshot(item)
+                if item is None:
+                    raise RuntimeError("Animation frames are not available until the simulation finishes")
+            vertices, faces = (item.vertices, item.faces) if index is None else item[index]
+            vertices = np.asarray(vertices, dtype=np.float64).reshape(-1, 3)
+            faces = np.asarray(faces, dtype=np.int64).reshape(-1, 3)
+            size = vertices.nbytes + faces.nbytes
+            if self.mesh_block is None or self.mesh_block.size < size:
+                if self.mesh_block is not None:
+                    self.mesh_block.close()
+                    self.mesh_block.unlink()
+                self.mesh_block = shared_memory.SharedMemory(create=True, size=max(size, 1 << 20))
+            buffer = np.ndarray(size, dtype=np.uint8, buffer=self.mesh_block.buf)
+            buffer[:vertices.nbytes] = vertices.view(np.uint8).ravel()
+            buffer[vertices.nbytes:] = faces.view(np.uint8).ravel()
+            del buffer
+            self.replies.put(('mesh', self.mesh_block.name, len(vertices), len(faces)))
+        except Exception as e:
+            self.replies.put(('error', f"{type(e).__name__}: {e}"))
+
+
+def engine_main(requests, events, replies, progress, counts):
+    EngineServer(requests, events, replies, progress, counts).serve()
+
+
+class RemoteFrames:
+    """
+    主程序端的動畫紀錄，介面與 workpiece_for_anime / tool_for_anime 相同 (len、索引、迭代得到 (vertices, faces))；
+    讀取某一幀時才由子程序經共享記憶體取回。子程序開始下一次模擬後即失效。
+    """
+    def __init__(self, engine, source, name, count):
+        self.engine = engine
+        self.source = source
+        self.name = name
+        self.count = count
+        self.run_id = engine.run_id
+        self._cache_index = None
+        self._cache_mesh = None
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError(index)
+        if self.run_id != self.engine.run_id:
+            raise RuntimeError("Animation frames were replaced by a newer simulation run")
+        if index != self._cache_index:
+            self._cache_mesh = self.engine.fetch(self.source, self.name, index)
+            self._cache_index = index
+        return self._cache_mesh
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
+class EngineProcess:
+    """
+    在子程序 (spawn) 中執行模擬，介面執行緒不與材料移除、NumPy 運算競爭 GIL。
+    cutting parameters 經共享記憶體區塊逐步傳回，動畫幀與工件網格在需要時才經共享記憶體取回；
+    只有設定、G-code 與控制訊息經 Queue 序列化。子程序在多次模擬之間保留 (增量模擬的狀態留在子程序)。
+    """
+    def __init__(self):
+        self.process = None
+        self.run_id = 0
+        self.readers = {}
+        self.mesh_block = None
+        self.lock = threading.Lock()
+        self.exit_handler = None
+
+    def start(self):
+        if self.process is not None and self.process.is_alive():
+            return
+        context = multiprocessing.get_context('spawn')
+        self.requests, self.events, self.replies = context.Queue(), context.Queue(), context.Queue()
+        self.progress = context.Value('i', 0, lock=False)
+        self.counts = context.Array('q', 2 * len(SOURCES), lock=False)
+        # 平行模式由子程序再建立工作程序，子程序不可為 daemon；結束程式時由 close 結束
+        self.process = context.Process(target=engine_main, name='simulation-engine',
+                                       args=(self.requests, self.events, self.replies, self.progress, self.counts))
+        self.process.start()
+        if self.exit_handler is None:
+            self.exit_handler = self.close
+            atexit.register(self.exit_handler)
+
+    def calculate(self, cnc, settings, progress, gcode, gcode_is_altered, on_preview=None, channel=None):
+        """
+        以設定字典 (SimulationWidget.settings) 在子程序中模擬，完成 (或取消) 後結果放入 cnc:
+        cutting_parameters、workpiece、workpiece_for_anime / tool_for_anime (RemoteFrames)、cancelled。
+        cnc.control 的暫停 / 取消轉送到子程序。on_preview 不為 None 時為漸進模擬，預覽的結果放在 cnc 的複本傳給 on_preview。
+        channel (ResultChannel，漸進模擬時不使用): 模擬中新完成的列即時送入，cnc 的 cutting_parameters 與動畫紀錄也隨之增加。
+        返回值同 calculate_cutting_volume (失敗時印出子程序的例外並返回 False)
+        """
+        progress = as_progress(progress)
+        self.start()
+        self.run_id += 1
+        for reader in self.readers.values():
+            reader.close()
+        self.readers = {source: SharedRowReader() for source in SOURCES}
+        self.progress.value = 0
+        cnc.control.reset()
+        cnc.cancelled = False
+        self.requests.put(('run', settings, gcode, gcode_is_altered, on_preview is not None))
+        live = channel is not None and on_preview is None
+        published = 0
+        if live:
+            cnc.cutting_parameters = []
+            cnc.workpiece_for_anime = RemoteFrames(self, 'final', 'workpiece_for_anime', 0)
+            cnc.tool_for_anime = RemoteFrames(self, 'final', 'tool_for_anime', 0)
+        forwarded = (False, False)
+        while True:
+            state = (cnc.control.paused, cnc.control.cancelled)
+            if state != forwarded:
+                if state[1]:
+                    self.requests.put(('cancel',))
+                elif state[0] != forwarded[0]:
+                    self.requests.put(('pause',) if state[0] else ('resume',))
+                forwarded = state
+            value = min(self.progress.value, 999)  # 結果放入 cnc 之後才到 1000 (介面以 1000 判斷模擬完成)
+            progress.setValue(value)
+            progress.setFormat(f"{value / 10:.1f} %")
+            if live:
+                published = self.stream(cnc, channel, published)
+            try:
+                event = self.events.get(timeout=0.1)
+            except queue.Empty:
+                if not self.process.is_alive():
+                    print(f"Simulation process exited unexpectedly (exit code {self.process.exitcode}).")
+                    self.process = None
+                    return False
+                continue
+            if event[0] == 'rows':
+                self.readers[event[1]].attach(*event[2:])
+            elif event[0] == 'error':
+                print(f"Simulation failed:\n{event[1]}")
+                return False
+            elif event[0] == 'preview':
+                preview = cnc.preview_model()  # 與 cnc 不共用可變的狀態與控制
+                self.install(preview, 'preview', *event[1:])
+                on_preview(preview)
+                if preview.cancelled:
+                    cnc.cancelled = True
+                    break
+                progress.setValue(0)
+            elif event[0] == 'done':
+                if live:
+                    self.stream(cnc, channel, published)
+                self.install(cnc, 'final', *event[1:])
+                break
+        if cnc.cancelled:
+            progress.setFormat(f"Cancelled ({self.progress.value / 10:.1f} %)")
+            return False
+        progress.setValue(1000)
+        progress.setFormat(f"{1000 / 10:.1f} %")
+        return True
+
+    def stream(self, cnc, channel, published):
+        """
+        完整模擬第 published 列之後新傳回的列加到 cnc.cutting_parameters (逐批的列表) 與 channel，
+        cnc 動畫紀錄的幀數隨之增加。返回: 已傳回的列數
+        """
+        reader = self.readers['final']
+        count = reader.available(self.counts[0])
+        if count <= published:
+            return published
+        rows = reader.read(count, published)
+        frames = min(self.counts[len(SOURCES)], count)
+        cnc.cutting_parameters.append(rows)
+        cnc.workpiece_for_anime.count = cnc.tool_for_anime.count = frames
+        channel.append(rows, frames)
+        return count
+
+    def rows(self, source):
+        """source 目前已傳回的 cutting parameters (N, ROW_COLUMNS)"""
+        return self.readers[source].read(self.counts[SOURCES.index(source)])
+
+    def install(self, cnc, source, frame_count, tool_frame_count, cancelled):
+        """把子程序中 source 的結果放入 cnc (與 calculate_cutting_volume 結束時相同的屬性)"""
+        rows = self.rows(source)
+        cnc.cutting_parameters = rows if len(rows) else []
+        cnc.workpiece = trimesh.Trimesh(*self.fetch(source, 'workpiece'), process=False)
+        cnc.workpiece_for_anime = RemoteFrames(self, source, 'workpiece_for_anime', frame_count)
+        cnc.tool_for_anime = RemoteFrames(self, source, 'tool_for_anime', tool_frame_count)
+        cnc.cancelled = cancelled
+        if len(rows):
+            cnc.initial_CuttingPara_query()
+
+    def fetch(self, source, name, index=None):
+        """由子程序取回 source 的網格: name 為 'workpiece' 或動畫紀錄 ('workpiece_for_anime' / 'tool_for_anime') 的第 index 幀"""
+        with self.lock:
+            self.requests.put(('fetch', source, name, index))
+            while True:
+                try:
+                    reply = self.replies.get(timeout=1.0)
+                    break
+                except queue.Empty:
+                    if self.process is None or not self.process.is_alive():
+                        raise RuntimeError("Simulation process is not running")
+            if reply[0] == 'error':
+                raise (IndexError if 'IndexError' in reply[1] else RuntimeError)(reply[1])
+            _, block_name, vertex_count, face_count = reply
+            if self.mesh_block is None or self.mesh_block.name != block_name:
+                if self.mesh_block is not None:
+                    self.mesh_block.close()
+                self.mesh_block = attach_shared_memory(block_name)
+            vertices = np.ndarray((vertex_count, 3), dtype=np.float64, buffer=self.mesh_block.buf).copy()
+            faces = np.ndarray((face_count, 3), dtype=np.int64, buffer=self.mesh_block.buf,
+                               offset=vertex_count * 3 * 8).copy()
+        return vertices, faces
+
+    def close(self):
+        """結束子程序並釋放共享記憶體"""
+        if self.process is not None and self.process.is_alive():
+            self.requests.put(('stop',))
+            self.process.join(5)
+            if self.process.is_alive():
+                self.process.terminate()
+        self.process = None
+        for reader in self.readers.values():
+            reader.close()
+        self.readers = {}
+        if self.mesh_block is not None:
+            self.mesh_block.close()
+            self.mesh_block = None
+        if self.exit_handler is not None:
+            atexit.unregister(self.exit_handler)
+            self.exit_handler = None
+
+
+class LocalEngine:
+    """在呼叫端的執行緒中模擬 (不使用子程序)，calculate 的參數與返回值同 EngineProcess.calculate"""
+    def calculate(self, cnc, settings, progress, gcode, gcode_is_altered, on_preview=None, channel=None):
+        args = (settings['Simulation Mode'], progress, settings['Workpiece'], settings['Tool'],
+                settings['Workpiece Orientation'], settings['Workpiece Offset'], gcode, settings['Controller'],
+                settings['Tool'], gcode_is_altered)
+        if on_preview is not None:
+            return cnc.calculate_progressive(*args, on_preview)
+        if channel is None:
+            return cnc.calculate_cutting_volume(*args)
+        cnc.cutting_parameters = []  # 模擬開始前不要送出上一次的結果
+        cnc.workpiece_for_anime, cnc.tool_for_anime = [], []
+        publisher = RowPublisher(cnc, channel)
+        try:
+            return cnc.calculate_cutting_volume(*args)
+        finally:
+            publisher.stop()
@@ -562,6 +562,7 @@ class GcodeParser:
         x = y = z = c = a = 0.0
         is_absolute = True
         current_motion_mode = 'G0'
+        current_plane = 'G17'
         self.feed = 0
         self.spindle_speed = 0
         total_lines = len(gcode)
@@ -621,6 +622,10 @@ class GcodeParser:
                 current_motion_mode = f'G{motion_match.group(1)}'
                 # print(f"運動模式: {current_motion_mode}")
 
+            plane_match = re.search(r'\bG(17|18|19)\b', clean_line_no_n)
+            if plane_match:
+                current_plane = f'G{plane_match.group(1)}'
+
             self.parse_feed_spindle(clean_line_no_n)
 
             if 'M98' in clean_line_no_n and self.controller_type == 'Fanuc':
@@ -650,6 +655,7 @@ class GcodeParser:
                     'feed': self.feed,
                     'spindle_speed': self.spindle_speed,
                     'arc_params': arc_params,
+                    'plane': current_plane,
                     'current_tool': self.current_tool
                 }
                 self.cut_paths.append(path_info)
@@ -0,0 +1,279 @@
+import numpy as np
+import trimesh
+from trimesh.boolean import boolean_manifold
+from manifold3d import Manifold, Mesh, Mesh64, OpType
+from stockEngine import remesh_region
+
+
+def to_manifold(mesh):
+    return Manifold(mesh=Mesh(vert_properties=np.array(mesh.vertices, dtype=np.float32),
+                              tri_verts=np.array(mesh.faces, dtype=np.uint32)))
+
+
+def to_trimesh(manifold):
+    mesh = manifold.to_mesh()
+    return trimesh.Trimesh(vertices=mesh.vert_properties[:, :3], faces=mesh.tri_verts, process=False)
+
+
+# Manifold 轉成 Mesh64 後可完整還原的欄位 (含共面合併用的 face_id / run 資訊)
+MESH64_FIELDS = ('vert_properties', 'tri_verts', 'merge_from_vert', 'merge_to_vert', 'run_index', 'run_original_id',
+                 'run_transform', 'run_flags', 'face_id', 'halfedge_tangent')
+
+
+def removal_from_mesh(intersection):
+    return {'volume': intersection.volume, 'centroid': intersection.centroid, 'points': intersection.vertices}
+
+
+class KernelFrames(list):
+    """
+    幾何核心的逐步動畫紀錄：每幀只存工件幾何的參考與該幀工件座標系到機台座標系的轉換，
+    讀取某一幀時才轉成機台座標的 (vertices, faces)，介面與 StockFrames 相同。
+    """
+    def __init__(self, kernel):
+        super().__init__()
+        self.kernel = kernel
+        self._cache_index = None
+        self._cache_mesh = None
+
+    def record(self, transform=None):
+        self.append((self.kernel.geometry(), None if transform is None else np.array(transform, dtype=np.float64)))
+
+    def truncate(self, count, kernel):
+        """只保留前 count 幀，之後的幀改由 kernel (還原到第 count 幀狀態的幾何核心) 繼續記錄。返回自身"""
+        del self[count:]
+        self.kernel = kernel
+        self._cache_index = None
+        self._cache_mesh = None
+        return self
+
+    def snapshot(self):
+        """目前紀錄的複本 (快取獨立)，可在另一執行緒讀取，不受之後的記錄或 truncate 影響"""
+        frames = KernelFrames(self.kernel)
+        frames.extend(list.copy(self))
+        return frames
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if index != self._cache_index:
+            geometry, transform = super().__getitem__(index)
+            vertices, faces = self.kernel.geometry_arrays(geometry)
+            if transform is not None:
+                vertices = trimesh.transformations.transform_points(vertices, transform)
+            self._cache_mesh = (vertices, faces)
+            self._cache_index = index
+        return self._cache_mesh
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def nbytes(self):
+        """序列化 (結果快取) 後大小的估計，只讀取每個不同工件幾何的頂點與面數，不轉成網格"""
+        sizes = {}
+        for geometry, transform in list.__iter__(self):
+            if id(geometry) not in sizes:
+                vertex_count, face_count = self.kernel.geometry_size(geometry)
+                sizes[id(geometry)] = 24 * (vertex_count + face_count)
+        return sum(sizes.values()) + 128 * len(self)
+
+    def __reduce__(self):
+        # 幾何 (Manifold) 無法直接序列化 (結果快取)：每個不同的工件幾何只轉成一次 (vertices, faces)，還原為 MeshFrames
+        meshes, geometry_index, transforms, seen = [], [], [], {}
+        for geometry, transform in list.__iter__(self):
+            if id(geometry) not in seen:
+                seen[id(geometry)] = len(meshes)
+                vertices, faces = self.kernel.geometry_arrays(geometry)
+                meshes.append((np.asarray(vertices, dtype=np.float64), np.asarray(faces, dtype=np.int64)))
+            geometry_index.append(seen[id(geometry)])
+            transforms.append(transform)
+        return MeshFrames, (meshes, geometry_index, transforms)
+
+
+class MeshFrames:
+    """
+    已轉成網格的動畫紀錄 (由結果快取還原的 KernelFrames)：不同的工件幾何各存一份 (vertices, faces)，
+    每幀存幾何的索引與轉換，介面與 KernelFrames 相同。
+    """
+    def __init__(self, meshes, geometry_index, transforms):
+        self.meshes = meshes
+        self.geometry_index = geometry_index
+        self.transforms = transforms
+
+    def __len__(self):
+        return len(self.geometry_index)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        vertices, faces = self.meshes[self.geometry_index[index]]
+        if self.transforms[index] is not None:
+            vertices = trimesh.transformations.transform_points(vertices, self.transforms[index])
+        return vertices, faces
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
+class TrimeshKernel:
+    """
+    網格引擎的幾何核心 (trimesh)：工件為 trimesh，每次布林運算經 boolean_manifold 轉換一次，
+    布林運算後以 remesh_region 在刀具範圍內做局部簡化。
+    工件固定在自己的座標系，刀具以基準網格 + 4x4 姿態矩陣 (工件座標系) 表示。
+    """
+    def __init__(self, workpiece, remesh_tolerance=0.0):
+        self.workpiece = workpiece.copy()
+        self.remesh_tolerance = remesh_tolerance
+        self.tool = None
+        self.frames = KernelFrames(self)
+
+    def set_tool(self, tool):
+        self.tool = tool.copy()
+
+    def tool_at(self, pose):
+        return trimesh.Trimesh(vertices=trimesh.transformations.transform_points(self.tool.vertices, pose),
+                               faces=self.tool.faces, process=False)
+
+    def remesh(self, bounds):
+        if self.remesh_tolerance > 0:
+            self.workpiece = remesh_region(self.workpiece, np.asarray(bounds[0]) - 1e-3, np.asarray(bounds[1]) + 1e-3,
+                                           self.remesh_tolerance)
+
+    def cut(self, pose):
+        """刀具在 pose 的單步切削。返回: None 或 dict: volume, centroid, points"""
+        tool = self.tool_at(pose)
+        intersection = boolean_manifold([self.workpiece, tool], operation='intersection', check_volume=False)
+        if intersection.is_empty:
+            return None
+        self.workpiece = boolean_manifold([self.workpiece, tool], operation='difference', check_volume=False)
+        self.remesh(tool.bounds)
+        return removal_from_mesh(intersection)
+
+    def sweep(self, poses, epsilon=1e-6):
+        """
+        掃掠體積模式：以相鄰兩刀具姿態的凸包聯集作為整批步數的掃掠體積，工件只做一次差集；
+        每一步的切削區域由裁切到此批範圍的局部工件與各步刀具依序交集求得。刀具視為凸體。
+        poses: 此批第一步之前的姿態 + 每一步的姿態
+        返回: 每一步 (poses[1:]) 的切削區域 (未切到為 None)
+        """
+        tools = [self.tool_at(pose) for pose in poses]
+        lower = np.min([tool.bounds[0] for tool in tools], axis=0) - 1.0
+        upper = np.max([tool.bounds[1] for tool in tools], axis=0) + 1.0
+        box = trimesh.creation.box(bounds=[lower, upper])
+        local = boolean_manifold([self.workpiece, box], operation='intersection', check_volume=False)
+        removals = [None] * (len(poses) - 1)
+        if local.is_empty:
+            return removals
+
+        for j, tool in enumerate(tools[1:]):
+            intersection = boolean_manifold([local, tool], operation='intersection', check_volume=False)
+            if intersection.is_empty or intersection.volume < epsilon:  # 只貼著表面不算切削
+                continue
+            local = boolean_manifold([local, tool], operation='difference', check_volume=False)
+            removals[j] = removal_from_mesh(intersection)
+
+        if any(removal is not None for removal in removals):
+            hulls = [trimesh.convex.convex_hull(np.vstack((a.vertices, b.vertices))) for a, b in zip(tools[:-1], tools[1:])]
+            self.workpiece = boolean_manifold([self.workpiece] + hulls, operation='difference', check_volume=False)
+            self.remesh([lower, upper])
+        return removals
+
+    def geometry(self):
+        # 布林運算與簡化都產生新的網格，不會就地修改，動畫紀錄只需保存參考
+        return self.workpiece
+
+    def geometry_arrays(self, geometry):
+        return geometry.vertices, geometry.faces
+
+    def geometry_size(self, geometry):
+        return len(geometry.vertices), len(geometry.faces)
+
+    def to_trimesh(self):
+        return self.workpiece.copy()
+
+
+class ManifoldKernel(TrimeshKernel):
+    """
+    網格引擎的幾何核心 (manifold3d)：整個模擬期間工件與刀具都保持為 Manifold 物件，
+    刀具移動以 Manifold.transform (延遲套用) 表示，只有切削區域 (小網格)、動畫快照與匯出時才轉成 trimesh。
+    工件簡化改用 manifold3d 原生的 simplify，三角形數比上次簡化後增加 20% 以上時才執行。
+    """
+    def __init__(self, workpiece, remesh_tolerance=0.0):
+        super().__init__(workpiece, remesh_tolerance)
+        self.stock = to_manifold(workpiece)
+        self._simplified_tri = self.stock.num_tri()
+
+    def set_tool(self, tool):
+        self.tool = to_manifold(tool)
+
+    def __getstate__(self):
+        # Manifold 物件無法 pickle (模擬檢查點)，以 Mesh64 的完整欄位與 tolerance 保存，還原後的布林運算結果與原本相同
+        state = self.__dict__.copy()
+        for name in ('stock', 'tool'):
+            if state[name] is not None:
+                mesh = state[name].to_mesh64()
+                state[name] = ({field: np.array(getattr(mesh, field)) for field in MESH64_FIELDS}, state[name].get_tolerance())
+        return state
+
+    def __setstate__(self, state):
+        for name in ('stock', 'tool'):
+            if state[name] is not None:
+                fields, tolerance = state[name]
+                state[name] = Manifold(mesh=Mesh64(**fields)).set_tolerance(tolerance)
+        self.__dict__.update(state)
+
+    def tool_at(self, pose):
+        return self.tool.transform(np.asarray(pose)[:3, :])
+
+    def remesh(self, bounds=None):
+        if self.remesh_tolerance > 0 and self.stock.num_tri() > 1.2 * self._simplified_tri:
+            self.stock = self.stock.simplify(self.remesh_tolerance)
+            self._simplified_tri = self.stock.num_tri()
+
+    def cut(self, pose):
+        tool = self.tool_at(pose)
+        intersection = self.stock ^ tool
+        if intersection.is_empty():
+            return None
+        self.stock = self.stock - tool
+        self.remesh()
+        return removal_from_mesh(to_trimesh(intersection))
+
+    def sweep(self, poses, epsilon=1e-6):
+        tools = [self.tool_at(pose) for pose in poses]
+        boxes = np.array([tool.bounding_box() for tool in tools])
+        lower = boxes[:, :3].min(axis=0) - 1.0
+        upper = boxes[:, 3:].max(axis=0) + 1.0
+        local = self.stock ^ Manifold.cube(upper - lower).translate(lower)
+        removals = [None] * (len(poses) - 1)
+        if local.is_empty():
+            return removals
+
+        for j, tool in enumerate(tools[1:]):
+            intersection = local ^ tool
+            if intersection.is_empty() or intersection.volume() < epsilon:  # 只貼著表面不算切削
+                continue
+            local = local - tool
+            removals[j] = removal_from_mesh(to_trimesh(intersection))
+
+        if any(removal is not None for removal in removals):
+            hulls = [Manifold.batch_hull([a, b]) for a, b in zip(tools[:-1], tools[1:])]
+            self.stock = Manifold.batch_boolean([self.stock] + hulls, OpType.Subtract)
+            self.remesh()
+        return removals
+
+    def geometry(self):
+        return self.stock
+
+    def geometry_arrays(self, geometry):
+        mesh = geometry.to_mesh()
+        return mesh.vert_properties[:, :3].astype(np.float64), mesh.tri_verts.astype(np.int64)
+
+    def geometry_size(self, geometry):
+        return geometry.num_vert(), geometry.num_tri()
+
+    def to_trimesh(self):
+        return to_trimesh(self.stock)
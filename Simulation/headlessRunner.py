@@ -0,0 +1,130 @@
+import argparse
+import os
+import sys
+import time
+import numpy as np
+from projectFile import read_project
+from simulate import SimpleCam
+
+
+def project_gcode(settings):
+    """專案的 G-code (字串或逐行的列表) 轉成 calculate_cutting_volume 使用的逐行列表"""
+    gcode = settings.get('Gcode', '')
+    if not isinstance(gcode, str):
+        gcode = '\n'.join(line.rstrip('\r\n') for line in gcode)
+    return gcode.strip().split('\n')
+
+
+def check_project(settings):
+    """與 SimulationWidget.check_filePath 相同的檢查，缺少模擬所需的設定時拋出 ValueError"""
+    if not settings.get('Workpiece') or not os.path.exists(settings['Workpiece']):
+        raise ValueError(f"Workpiece file not found: {settings.get('Workpiece')!r}")
+    if not settings.get('Tool'):
+        raise ValueError("No tool in project")
+    for tool_id, (filepath, _) in settings['Tool'].items():
+        if filepath and not os.path.exists(filepath):
+            raise ValueError(f"Tool file for {tool_id} not found: {filepath!r}")
+    if not any(line.strip() for line in project_gcode(settings)):
+        raise ValueError("No G-code in project")
+    if not settings.get('Controller'):
+        raise ValueError("No controller selected in project")
+
+
+def run_settings(settings, progress=None, output_dir=None):
+    """
+    不需要介面，以設定字典 (SimulationWidget.settings) 執行一次模擬，流程與模擬按鈕相同。
+    progress: 回呼 progress(fraction) (0.0-1.0)、有 setValue / setFormat 的物件或 None
+    output_dir: 結果 (TemporarySaved/3d_model、TemporarySaved/data) 的根目錄，預設為程式所在資料夾
+    返回: 模擬完成的 SimpleCam (cutting_parameters、workpiece、workpiece_for_anime 等)
+    """
+    check_project(settings)
+    cnc = SimpleCam()
+    if output_dir:
+        cnc.base_path = output_dir
+    cnc.apply_settings(settings)
+    filepath, tool_info = list(settings['Tool'].values())[0]
+    cnc.alignment_tool_and_offset(filepath, settings['Workpiece Offset'], tool_info)
+    cnc.alignment_workpiece_and_offset(settings['Workpiece'], settings['Workpiece Orientation'])
+    cnc.calculate_cutting_volume(settings['Simulation Mode'], progress, settings['Workpiece'], settings['Tool'],
+                                 settings['Workpiece Orientation'], settings['Workpiece Offset'], project_gcode(settings),
+                                 settings['Controller'], settings['Tool'], True)
+    return cnc
+
+
+def run_project(project_path, progress=None, output_dir=None):
+    """讀取專案檔 (.camproj) 並執行模擬，參數與返回值同 run_settings"""
+    return run_settings(read_project(project_path), progress, output_dir)
+
+
+def progress_printer():
+    """每進 1% 在 stderr 更新一次進度的回呼"""
+    last = [-1]
+
+    def report(fraction):
+        percent = int(fraction * 100)
+        if percent != last[0]:
+            last[0] = percent
+            print(f"\r{percent:3d} %", end='', file=sys.stderr, flush=True)
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m simulate', description='Headless CNC cutting simulation.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    run_parser = commands.add_parser('run', help='simulate a .camproj project and write the results')
+    run_parser.add_argument('project', help='project file (.camproj)')
+    run_parser.add_argument('-o', '--output', help='result directory (default: the Simulation folder)')
+    run_parser.add_argument('-q', '--quiet', action='store_true', help='do not print progress')
+    batch_parser = commands.add_parser('batch', help='simulate many projects (or G-code files) on a process pool')
+    batch_parser.add_argument('inputs', nargs='+', help='project files, or G-code files when --setup is given')
+    batch_parser.add_argument('--setup', help='project whose workpiece, tools and settings are shared by the G-code files')
+    batch_parser.add_argument('-o', '--output', default='batch_results', help='result directory (default: batch_results)')
+    batch_parser.add_argument('-j', '--jobs', type=int, default=None, help='parallel jobs (default: CPU count)')
+    batch_parser.add_argument('--cpu', type=float, default=0, help='CPU time limit per job in seconds (0: no limit)')
+    batch_parser.add_argument('--memory', type=float, default=0, help='memory limit per job in MB (0: no limit)')
+    serve_parser = commands.add_parser('serve', help='run the local simulation job service (HTTP on 127.0.0.1)')
+    serve_parser.add_argument('--port', type=int, default=8002, help='port (default: 8002)')
+    serve_parser.add_argument('-o', '--output', default='job_results', help='job database and results (default: job_results)')
+    serve_parser.add_argument('-j', '--jobs', type=int, default=1, help='parallel jobs (default: 1)')
+    serve_parser.add_argument('--cpu', type=float, default=0, help='CPU time limit per job in seconds (0: no limit)')
+    serve_parser.add_argument('--memory', type=float, default=0, help='memory limit per job in MB (0: no limit)')
+    args = parser.parse_args(argv)
+    if args.command == 'batch':
+        return main_batch(args)
+    if args.command == 'serve':
+        from jobService import serve  # jobService 匯入本模組，在此才匯入
+        serve(args.port, args.output, args.jobs, args.cpu, args.memory)
+        return 0
+
+    start = time.time()
+    try:
+        cnc = run_project(args.project, None if args.quiet else progress_printer(), args.output)
+    except (OSError, ValueError) as e:
+        print(f"Simulation failed: {e}", file=sys.stderr)
+        return 1
+    if not args.quiet:
+        print(file=sys.stderr)
+    cutting_parameters = np.asarray(cnc.cutting_parameters)
+    result_dir = os.path.join(cnc.base_path, "TemporarySaved")
+    print(f"Steps: {len(cutting_parameters)}")
+    if len(cutting_parameters):
+        print(f"Cycle time: {cutting_parameters[-1, 9]:.2f} s")
+        print(f"Peak force: {cutting_parameters[:, 10].max():.2f}")
+    print(f"Results: {os.path.join(result_dir, 'data', 'all_cutting_parameters.csv')}, "
+          f"{os.path.join(result_dir, '3d_model', 'cutted_workpiece.stl')}")
+    print(f"Elapsed: {time.time() - start:.1f} s")
+    return 0
+
+
+def main_batch(args):
+    from batchRunner import project_jobs, gcode_jobs, run_batch  # batchRunner 匯入本模組，在此才匯入
+    try:
+        jobs = gcode_jobs(args.setup, args.inputs) if args.setup else project_jobs(args.inputs)
+    except (OSError, ValueError) as e:
+        print(f"Batch failed: {e}", file=sys.stderr)
+        return 1
+    summary = run_batch(jobs, args.output, args.jobs, args.cpu, args.memory,
+                        on_result=lambda row: print(f"{row['Job']}: {row['Status']} {row['Error']}", file=sys.stderr))
+    print(summary.to_string(index=False))
+    print(f"Summary: {os.path.join(args.output, 'batch_summary.csv')}")
+    return 0 if (summary['Status'] == 'ok').all() else 1
@@ -0,0 +1,284 @@
+import json
+import multiprocessing
+import os
+import queue
+import re
+import sqlite3
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from headlessRunner import run_settings
+from batchRunner import apply_limits, summarize, exit_reason, worker_settings
+
+RESULT_FILES = {  # 可下載的結果 -> TemporarySaved 下的相對路徑
+    'all_cutting_parameters.csv': ('data', 'all_cutting_parameters.csv'),
+    'cutted_workpiece.stl': ('3d_model', 'cutted_workpiece.stl'),
+}
+FINISHED = ('done', 'failed', 'cancelled')
+
+
+class JobQueue:
+    """
+    SQLite 的持久工作佇列，服務重新啟動後未完成的工作仍在。
+    狀態: queued -> running -> done / failed / cancelled；每次操作各自開一個連線，可在多個執行緒中使用。
+    """
+    def __init__(self, path):
+        self.path = path
+        with self.connect() as db:
+            db.execute("""CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT, status TEXT NOT NULL, settings TEXT NOT NULL,
+                progress REAL DEFAULT 0, submitted REAL, started REAL, finished REAL,
+                summary TEXT, error TEXT, cancel INTEGER DEFAULT 0)""")
+            # 上次服務結束時執行中的工作重新排入佇列
+            db.execute("UPDATE jobs SET status = 'queued', progress = 0 WHERE status = 'running'")
+
+    def connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def submit(self, name, settings):
+        with self.connect() as db:
+            cursor = db.execute("INSERT INTO jobs (name, status, settings, submitted) VALUES (?, 'queued', ?, ?)",
+                                (name, json.dumps(settings), time.time()))
+            return cursor.lastrowid
+
+    def claim(self):
+        """取出最早排入的工作並標記為執行中。返回: (id, 設定字典)，沒有工作時返回 None"""
+        with self.connect() as db:
+            db.execute("BEGIN IMMEDIATE")
+            row = db.execute("SELECT id, settings FROM jobs WHERE status = 'queued' ORDER BY id LIMIT 1").fetchone()
+            if row is None:
+                return None
+            db.execute("UPDATE jobs SET status = 'running', started = ? WHERE id = ?", (time.time(), row[0]))
+            return row[0], json.loads(row[1])
+
+    def set_progress(self, job_id, progress):
+        with self.connect() as db:
+            db.execute("UPDATE jobs SET progress = ? WHERE id = ? AND status = 'running'", (progress, job_id))
+
+    def finish(self, job_id, status, summary=None, error=None):
+        with self.connect() as db:
+            db.execute("UPDATE jobs SET status = ?, finished = ?, summary = ?, error = ?, progress = CASE WHEN ? = 'done' "
+                       "THEN 1 ELSE progress END WHERE id = ? AND status = 'running'",
+                       (status, time.time(), json.dumps(summary) if summary else None, error, status, job_id))
+
+    def cancel(self, job_id):
+        """排隊中的工作直接取消，執行中的工作標記後由服務結束其程序。返回: 是否有此工作"""
+        with self.connect() as db:
+            db.execute("UPDATE jobs SET status = 'cancelled', finished = ? WHERE id = ? AND status = 'queued'",
+                       (time.time(), job_id))
+            cursor = db.execute("UPDATE jobs SET cancel = 1 WHERE id = ?", (job_id,))
+            return cursor.rowcount > 0
+
+    def cancel_requested(self):
+        with self.connect() as db:
+            return {row[0] for row in db.execute("SELECT id FROM jobs WHERE status = 'running' AND cancel = 1")}
+
+    def get(self, job_id):
+        with self.connect() as db:
+            db.row_factory = sqlite3.Row
+            row = db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return None if row is None else self.job_dict(row)
+
+    def list(self):
+        with self.connect() as db:
+            db.row_factory = sqlite3.Row
+            return [self.job_dict(row) for row in db.execute("SELECT * FROM jobs ORDER BY id")]
+
+    @staticmethod
+    def job_dict(row):
+        job = {key: row[key] for key in ('id', 'name', 'status', 'progress', 'submitted', 'started', 'finished', 'error')}
+        job['summary'] = json.loads(row['summary']) if row['summary'] else None
+        return job
+
+
+def service_worker(job_id, settings, output_dir, cpu_seconds, memory_mb, messages):
+    """工作程序: 模擬一個工作，每進 1% 回報一次進度，最後回報摘要或錯誤訊息"""
+    apply_limits(cpu_seconds, memory_mb)
+    last = [-1]
+
+    def report(fraction):
+        percent = int(fraction * 100)
+        if percent != last[0]:
+            last[0] = percent
+            messages.put(('progress', job_id, fraction))
+    try:
+        os.makedirs(output_dir, exist_ok=True)
+        messages.put(('done', job_id, summarize(run_settings(worker_settings(settings), report, output_dir)), None))
+    except MemoryError:
+        messages.put(('done', job_id, None, 'memory limit exceeded'))
+    except Exception as e:
+        messages.put(('done', job_id, None, f"{type(e).__name__}: {e}"))
+
+
+class JobService:
+    """
+    本機模擬工作服務: JobQueue + 最多 workers 個工作程序 (每個工作一個新程序，套用與批次模擬相同的資源限制)。
+    dispatch 執行緒負責取出工作、收集進度與結果、結束被取消的工作；結果在 output_root/<工作 id>/TemporarySaved。
+    """
+    def __init__(self, output_root, workers=1, cpu_seconds=0, memory_mb=0, db_path=None):
+        os.makedirs(output_root, exist_ok=True)
+        self.output_root = output_root
+        self.workers = workers
+        self.cpu_seconds = cpu_seconds
+        self.memory_mb = memory_mb
+        self.queue = JobQueue(db_path or os.path.join(output_root, 'jobs.sqlite'))
+        self.context = multiprocessing.get_context('spawn')
+        self.messages = self.context.Queue()
+        self.running = {}   # 工作 id -> 程序
+        self.stopped = threading.Event()
+        self.dispatcher = threading.Thread(target=self.dispatch, name='job-dispatcher', daemon=True)
+        self.dispatcher.start()
+
+    def result_path(self, job_id, filename):
+        return os.path.join(self.output_root, str(job_id), 'TemporarySaved', *RESULT_FILES[filename])
+
+    def handle(self, message):
+        if message[0] == 'progress':
+            self.queue.set_progress(message[1], message[2])
+            return
+        _, job_id, summary, error = message
+        process = self.running.pop(job_id, None)
+        if process is not None:
+            process.join()
+            self.queue.finish(job_id, 'failed' if error else 'done', summary, error)
+
+    def dispatch(self):
+        while not self.stopped.is_set():
+            while len(self.running) < self.workers:
+                job = self.queue.claim()
+                if job is None:
+                    break
+                job_id, settings = job
+                process = self.context.Process(target=service_worker, daemon=True,
+                                               args=(job_id, settings, os.path.join(self.output_root, str(job_id)),
+                                                     self.cpu_seconds, self.memory_mb, self.messages))
+                process.start()
+                self.running[job_id] = process
+            try:
+                self.handle(self.messages.get(timeout=0.5))
+                while True:
+                    self.handle(self.messages.get_nowait())
+            except queue.Empty:
+                pass
+            for job_id in self.queue.cancel_requested() & set(self.running):
+                process = self.running.pop(job_id)
+                process.terminate()
+                process.join()
+                self.queue.finish(job_id, 'cancelled')
+            for job_id, process in list(self.running.items()):
+                if not process.is_alive():
+                    try:  # 程序結束前放入的結果可能還在佇列中
+                        while job_id in self.running:
+                            self.handle(self.messages.get(timeout=0.1))
+                    except queue.Empty:
+                        self.running.pop(job_id)
+                        self.queue.finish(job_id, 'failed', error=exit_reason(process.exitcode))
+
+    def stop(self):
+        """停止取出新工作並結束執行中的工作程序 (這些工作下次啟動時重新排入佇列)"""
+        self.stopped.set()
+        self.dispatcher.join()
+        for process in self.running.values():
+            process.terminate()
+            process.join()
+
+
+class JobRequestHandler(BaseHTTPRequestHandler):
+    """
+    POST /jobs                  送出工作 (JSON: 專案檔內容 {"settings": {...}}，可加 "name")，返回 {"id": ...}
+    GET  /jobs                  所有工作
+    GET  /jobs/<id>             工作狀態、進度、摘要與錯誤訊息
+    GET  /jobs/<id>/progress    {"status": ..., "progress": 0.0-1.0}
+    POST /jobs/<id>/cancel      取消工作 (DELETE /jobs/<id> 亦同)
+    GET  /jobs/<id>/results/<all_cutting_parameters.csv | cutted_workpiece.stl>  下載結果
+    """
+    def send_json(self, data, status=200):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def job_or_404(self, job_id):
+        job_id = int(job_id)
+        # SQLite 的 INTEGER 為 64 位元，超出範圍的 id 不可能存在
+        job = self.server.service.queue.get(job_id) if job_id < 2 ** 63 else None
+        if job is None:
+            self.send_json({'error': f'job {job_id} not found'}, 404)
+        return job
+
+    def do_GET(self):
+        service = self.server.service
+        if self.path == '/jobs':
+            return self.send_json(service.queue.list())
+        match = re.fullmatch(r'/jobs/(\d+)(/progress|/results/([\w.]+))?', self.path)
+        if match is None:
+            return self.send_json({'error': 'not found'}, 404)
+        job = self.job_or_404(match.group(1))
+        if job is None:
+            return
+        if match.group(2) is None:
+            return self.send_json(job)
+        if match.group(2) == '/progress':
+            return self.send_json({'status': job['status'], 'progress': job['progress']})
+        filename = match.group(3)
+        if filename not in RESULT_FILES or job['status'] != 'done':
+            return self.send_json({'error': f'result {filename} not available'}, 404)
+        try:
+            with open(service.result_path(job['id'], filename), 'rb') as f:
+                body = f.read()
+        except OSError:  # 結果資料夾已被清除或未寫出
+            return self.send_json({'error': f'result {filename} not available'}, 404)
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/csv' if filename.endswith('.csv') else 'application/octet-stream')
+        self.send_header('Content-Disposition', f'attachment; filename="{filename}"')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        if self.path == '/jobs':
+            try:
+                data = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+                settings = data['settings']
+            except (ValueError, KeyError, TypeError):
+                return self.send_json({'error': 'body must be a project JSON with "settings"'}, 400)
+            job_id = self.server.service.queue.submit(data.get('name', ''), settings)
+            return self.send_json({'id': job_id}, 201)
+        match = re.fullmatch(r'/jobs/(\d+)/cancel', self.path)
+        if match is None:
+            return self.send_json({'error': 'not found'}, 404)
+        self.cancel(match.group(1))
+
+    def do_DELETE(self):
+        match = re.fullmatch(r'/jobs/(\d+)', self.path)
+        if match is None:
+            return self.send_json({'error': 'not found'}, 404)
+        self.cancel(match.group(1))
+
+    def cancel(self, job_id):
+        job = self.job_or_404(job_id)
+        if job is None:
+            return
+        if job['status'] not in FINISHED:
+            self.server.service.queue.cancel(job['id'])
+        self.send_json(self.server.service.queue.get(job['id']))
+
+    def log_message(self, format, *args):
+        pass  # 不在主控台逐筆記錄請求
+
+
+def serve(port=8002, output_root='job_results', workers=1, cpu_seconds=0, memory_mb=0):
+    """在 127.0.0.1:port 啟動工作服務 (只接受本機連線)，直到 Ctrl+C"""
+    service = JobService(output_root, workers, cpu_seconds, memory_mb)
+    server = ThreadingHTTPServer(('127.0.0.1', port), JobRequestHandler)
+    server.service = service
+    print(f"Simulation job service on http://127.0.0.1:{port} (results in {os.path.abspath(output_root)})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.stop()
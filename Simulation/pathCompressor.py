@@ -0,0 +1,134 @@
+import numpy as np
+from numpy.linalg import norm
+
+
+def point_segment_distance(points, a, b):
+    """點到線段 a-b 的距離"""
+    ab = b - a
+    length2 = float(ab @ ab)
+    if length2 < 1e-24:
+        return norm(points - a, axis=1)
+    s = np.clip((points - a) @ ab / length2, 0.0, 1.0)
+    return norm(points - (a + s[:, None] * ab), axis=1)
+
+
+def circle_through(p0, p1, p2):
+    """XY 平面上通過三點的圓。返回: center (2,), radius；三點共線時返回 None"""
+    ax, ay = p0[:2]
+    bx, by = p1[:2]
+    cx, cy = p2[:2]
+    d = 2 * (ax * (by - cy) + bx * (cy - ay) + cx * (ay - by))
+    if abs(d) < 1e-12:
+        return None
+    a2, b2, c2 = ax * ax + ay * ay, bx * bx + by * by, cx * cx + cy * cy
+    center = np.array([(a2 * (by - cy) + b2 * (cy - ay) + c2 * (ay - by)) / d,
+                       (a2 * (cx - bx) + b2 * (ax - cx) + c2 * (bx - ax)) / d])
+    return center, norm(p0[:2] - center)
+
+
+def fit_line(points, i, j, tolerance):
+    """points[i..j] 合併為一條直線時，中間點到弦的距離都在公差內"""
+    if j - i < 2:
+        return True
+    return bool(point_segment_distance(points[i + 1:j], points[i], points[j]).max() <= tolerance)
+
+
+def fit_arc(points, i, j, tolerance):
+    """
+    points[i..j] 合併為 G17 圓弧 (可含 Z 方向螺旋)：圓通過首、中、末三點，
+    所有點的徑向誤差、原折線弦的弓高與 Z 對角度的線性誤差都在公差內，且轉向一致、不超過一圈。
+    返回: (center, sweep) 或 None
+    """
+    circle = circle_through(points[i], points[(i + j) // 2], points[j])
+    if circle is None:
+        return None
+    center, radius = circle
+    rel = points[i:j + 1, :2] - center
+    if np.abs(norm(rel, axis=1) - radius).max() > tolerance:
+        return None
+    angles = np.arctan2(rel[:, 1], rel[:, 0])
+    steps = (np.diff(angles) + np.pi) % (2 * np.pi) - np.pi
+    if not (np.all(steps > 0) or np.all(steps < 0)):
+        return None
+    sweep = steps.sum()
+    if abs(sweep) >= 2 * np.pi - 1e-6:
+        return None
+    chord = norm(np.diff(points[i:j + 1, :2], axis=0), axis=1)
+    sagitta = radius - np.sqrt(np.maximum(radius ** 2 - (chord / 2) ** 2, 0.0))
+    if sagitta.max() > tolerance:
+        return None
+    z = points[i:j + 1, 2]
+    z_fit = z[0] + (z[-1] - z[0]) * np.concatenate(([0.0], np.cumsum(steps))) / sweep
+    if np.abs(z - z_fit).max() > tolerance:
+        return None
+    return center, sweep
+
+
+def compress_run(start, run, tolerance, fit_arcs, max_points):
+    """
+    一段連續可合併的 G1 (同進給、轉速、刀具且無 C/A 移動) 貪婪地合併為最長的直線或圓弧。
+    合併後的路徑以 source_lines / source_breaks 記錄原始行號及其在路徑上的結束比例 (依長度)。
+    """
+    points = np.vstack([start[:3]] + [path_info['target_pose'][:3] for path_info in run])
+    lengths = norm(np.diff(points, axis=0), axis=1)
+    lines = [path_info['line_number'] for path_info in run]
+    compressed = []
+    i, n = 0, len(run)
+    while i < n:
+        j_line = i + 1
+        while j_line < n and j_line - i < max_points and fit_line(points, i, j_line + 1, tolerance):
+            j_line += 1
+        j_arc, arc = i, None
+        if fit_arcs:
+            j = i + 3
+            while j <= n and j - i <= max_points:
+                fitted = fit_arc(points, i, j, tolerance)
+                if fitted is None:
+                    break
+                j_arc, arc = j, fitted
+                j += 1
+        j = max(j_line, j_arc)
+        if j == i + 1:
+            compressed.append(run[i])
+            i = j
+            continue
+        path_info = dict(run[j - 1])
+        if j_arc > j_line:
+            center, sweep = arc
+            path_info['motion_mode'] = 'G3' if sweep > 0 else 'G2'
+            path_info['arc_params'] = {'I': center[0] - points[i][0], 'J': center[1] - points[i][1]}
+            path_info['plane'] = 'G17'
+        total = lengths[i:j].sum()
+        path_info['source_lines'] = lines[i:j]
+        path_info['source_breaks'] = np.cumsum(lengths[i:j]) / total if total > 0 else np.ones(j - i)
+        compressed.append(path_info)
+        i = j
+    return compressed
+
+
+def compress_cut_paths(cut_paths, tolerance=0.005, fit_arcs=True, max_points=500):
+    """
+    模擬前的路徑壓縮：CAM 輸出的大量微小 G1 在公差內合併為直線或擬合為圓弧，減少模擬步數。
+    只合併連續、同進給/轉速/刀具且沒有 C/A 移動的 G1，其他路徑原樣保留。
+    返回: 新的 cut_paths (合併的路徑帶有 source_lines / source_breaks 以對應回原始行號)
+    """
+    compressed = []
+    pose = np.zeros(5)
+    run, run_start = [], pose
+    for path_info in cut_paths:
+        target = np.asarray(path_info['target_pose'], dtype=np.float64)
+        mergeable = (path_info['motion_mode'] == 'G1' and np.array_equal(target[3:], pose[3:])
+                     and norm(target[:3] - pose[:3]) > 0)
+        if run and not (mergeable and all(path_info[key] == run[0][key] for key in ('feed', 'spindle_speed', 'current_tool'))):
+            compressed.extend(compress_run(run_start, run, tolerance, fit_arcs, max_points))
+            run = []
+        if mergeable:
+            if not run:
+                run_start = pose
+            run.append(path_info)
+        else:
+            compressed.append(path_info)
+        pose = target
+    if run:
+        compressed.extend(compress_run(run_start, run, tolerance, fit_arcs, max_points))
+    return compressed
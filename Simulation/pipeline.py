@@ -0,0 +1,52 @@
+import queue
+import threading
+
+_STOP = object()
+
+
+class PipelineStage(threading.Thread):
+    """
+    模擬管線的一個階段：單一工作執行緒依序由 bounded queue 取出項目，以 function 處理後交給下一階段 (downstream)。
+    queue 滿時 put 會等待 (背壓)，上游不會無限制地超前；每個階段只有一個執行緒，處理順序與送入順序相同。
+    處理發生例外時記錄下來並丟棄之後的項目 (避免上游卡在 put)，close 時再於呼叫端拋出。
+    flush 等待目前已送入的項目 (含下游) 都處理完，例如存檢查點之前。
+    """
+    def __init__(self, name, function, downstream=None, maxsize=256):
+        super().__init__(name=name, daemon=True)
+        self.function = function
+        self.downstream = downstream
+        self.inbox = queue.Queue(maxsize)
+        self.error = None
+        self.start()
+
+    def put(self, item):
+        self.inbox.put(item)
+
+    def run(self):
+        while True:
+            item = self.inbox.get()
+            try:
+                if item is _STOP:
+                    break
+                if self.error is None:
+                    result = self.function(item)
+                    if self.downstream is not None:
+                        self.downstream.put(result)
+            except Exception as e:
+                self.error = e
+            finally:
+                self.inbox.task_done()
+
+    def flush(self):
+        self.inbox.join()
+        if self.downstream is not None:
+            self.downstream.flush()
+
+    def close(self):
+        """等待此階段處理完所有項目後結束，再依序關閉下游階段"""
+        self.inbox.put(_STOP)
+        self.join()
+        if self.downstream is not None:
+            self.downstream.close()
+        if self.error is not None:
+            raise self.error
@@ -0,0 +1,71 @@
+import threading
+
+
+class CallbackProgress:
+    """
+    模擬進度的回呼介面: 提供與 QProgressBar 相同的 setValue / setFormat / value (0-1000)，
+    數值改變時呼叫 callback(fraction) (0.0-1.0)。callback 為 None 時只記錄目前的進度。
+    """
+    def __init__(self, callback=None):
+        self.callback = callback
+        self._value = 0
+        self._format = ''
+
+    def setValue(self, value):
+        if value != self._value:
+            self._value = value
+            if self.callback is not None:
+                self.callback(value / 1000)
+
+    def setFormat(self, text):
+        self._format = text
+
+    def value(self):
+        return self._value
+
+    def format(self):
+        return self._format
+
+
+def as_progress(progress):
+    """進度參數可為有 setValue / setFormat 的物件 (例如 QProgressBar)、回呼函式或 None"""
+    if hasattr(progress, 'setValue'):
+        return progress
+    return CallbackProgress(progress)
+
+
+class RunControl:
+    """
+    執行中模擬的協同式取消 / 暫停 / 繼續，可由其他執行緒 (例如介面) 呼叫。
+    模擬迴圈在每一步開始前呼叫 proceed(): 暫停時在此等待，已要求取消時返回 False (迴圈結束並保留已完成的結果)。
+    parent (例如漸進模擬的預覽以完整模擬的控制為上層): 上層的暫停與取消也作用在本身，本身的不影響上層。
+    """
+    def __init__(self, parent=None):
+        self._running = threading.Event()
+        self._running.set()
+        self.cancelled = False
+        self.parent = parent
+
+    def reset(self):
+        self.cancelled = False
+        self._running.set()
+
+    def cancel(self):
+        self.cancelled = True
+        self._running.set()  # 暫停中的迴圈也要醒來結束
+
+    def pause(self):
+        self._running.clear()
+
+    def resume(self):
+        self._running.set()
+
+    @property
+    def paused(self):
+        return not self._running.is_set() or (self.parent is not None and self.parent.paused)
+
+    def proceed(self):
+        if self.parent is not None and not self.parent.proceed():
+            return False
+        self._running.wait()
+        return not self.cancelled
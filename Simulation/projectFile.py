@@ -0,0 +1,29 @@
+import json
+import os
+import sys
+
+
+def get_base_path():
+    """程式所在資料夾 (打包成 EXE 時為 EXE 所在資料夾)，模擬的暫存與結果都放在其下的 TemporarySaved"""
+    if getattr(sys, 'frozen', False):  # 如果是打包成 EXE
+        return os.path.dirname(sys.executable)  # EXE 所在資料夾
+    return os.path.dirname(os.path.abspath(__file__))  # 開發模式：.py 檔所在資料夾
+
+
+def validate_project_data(project_data):
+    """專案檔案格式是否有效 (必須有 settings)"""
+    if not isinstance(project_data, dict):
+        return False
+    return "settings" in project_data
+
+
+def read_project(file_path):
+    """
+    讀取專案檔 (.camproj，JSON) 不需要任何介面。
+    返回: 設定字典 (SimulationWidget.settings)；檔案不存在時拋出 FileNotFoundError，格式不符時拋出 ValueError
+    """
+    with open(file_path, 'r', encoding='utf-8') as f:
+        project_data = json.load(f)
+    if not validate_project_data(project_data):
+        raise ValueError(f"{file_path} is not a valid project file")
+    return project_data["settings"]
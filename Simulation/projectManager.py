@@ -1,12 +1,12 @@
 import json
 import os
-import sys
 from datetime import datetime
 import shutil
 import numpy as np
 from PyQt5.QtWidgets import QApplication
 from PyQt5.QtCore import Qt
 from PyQt5.QtWidgets import QFileDialog, QMessageBox, QDialog, QLabel, QVBoxLayout
+from projectFile import get_base_path, validate_project_data
 
 class ProjectManager:
     def __init__(self, default_extension=".camproj"):
@@ -24,11 +24,7 @@ class ProjectManager:
         ]
         
     def get_base_path(self):
-        if getattr(sys, 'frozen', False):  # 如果是打包成 EXE
-            base_path = os.path.dirname(sys.executable)  # EXE 所在資料夾
-        else:
-            base_path = os.path.dirname(os.path.abspath(__file__))  # 開發模式：.py 檔所在資料夾
-        return base_path
+        return get_base_path()
     def save_project(self, frameClass, parent=None, default_filename="新專案"):
         try:
             settings_dict = frameClass.settings
@@ -88,13 +84,13 @@ class ProjectManager:
                 
 
             # === 儲存動畫資料 ===
-            if frameClass.cnc.workpiece_for_anime != []:
+            if len(frameClass.cnc.workpiece_for_anime) > 0:
                 target_npy1_path = os.path.splitext(file_path)[0] + "_workpiece.npz"
                 target_npy2_path = os.path.splitext(file_path)[0] + "_tool.npz"
                 settings_dict['workpiece_for_anime'] = target_npy1_path
                 settings_dict['tool_for_anime'] = target_npy2_path
-                np.savez_compressed(target_npy1_path, data=np.array(frameClass.cnc.workpiece_for_anime, dtype=object))
-                np.savez_compressed(target_npy2_path, data=np.array(frameClass.cnc.tool_for_anime, dtype=object))
+                np.savez_compressed(target_npy1_path, data=np.array(list(frameClass.cnc.workpiece_for_anime), dtype=object))
+                np.savez_compressed(target_npy2_path, data=np.array(list(frameClass.cnc.tool_for_anime), dtype=object))
 
             # === 儲存專案檔案 ===
             with open(file_path, 'w', encoding='utf-8') as f:
@@ -183,15 +179,7 @@ class ProjectManager:
         Returns:
             bool: 檔案格式是否有效
         """
-        if not isinstance(project_data, dict):
-            return False
-        
-        # 檢查必要的欄位
-        if "settings" not in project_data:
-            return False
-        
-        # 可以加入更多驗證規則
-        return True
+        return validate_project_data(project_data)
     
     def get_recent_projects(self, max_count=5):
         """
@@ -1,10 +1,12 @@
 import sys
+import multiprocessing
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, 
                              QHBoxLayout, QPushButton, QLabel, QTabWidget, 
                              QFrame, QSplitter, QScrollArea, QTreeWidget, 
                              QTreeWidgetItem, QMessageBox, QFileDialog,
                              QDialog, QLineEdit, QComboBox, QGridLayout, QFormLayout, QDialogButtonBox, QTableWidget, 
-                             QHeaderView, QSizePolicy, QTableWidgetItem, QTextEdit, QProgressBar)
+                             QHeaderView, QSizePolicy, QTableWidgetItem, QTextEdit, QProgressBar,
+                             QSpinBox, QDoubleSpinBox)
 from PyQt5.QtCore import Qt, QThread, pyqtSignal, QCoreApplication
 from PyQt5.QtGui import QPalette, QColor, QCloseEvent, QTextCursor
 import os
@@ -600,7 +602,7 @@ class CAMSimulator(QMainWindow):
 
             def view_tool(self, row):
                 filepath = self.table.item(row, 2).text()
-                frameClass.plot_tool_mesh(filepath)
+                frameClass.plot_tool_mesh(filepath, self.table.item(row, 1).text())
 
             def delete_row(self, row):
                 """刪除該行"""
@@ -1122,35 +1124,135 @@ class CAMSimulator(QMainWindow):
             def __init__(self, parent=None):
                 super().__init__(parent)
                 self.setWindowTitle("選擇模擬模式")
-                self.setFixedSize(350, 180)
-    
+                self.setMinimumWidth(380)
+                settings = frameClass.settings
+
+                # 數值設定以 spin box 輸入，只能輸入範圍內的數字
+                def double_box(key, default, minimum, maximum, decimals, suffix=""):
+                    box = QDoubleSpinBox()
+                    box.setRange(minimum, maximum)
+                    box.setDecimals(decimals)
+                    box.setSingleStep(10 ** -(decimals - 1))
+                    box.setValue(float(settings.get(key, default)))
+                    if suffix:
+                        box.setSuffix(f" {suffix}")
+                    return box
+
+                def int_box(key, default, minimum, maximum, suffix=""):
+                    box = QSpinBox()
+                    box.setRange(minimum, maximum)
+                    box.setValue(int(settings.get(key, default)))
+                    if suffix:
+                        box.setSuffix(f" {suffix}")
+                    return box
+
+                def combo(items, current):
+                    box = QComboBox()
+                    box.addItems(items)
+                    index = box.findText(str(current))
+                    if index >= 0:
+                        box.setCurrentIndex(index)
+                    return box
+
                 # 主 layout
                 layout = QVBoxLayout()
-    
+
                 # 下拉選單
-                input_layout = QHBoxLayout()
-                self.combo_box = QComboBox()
-                self.combo_box.addItems(["Simplified", "Accurate"])
-    
-                # 根據原本設定值選擇對應的選項
-                current_value = frameClass.settings.get('Simulation Mode', "Simplified")
-                index = self.combo_box.findText(str(current_value))
-                if index >= 0:
-                    self.combo_box.setCurrentIndex(index)
-    
-                input_layout.addWidget(QLabel("Simulation Mode:"))
-                input_layout.addWidget(self.combo_box)
-                layout.addLayout(input_layout)
-    
+                mode_layout = QFormLayout()
+                self.combo_box = combo(["Simplified", "Accurate"], settings.get('Simulation Mode', "Simplified"))
+                mode_layout.addRow("Simulation Mode:", self.combo_box)
+                layout.addLayout(mode_layout)
+
+                # 其餘設定依類別分頁
+                tabs = QTabWidget()
+
+                # 材料模型: 引擎、幾何核心、刀具模型與各引擎的參數
+                engine_page = QWidget()
+                engine_form = QFormLayout(engine_page)
+                self.engine_combo = combo(["Mesh", "Tiled Mesh", "Z-map", "Tri-dexel", "SDF", "Auto"],
+                                          settings.get('Stock Engine', "Mesh"))
+                self.kernel_combo = combo(["manifold3d", "trimesh"], settings.get('Geometry Kernel', "manifold3d"))
+                # 刀具模型: STL 檔或由 toolname 建立的參數化刀具
+                self.tool_model_combo = combo(["STL", "Parametric"], settings.get('Tool Model', "STL"))
+                self.resolution_edit = double_box('Stock Resolution', 0.5, 0.001, 100.0, 3, "mm")
+                # 網格引擎掃掠體積: 每次布林運算合併的步數 (1 = 逐步, 0 = 整段路徑)
+                self.sweep_edit = int_box('Sweep Batch Steps', 1, 0, 1000000)
+                self.tile_edit = double_box('Tile Size', 20.0, 0.1, 10000.0, 2, "mm")
+                # 網格引擎局部簡化的誤差上限 (0 = 不簡化)
+                self.remesh_edit = double_box('Remesh Tolerance', 0.01, 0.0, 10.0, 4, "mm")
+                engine_form.addRow("Stock Engine:", self.engine_combo)
+                engine_form.addRow("Geometry Kernel:", self.kernel_combo)
+                engine_form.addRow("Tool Model:", self.tool_model_combo)
+                engine_form.addRow("Stock Resolution:", self.resolution_edit)
+                engine_form.addRow("Sweep Batch Steps:", self.sweep_edit)
+                engine_form.addRow("Tile Size:", self.tile_edit)
+                engine_form.addRow("Remesh Tolerance:", self.remesh_edit)
+                tabs.addTab(engine_page, "Stock")
+
+                # 路徑與步長: 路徑壓縮公差 (0 = 不壓縮)，固定 (simulation_step) 或自適應步長
+                step_page = QWidget()
+                step_form = QFormLayout(step_page)
+                self.path_edit = double_box('Path Compression Tolerance', 0.0, 0.0, 10.0, 4, "mm")
+                self.step_mode_combo = QComboBox()
+                self.step_mode_combo.addItems(["Fixed", "Adaptive"])
+                self.step_mode_combo.setCurrentIndex(1 if settings.get('Adaptive Step', False) else 0)
+                self.min_step_edit = double_box('Min Step', 0.1, 0.001, 100.0, 3, "mm")
+                self.max_step_edit = double_box('Max Step', 3.0, 0.001, 1000.0, 3, "mm")
+                self.chord_error_edit = double_box('Max Chord Error', 0.02, 0.0001, 10.0, 4, "mm")
+                step_form.addRow("Path Compression:", self.path_edit)
+                step_form.addRow("Step Mode:", self.step_mode_combo)
+                step_form.addRow("Min Step:", self.min_step_edit)
+                step_form.addRow("Max Step:", self.max_step_edit)
+                step_form.addRow("Max Chord Error:", self.chord_error_edit)
+                tabs.addTab(step_page, "Steps")
+
+                # 執行: 平行工作程序數 (1 = 不平行)、檢查點間隔與結果快取 (0 = 不使用)、漸進預覽、執行的程序
+                run_page = QWidget()
+                run_form = QFormLayout(run_page)
+                self.workers_edit = int_box('Parallel Workers', 1, 1, 256)
+                self.checkpoint_edit = int_box('Checkpoint Interval', 2000, 0, 1000000000, "steps")
+                self.cache_edit = int_box('Result Cache Size', 2048, 0, 10000000, "MB")
+                self.preview_combo = QComboBox()
+                self.preview_combo.addItems(["Off", "Progressive"])
+                self.preview_combo.setCurrentIndex(1 if settings.get('Progressive Preview', False) else 0)
+                self.process_combo = QComboBox()
+                self.process_combo.addItems(["Child Process", "UI Process"])
+                self.process_combo.setCurrentIndex(0 if settings.get('Engine Process', True) else 1)
+                run_form.addRow("Parallel Workers:", self.workers_edit)
+                run_form.addRow("Checkpoint Every:", self.checkpoint_edit)
+                run_form.addRow("Result Cache:", self.cache_edit)
+                run_form.addRow("Preview:", self.preview_combo)
+                run_form.addRow("Run In:", self.process_combo)
+                tabs.addTab(run_page, "Run")
+
+                layout.addWidget(tabs)
+
                 # Apply 按鈕
                 self.apply_btn = QPushButton("Apply")
                 self.apply_btn.clicked.connect(self.apply_and_close)
                 layout.addWidget(self.apply_btn)
-    
+
                 self.setLayout(layout)
-    
+
             def apply_and_close(self):
                 frameClass.settings['Simulation Mode'] = self.combo_box.currentText()
+                frameClass.settings['Stock Engine'] = self.engine_combo.currentText()
+                frameClass.settings['Geometry Kernel'] = self.kernel_combo.currentText()
+                frameClass.settings['Tool Model'] = self.tool_model_combo.currentText()
+                frameClass.settings['Stock Resolution'] = self.resolution_edit.value()
+                frameClass.settings['Sweep Batch Steps'] = self.sweep_edit.value()
+                frameClass.settings['Tile Size'] = self.tile_edit.value()
+                frameClass.settings['Remesh Tolerance'] = self.remesh_edit.value()
+                frameClass.settings['Path Compression Tolerance'] = self.path_edit.value()
+                frameClass.settings['Adaptive Step'] = self.step_mode_combo.currentText() == "Adaptive"
+                frameClass.settings['Min Step'] = self.min_step_edit.value()
+                frameClass.settings['Max Step'] = self.max_step_edit.value()
+                frameClass.settings['Max Chord Error'] = self.chord_error_edit.value()
+                frameClass.settings['Parallel Workers'] = self.workers_edit.value()
+                frameClass.settings['Checkpoint Interval'] = self.checkpoint_edit.value()
+                frameClass.settings['Result Cache Size'] = self.cache_edit.value()
+                frameClass.settings['Progressive Preview'] = self.preview_combo.currentText() == "Progressive"
+                frameClass.settings['Engine Process'] = self.process_combo.currentText() == "Child Process"
                 self.accept()  # 關閉視窗
     
         dialog = InputDialog(self)
@@ -1334,6 +1436,7 @@ class CAMSimulator(QMainWindow):
         """關閉指定的分頁"""
         current_tab_widget = self.notebook.currentWidget()
         current_tab_widget.tab_components['main_content_frame'].plotter_3d.close()
+        current_tab_widget.tab_components['main_content_frame'].engine.close()
         current_tab_widget.tab_components['main_content_frame'].plotter_3d.deep_clean()
         del current_tab_widget.tab_components['main_content_frame'].plotter_3d
         
@@ -1461,4 +1564,5 @@ def main():
     sys.exit(app.exec_())
 
 if __name__ == '__main__':
+    multiprocessing.freeze_support()  # 打包成執行檔時，模擬子程序由此進入
     main()
\ No newline at end of file
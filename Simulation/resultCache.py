@@ -0,0 +1,117 @@
+import os
+import pickle
+import tempfile
+import numpy as np
+
+RESULT_CACHE_VERSION = 4    # 結果格式或模擬演算法改變時加一，舊的快取不再命中
+
+
+def estimated_nbytes(value, seen=None):
+    """
+    value 以 pickle 序列化後大小的估計 (不實際序列化)：累計 numpy 陣列的資料量，同一物件只算一次 (同 pickle 的 memo)。
+    有 nbytes() 方法的物件 (KernelFrames) 由該方法估計，其他物件依 __getstate__ 遞迴。
+    """
+    if seen is None:
+        seen = {}
+    if id(value) in seen:
+        return 0
+    seen[id(value)] = value     # 保留參考，遞迴中暫時建立的物件 id 不會被重複使用
+    if isinstance(value, np.ndarray):
+        if value.dtype == object:
+            return value.nbytes + sum(estimated_nbytes(item, seen) for item in value.ravel())
+        return value.nbytes
+    if callable(getattr(value, 'nbytes', None)):
+        return value.nbytes()
+    if isinstance(value, (str, bytes)):
+        return len(value)
+    if isinstance(value, dict):
+        return sum(estimated_nbytes(k, seen) + estimated_nbytes(v, seen) for k, v in value.items())
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return 8 * len(value) + sum(estimated_nbytes(item, seen) for item in value)
+    if value is None or isinstance(value, (bool, int, float, complex, np.generic)):
+        return 8
+    try:
+        state = value.__getstate__()
+    except Exception:
+        return 64
+    return 64 if state is None else estimated_nbytes(state, seen)
+
+
+class ResultCache:
+    """
+    完整模擬結果的快取 (content-addressed)：鍵為所有模擬輸入的雜湊 (SimpleCam.result_cache_key)，每筆結果一個檔案 <key>.pkl。
+    先寫入暫存檔再以 os.replace 取代，多個程序 (批次模擬) 同時使用也不會讀到寫到一半的檔案。
+    命中時更新檔案的修改時間，總大小超過 max_bytes 時由最久未使用的檔案開始刪除 (LRU)。
+    結果以 pickle 儲存，載入時可執行檔案中的任意程式碼：資料夾只能是自己可信任的位置，不要指定他人可寫入的共用資料夾。
+    """
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    def path(self, key):
+        return os.path.join(self.directory, f"{key}.pkl")
+
+    def load(self, key):
+        """讀取 key 的結果，不存在或無法讀取時返回 None"""
+        path = self.path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'rb') as f:
+                result = pickle.load(f)
+            os.utime(path)
+        except Exception as e:
+            print(f"Result cache {path} could not be loaded: {e}")
+            return None
+        return result
+
+    def save(self, key, data):
+        """存入序列化的結果 data (bytes)，單筆超過 max_bytes 時不存"""
+        if len(data) > self.max_bytes:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(suffix='.tmp', dir=self.directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, self.path(key))
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        self.evict(keep=key)
+
+    def entries(self):
+        """[(最後使用時間, 大小, 路徑), ...] 由最久未使用排起"""
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.pkl'):
+                path = os.path.join(self.directory, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:  # 其他程序剛刪除
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return sorted(entries)
+
+    def evict(self, keep=None):
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            if keep is not None and path == self.path(keep):
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def clear(self):
+        if os.path.isdir(self.directory):
+            for _, _, path in self.entries():
+                try:
+                    os.remove(path)
+                except FileNotFoundError:  # 其他程序剛刪除
+                    pass
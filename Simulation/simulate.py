@@ -2,14 +2,25 @@ import trimesh
 import numpy as np
 import pandas as pd
 import os
-from trimesh.boolean import boolean_manifold
+import copy
+import pickle
+import hashlib
 import open3d as o3d
 from numpy.linalg import norm
 from numpy import deg2rad, ceil, concatenate
-from projectManager import ProjectManager
+from projectFile import get_base_path
+from progressReporter import as_progress, RunControl
 from DataQuery import CNCDataQuery
 from gcodeparsor import GcodeParser
-from PyQt5.QtWidgets import QMessageBox
+from stockEngine import ToolProfile, TiledMeshStock, OccupancyGrid, StockFrames, build_stock_model
+from geometryKernel import TrimeshKernel, ManifoldKernel, KernelFrames
+from cutterLibrary import CutterSpec
+from trajectory import Trajectory, AdaptiveStepper
+from pathCompressor import compress_cut_paths
+from domainDecomposition import DomainDecomposedStock
+from pipeline import PipelineStage
+from checkpointStore import CheckpointStore
+from resultCache import ResultCache, RESULT_CACHE_VERSION, estimated_nbytes
 from math import atan2, sqrt, pi
 
 class Plant():
@@ -45,7 +56,31 @@ class Plant():
         if len(self.v_hist) > 4:
             self.v_hist.pop(0)
         return F_ym_i
-    
+
+
+# SimulationWidget 設定 (專案檔 settings) 的鍵 -> SimpleCam 屬性與預設值
+SIMULATION_SETTINGS = (
+    ('simulation_step', 'simulation_step', 0.9),
+    ('Stock Engine', 'stock_engine', 'Mesh'),
+    ('Stock Resolution', 'stock_resolution', 0.5),
+    ('Sweep Batch Steps', 'sweep_batch_steps', 1),
+    ('Tile Size', 'tile_size', 20.0),
+    ('Remesh Tolerance', 'remesh_tolerance', 0.01),
+    ('Geometry Kernel', 'geometry_kernel', 'manifold3d'),
+    ('Tool Model', 'tool_model', 'STL'),
+    ('Path Compression Tolerance', 'path_tolerance', 0.0),
+    ('Adaptive Step', 'adaptive_step', False),
+    ('Min Step', 'min_step', 0.1),
+    ('Max Step', 'max_step', 3.0),
+    ('Max Chord Error', 'max_chord_error', 0.02),
+    ('Parallel Workers', 'parallel_workers', 1),
+    ('Checkpoint Interval', 'checkpoint_interval', 2000),
+    ('Incremental Simulation', 'incremental', True),
+    ('Result Cache Size', 'result_cache_size', 2048),
+    ('Result Cache Directory', 'result_cache_dir', ''),
+)
+
+
 class SimpleCam(GcodeParser):
     def __init__(self):
         super().__init__()
@@ -55,6 +90,7 @@ class SimpleCam(GcodeParser):
         self.feed = 300
         self.current_simulated_cutting_force = 0
         self.workpiece = None
+        self.loaded_workpiece = None    # alignment_workpiece_and_offset 載入並對齊的工件 (未切削)，每次模擬由它的複本開始
         self.tool = None
         self.width = None
         self.depth = None
@@ -70,9 +106,53 @@ class SimpleCam(GcodeParser):
         self.final_workpiece_coords = []
         self.gcode = None
         self.simulation_step = 0.9
-        self.pj_manager = ProjectManager()
+        self.sweep_batch_steps = 1  # 網格引擎每次布林運算合併的步數: 1 為逐步運算，0 為整段路徑一次掃掠
+        self.base_path = get_base_path()  # 暫存與結果 (TemporarySaved) 的根目錄
         self.CuttingPara_query = None
         self.plant = None
+        self.stock_engine = 'Mesh'      # 'Mesh' (網格布林運算)、'Tiled Mesh'、'Z-map'、'Tri-dexel'、'SDF' 或 'Auto' (見 resolved_stock_engine)
+        self.stock_resolution = 0.5     # 非網格引擎的格點間距 (mm)
+        self.tile_size = 20.0           # 'Tiled Mesh' 引擎的 tile 邊長 (mm)
+        self.stock = None
+        self.workpiece_transform = np.eye(4)  # 材料模型座標系 -> 機台座標系 (累積的 C/A 旋轉)
+        self.occupancy = None
+        self.broad_phase_cell = 2.0     # 空切判斷用粗格佔據網格的格子大小 (mm)
+        self.remesh_tolerance = 0.01    # 網格引擎局部簡化的幾何誤差上限 (mm)，0 為不簡化
+        self.geometry_kernel = 'manifold3d'  # 網格引擎的幾何核心: 'manifold3d' 或 'trimesh'
+        self.kernel = None
+        self.tool_pose = np.eye(4)      # 刀具相對載入 (set_tool) 時位置的累積轉換
+        self.tool_profile = None
+        self.tool_tip_offset = None
+        self.tool_model = 'STL'          # 'STL' (有刀具檔時使用) 或 'Parametric' (toolname 可解析時優先使用參數化刀具)
+        self.cutter = None              # 目前刀具為參數化刀具時的 CutterSpec
+        self.path_tolerance = 0.0       # 路徑壓縮公差 (mm)：微小 G1 合併為直線/圓弧，0 為不壓縮
+        self.simulated_paths = []       # 實際模擬的路徑 (壓縮後的 cut_paths)
+        self.trajectory = None
+        self.adaptive_step = False      # 自適應步長 (False 時每步固定為 simulation_step)
+        self.min_step = 0.1             # 自適應步長的最小步長 (mm)
+        self.max_step = 3.0             # 自適應步長的最大步長 (mm)
+        self.max_chord_error = 0.02     # 曲線路徑的弦高與刀具殘料高度的誤差上限 (mm)
+        self.engagement_tolerance = 0.2 # 切削截面積的相對變化超過此值時細分步長
+        self.stepper = None
+        self.parallel_workers = 1       # 材料模型空間分解的工作程序數 (1 為不平行，Mesh 引擎不支援)
+        self.parallel_window = 64       # 平行模式下尚未取回結果的最多步數
+        self.pipelined = True           # 切寬/切深/切削力與結果儲存在獨立的執行緒階段，與下一步的材料移除重疊
+        self.pipeline_queue_size = 256  # 管線階段之間 queue 的容量
+        self.metrics_stage = None
+        self.checkpoint_interval = 2000 # 每模擬多少步 (以及每次換刀前) 在路徑開頭存一次檢查點，0 為不存
+        self.resume_checkpoint = True   # 有相同輸入與設定的檢查點 (上次未完成) 時由檢查點接續模擬
+        self.incremental = True         # 檢查點位置的快照留在記憶體，G-code 修改後由第一段變動的路徑之前最近的快照接續模擬
+        self.snapshot_limit = 32        # 記憶體中最多保留的快照數
+        self.snapshots = {}             # 路徑索引 -> capture_snapshot 序列化的模擬狀態
+        self.previous_run = None        # 上一次完成的模擬: signature、路徑與結果，增量模擬沿用
+        self.preview_step_factor = 5.0  # 漸進模擬: 粗略預覽的步長為 simulation_step 的倍數
+        self.preview_resolution = 2.0   # 漸進模擬: 粗略預覽的材料模型格點間距 (mm)
+        self.control = RunControl()     # 執行中的取消 / 暫停 / 繼續 (可由其他執行緒呼叫)
+        self.cancelled = False          # 上一次模擬是否被取消 (結果只到取消時)
+        self.result_cache_size = 2048   # 完整模擬結果快取的大小上限 (MB)，0 為不使用
+        # 結果快取的資料夾，空字串時在 base_path/TemporarySaved/result_cache (與檢查點相同，無介面模擬時在結果資料夾)；
+        # 指定同一個資料夾可讓多個批次工作共用快取
+        self.result_cache_dir = ''
     
     def calculate_center_ijk(self, start_point, end_point, arc_params):
         """
@@ -353,15 +433,491 @@ class SimpleCam(GcodeParser):
         else:
             self.workpiece.apply_transform(rotation_matrix_A)
             self.workpiece.apply_transform(rotation_matrix_C)
+        self.loaded_workpiece = self.workpiece.copy()
             
-    def alignment_tool_and_offset(self, tool_filePath, tool_offset):
-        self.tool = trimesh.load_mesh(tool_filePath)
+    def parametric_cutter(self, tool_filePath, tool_info=None):
+        """tool_info (toolname 註解或刀具表的刀具資訊) 可解析，且沒有刀具檔或選擇 'Parametric' 時返回 CutterSpec，否則 None"""
+        spec = CutterSpec.from_toolname(tool_info)
+        if spec is not None and (self.tool_model == 'Parametric' or not tool_filePath or not os.path.exists(tool_filePath)):
+            return spec
+        return None
+
+    def alignment_tool_and_offset(self, tool_filePath, tool_offset, tool_info=None):
+        spec = self.parametric_cutter(tool_filePath, tool_info)
+        if spec is not None:
+            self.cutter = spec
+            self.tool = spec.mesh()  # 只用於動畫與空切判斷，材料移除與切削接觸使用輪廓
+        else:
+            self.cutter = None
+            self.tool = trimesh.load_mesh(tool_filePath)
         origin_alignment_x = -self.tool.bounds[0][0] #工件原點和3D模型原點對齊
         origin_alignment_y = -self.tool.bounds[0][1]
         origin_alignment_z = -self.tool.bounds[0][2]
         self.tool.apply_translation([origin_alignment_x, origin_alignment_y, origin_alignment_z])
         self.tool.apply_translation(tool_offset)
-        
+    
+    def update_tool_profile(self):
+        """由目前刀具網格擷取迴轉輪廓，刀尖位置即為刀具座標與工件座標的偏移量；參數化刀具直接使用精確輪廓"""
+        self.tool_profile, self.tool_tip_offset = ToolProfile.from_mesh(self.tool)
+        if self.cutter is not None:
+            self.tool_profile = self.cutter.profile()
+        if self.stepper is not None and not (self.stock is None and self.sweep_batch_steps != 1):
+            self.stepper.tool_radius = self.tool_profile.radius  # 掃掠體積模式沒有殘料，不限制
+    
+    def has_rotary_motion(self):
+        angles = [np.zeros(2)] + [path_info['target_pose'][3:] for path_info in self.cut_paths]
+        return bool(np.any(np.ptp(np.array(angles), axis=0) > 0))
+    
+    def set_trajectory(self, trajectory):
+        """設定本次模擬的 Trajectory 與由其得到的逐段步長、切削距離與最終刀具姿態"""
+        self.trajectory = trajectory
+        moving = trajectory.step_count > 0
+        self.cutting_distance = list(trajectory.distance[moving])
+        self.step = list(trajectory.scale[moving])
+        self.final_workpiece_coords = trajectory.pose
+
+    def plan_trajectory(self, paths=None):
+        """運動學預處理: 由路徑 (預設為 cut_paths) 一次算出整個程式逐步的刀具姿態與時間 (Trajectory)"""
+        radius_c = norm(np.array([self.workpiece.bounds[1][0], self.workpiece.centroid[1], self.workpiece.centroid[2]]) - self.c_center)
+        radius_a = norm(np.array([self.workpiece.centroid[0], self.workpiece.centroid[1], self.workpiece.bounds[1][2]]) - self.a_center)
+        return Trajectory.plan(self.cut_paths if paths is None else paths, self.simulation_step, self.get_arc_params,
+                               radius_c, radius_a, stepper=self.stepper)
+    
+    def resolved_stock_engine(self, tool_dict):
+        """
+        本次模擬實際使用的材料模型引擎。'Auto' 在刀具表的刀具都是參數化刀具時使用 Z-map (含 C/A 旋轉時 Tri-dexel)，
+        材料移除與切削接觸都由刀具輪廓與高度場 / dexel 解析計算，不需每步刀具網格的布林運算；否則使用 Mesh。
+        其他設定照原本的引擎。
+        """
+        if self.stock_engine != 'Auto':
+            return self.stock_engine
+        if tool_dict and all(self.parametric_cutter(*tool) is not None for tool in tool_dict.values()):
+            engine = 'Tri-dexel' if self.has_rotary_motion() else 'Z-map'
+            print(f"Parametric tools: using the {engine} engine ({self.stock_resolution} mm).")
+            return engine
+        return 'Mesh'
+
+    def create_stock_model(self, engine=None):
+        """依 engine (預設為 stock_engine) 建立材料模型，'Mesh' 返回 None (沿用網格布林運算)"""
+        engine = self.stock_engine if engine is None else engine
+        if engine == 'Z-map':
+            if self.has_rotary_motion():
+                print("Z-map engine does not support C/A moves, falling back to Mesh engine.")
+                return None
+        if self.parallel_workers > 1 and engine in ('Z-map', 'Tri-dexel', 'SDF', 'Tiled Mesh'):
+            return DomainDecomposedStock(self.workpiece, engine, self.parallel_workers, self.stock_resolution,
+                                         self.tile_size, self.remesh_tolerance)
+        return build_stock_model(engine, self.workpiece, self.stock_resolution, self.tile_size, self.remesh_tolerance)
+    
+    def tool_pose_in_stock(self, workpiece_coord, transform=None):
+        """機台座標的刀尖與刀軸轉到材料模型座標系 (transform 預設為目前的 workpiece_transform)。返回: tip, axis"""
+        inverse = np.linalg.inv(self.workpiece_transform if transform is None else transform)
+        tip = trimesh.transformations.transform_points([self.tool_tip_offset + workpiece_coord], inverse)[0]
+        axis = inverse[:3, :3] @ np.array([0.0, 0.0, 1.0])
+        return tip, axis
+    
+    def tool_bounds_in_stock(self, displacement=None):
+        """刀具 AABB (或再平移 displacement 掃過的 AABB) 轉到材料模型座標系的 AABB。返回: lower, upper"""
+        bounds = self.tool.bounds
+        if displacement is not None:
+            bounds = np.array([np.minimum(bounds[0], bounds[0] + displacement), np.maximum(bounds[1], bounds[1] + displacement)])
+        corners = trimesh.bounds.corners(bounds)
+        local = trimesh.transformations.transform_points(corners, np.linalg.inv(self.workpiece_transform))
+        return local.min(axis=0), local.max(axis=0)
+
+    def tool_is_air(self, displacement=None):
+        """broad phase: 刀具 AABB 轉到材料模型座標系後沒有碰到佔據格即為空切"""
+        return self.occupancy.is_air(*self.tool_bounds_in_stock(displacement))
+    
+    def clear_occupancy(self, workpiece_coord, transform=None):
+        """材料移除後更新粗格佔據網格"""
+        tip, axis = self.tool_pose_in_stock(workpiece_coord, transform)
+        self.occupancy.clear_tool(tip, axis, self.tool_profile)
+    
+    def stock_remove_tool(self, workpiece_coord):
+        """
+        將機台座標的刀具姿態轉到材料模型座標系後移除材料。
+        返回材料模型座標系的切削區域 (emit_row 時再轉回機台座標，使寬度/深度仍以機台座標計算)。
+        """
+        if isinstance(self.stock, TiledMeshStock):
+            tool = self.tool.copy()
+            tool.apply_transform(np.linalg.inv(self.workpiece_transform))
+            removal = self.stock.remove_mesh(tool)
+        else:
+            tip, axis = self.tool_pose_in_stock(workpiece_coord)
+            removal = self.stock.remove_tool(tip, self.tool_profile, axis)
+        return removal
+    
+    def removal_to_machine(self, removal, transform):
+        """材料模型座標系的切削區域轉回機台座標"""
+        if removal is not None:
+            removal['points'] = trimesh.transformations.transform_points(removal['points'], transform)
+            removal['centroid'] = trimesh.transformations.transform_points([removal['centroid']], transform)[0]
+        return removal
+    
+    def tool_pose_in_workpiece(self):
+        """刀具姿態轉到工件座標系 (工件固定不動，C/A 旋轉的逆轉換只作用在刀具上)"""
+        return np.linalg.inv(self.workpiece_transform) @ self.tool_pose
+    
+    def cutter_engagement(self, points, tip, cutter, width_dir):
+        """
+        參數化刀具的切削接觸 (解析): 切削區域取樣點轉到刀具座標 (刀尖為原點、刀軸 +Z)，
+        軸向切深只計刃長內的高度 0 <= t <= flute_length，徑向切寬以該高度的刀具輪廓半徑 r(t) 為界。
+        返回: depth, width (width_dir 為 None (垂直下刀) 時切寬為 0)
+        """
+        relative = np.asarray(points, dtype=np.float64) - tip
+        t = np.clip(relative[:, 2], 0.0, cutter.flute_length)
+        depth = float(t.max() - t.min())
+        if width_dir is None:
+            return depth, 0.0
+        radius = cutter.profile().radius_at(t)
+        lateral = np.clip(relative @ width_dir, -radius, radius)
+        return depth, float(lateral.max() - lateral.min())
+
+    def cutting_geometry(self, simulation_mode, points, volume, centroid, step_angle, step_vector_actual, scale, engagement=None):
+        """
+        由切削區域 (布林交集頂點或材料模型取樣點) 計算切寬、切深與切削截面積。
+        engagement: 參數化刀具的 (機台座標的刀尖, CutterSpec)，切寬與切深改由 cutter_engagement 以刀具輪廓計算。
+        返回: width, depth, cross_area
+        """
+        tool_axis = np.array([0.0, 0.0, 1.0])
+        omega_C = np.array([0.0, 0.0, deg2rad(step_angle[0])])
+        omega_A = np.array([deg2rad(step_angle[1]), 0.0, 0.0])
+        disp_C = np.cross(omega_C, centroid - self.c_center)
+        disp_A = np.cross(omega_A, centroid - self.a_center)
+        feed_vector = disp_C + disp_A - step_vector_actual
+        feed_norm = np.linalg.norm(feed_vector)
+
+        if feed_norm < self.epsilon:
+            return 0.0, 0.0, 0.0  # Optional: set volume to 0 if no movement
+
+        cross_area = volume / scale  # cross area
+        width_dir = None
+        if simulation_mode != 'Accurate':
+            unit_vector = feed_vector / feed_norm
+            cross_dir = np.cross(tool_axis, unit_vector)
+            cross_norm = np.linalg.norm(cross_dir)
+            if cross_norm >= self.epsilon:  # 否則為垂直下刀，切寬為 0
+                width_dir = cross_dir / cross_norm
+
+        if engagement is not None:
+            depth, width = self.cutter_engagement(points, *engagement, width_dir)
+            if simulation_mode == 'Accurate':
+                width = cross_area / depth if depth > 0 else 0.0
+            return width, depth, cross_area
+
+        projs_z = np.dot(points, tool_axis)
+        depth = np.max(projs_z) - np.min(projs_z)
+        if simulation_mode == 'Accurate':
+            width = cross_area / depth
+        elif width_dir is None:
+            width = 0.0  # Plunging case
+        else:
+            projs = np.dot(points, width_dir)
+            width = np.max(projs) - np.min(projs)
+        return width, depth, cross_area
+    
+    def cutting_row(self, simulation_mode, current_pose, removal, step_angle, step_vector_actual, scale, gcode_lineNumber, time,
+                    feed=None, spindle_speed=None):
+        """
+        組成一步的 cutting parameters: X,Y,Z,C,A,Width,Depth,cross_area,GcodeLineNumber,Time,Simulated Cutting Force
+        feed / spindle_speed 為該步的進給與轉速 (預設為目前的 self.feed / self.spindle_speed)
+        """
+        feed = self.feed if feed is None else feed
+        spindle_speed = self.spindle_speed if spindle_speed is None else spindle_speed
+        if removal is None:
+            return concatenate((current_pose, [0, 0, 0, gcode_lineNumber, time, 0]))
+        width, depth, cross_area = self.cutting_geometry(simulation_mode, removal['points'], removal['volume'], removal['centroid'],
+                                                         step_angle, step_vector_actual, scale, removal.get('engagement'))
+        if spindle_speed == 0:
+            self.current_simulated_cutting_force = 0 
+        else:
+            self.current_simulated_cutting_force = self.plant.run_plant(width, depth, spindle_speed, feed)
+        return concatenate((current_pose, [width, depth, cross_area, gcode_lineNumber, time, self.current_simulated_cutting_force]))
+    
+    def emit_row(self, simulation_mode, pose, removal, transform, step_angle, step_vector_actual, scale, line, time, rows,
+                 feed, spindle_speed):
+        """
+        一步的材料移除結果 (材料模型座標系，transform 為該步材料模型到機台座標的轉換) 交給量測階段，
+        量測階段算出切寬/切深/切削力後由儲存階段依序加到 rows；非管線模式時直接在此完成。
+        自適應步長需要的切削截面積在此即時回饋，不等待量測階段。
+        參數化刀具的刀尖與 CutterSpec 在此時記下 (removal['engagement'])，量測階段換刀後仍使用該步的刀具。
+        """
+        if self.stepper is not None:
+            self.stepper.observe(0.0 if removal is None else removal['volume'] / scale)
+        if removal is not None and 'engagement' not in removal:
+            removal['engagement'] = None if self.cutter is None else (self.tool_tip_offset + np.asarray(pose[:3]), self.cutter)
+        item = (rows, simulation_mode, pose, removal, transform, step_angle, step_vector_actual, scale, line, time, feed, spindle_speed)
+        if self.metrics_stage is None:
+            self.store_row(self.measure_row(item))
+        else:
+            self.metrics_stage.put(item)
+
+    def measure_row(self, item):
+        """量測階段: 切削區域轉回機台座標，計算切寬、切深與 Plant 切削力"""
+        rows, simulation_mode, pose, removal, transform, step_angle, step_vector_actual, scale, line, time, feed, spindle_speed = item
+        removal = self.removal_to_machine(removal, transform)
+        return rows, self.cutting_row(simulation_mode, pose, removal, step_angle, step_vector_actual, scale, line, time,
+                                      feed, spindle_speed)
+
+    def store_row(self, result):
+        """儲存階段: 依步序把 cutting parameters 加到所屬路徑的列表"""
+        rows, row = result
+        rows.append(row)
+
+    def submit_domain_step(self, simulation_mode, current_pose, step_angle, step_vector_actual, scale, step_line, rows):
+        """
+        平行模式: 此步送到與刀具 AABB 重疊區域的工作程序，不等待結果；
+        已完成的步依步序取回後再組成 cutting parameters 加到 rows (自適應步長需要即時回饋，每步都等待結果)。
+        """
+        lower, upper = self.tool_bounds_in_stock()
+        tip, axis = self.tool_pose_in_stock(current_pose[:3])
+        bounds = None if self.occupancy.is_air(lower, upper) else (lower, upper)
+        self.stock.submit(bounds, tip, axis, self.tool_pose_in_workpiece(),
+                          (rows, current_pose.copy(), step_angle, step_vector_actual, scale, step_line, self.time,
+                           tip, axis, self.tool_profile, self.cutter, self.feed, self.spindle_speed,
+                           self.workpiece_transform.copy()))
+        self.collect_domain_steps(simulation_mode, 0 if self.stepper is not None else self.parallel_window)
+
+    def collect_domain_steps(self, simulation_mode, max_pending=0):
+        """依步序取回平行模式已完成的步，更新佔據網格、cutting parameters 與動畫紀錄"""
+        for removal, context in self.stock.collect(max_pending):
+            rows, pose, step_angle, step_vector, scale, line, time, tip, axis, profile, cutter, feed, spindle_speed, transform = context
+            if removal is not None:
+                self.occupancy.clear_tool(tip, axis, profile)
+                # 送出時的刀具 (取回前可能已換刀)，刀尖由材料模型座標轉回機台座標
+                removal['engagement'] = None if cutter is None else \
+                    (trimesh.transformations.transform_points([tip], transform)[0], cutter)
+            self.emit_row(simulation_mode, pose, removal, transform, step_angle, step_vector, scale, line, time, rows,
+                          feed, spindle_speed)
+            self.workpiece_for_anime.record(transform)
+
+    def step_sequence(self, trajectory, steps):
+        """
+        逐步取出一段路徑的軌跡。產生: pose, step_vector, step_angle, spin, time, line, scale, is_last
+        自適應步長時，空切且只有平移的連續步合併為一步 (掃過的 AABB 沒碰到材料、長度不超過 max_air_step)，
+        切削中的規劃步依 stepper 細分，細分步的姿態與時間在前後兩個規劃步之間線性插值。
+        """
+        segment_scale = trajectory.scale[trajectory.segment[steps.start]]
+        k = steps.start
+        while k < steps.stop:
+            if self.stepper is None:
+                yield (trajectory.pose[k], trajectory.step_vector[k], trajectory.step_angle[k], trajectory.spin[k],
+                       trajectory.time[k], trajectory.step_line[k], segment_scale, k == steps.stop - 1)
+                k += 1
+                continue
+
+            j, displacement = k, np.zeros(3)
+            while (j < steps.stop and not trajectory.step_angle[j].any()
+                   and norm(displacement + trajectory.step_vector[j]) <= self.stepper.max_air_step
+                   and self.tool_is_air(displacement + trajectory.step_vector[j])):
+                displacement = displacement + trajectory.step_vector[j]
+                j += 1
+            if j > k:
+                self.stepper.after_air = True
+                yield (trajectory.pose[j - 1], displacement, np.zeros(2), trajectory.spin[k:j].sum(), trajectory.time[j - 1],
+                       trajectory.step_line[j - 1], segment_scale * (j - k), j == steps.stop)
+                k = j
+                continue
+
+            self.stepper.enter_material()
+            previous_pose = trajectory.pose[k - 1] if k > steps.start else trajectory.start[trajectory.segment[k]]
+            previous_time = trajectory.time[k - 1] if k > 0 else 0.0
+            m = self.stepper.subdivisions(segment_scale)
+            for n in range(1, m + 1):
+                f = n / m
+                yield (previous_pose + f * (trajectory.pose[k] - previous_pose), trajectory.step_vector[k] / m,
+                       trajectory.step_angle[k] / m, trajectory.spin[k] / m,
+                       previous_time + f * (trajectory.time[k] - previous_time), trajectory.step_line[k],
+                       segment_scale / m, k == steps.stop - 1 and n == m)
+            k += 1
+    
+    def create_geometry_kernel(self):
+        """網格引擎的幾何核心: 'manifold3d' (工件與刀具全程保持為 Manifold) 或 'trimesh'"""
+        if self.geometry_kernel == 'trimesh':
+            return TrimeshKernel(self.workpiece, self.remesh_tolerance)
+        return ManifoldKernel(self.workpiece, self.remesh_tolerance)
+
+    def checkpoint_store(self, signature):
+        return CheckpointStore(os.path.join(self.base_path, "TemporarySaved", "checkpoints"), signature)
+
+    def run_signature(self, simulation_mode, tool_dict, tool_offset, paths=None):
+        """
+        模擬輸入 (載入的工件、刀具) 與模擬設定的雜湊值，paths 不為 None 時一併包含路徑。
+        檢查點只能由相同 signature (含路徑) 的模擬接續；增量模擬只比較不含路徑的 signature，路徑另外逐段比對。
+        """
+        digest = hashlib.sha1()
+        digest.update(np.ascontiguousarray(self.initial_workpiece().vertices, dtype=np.float64).tobytes())
+        # 旋轉中心不影響 C/A 偏角為 0 時的工件頂點，但決定每步的旋轉與切削幾何，另外加入
+        digest.update(repr((simulation_mode, tool_dict, tool_offset, self.c_center, self.a_center,
+                            self.simulation_step, self.stock_engine,
+                            self.stock_resolution, self.sweep_batch_steps, self.tile_size, self.remesh_tolerance,
+                            self.geometry_kernel, self.tool_model, self.path_tolerance, self.adaptive_step, self.min_step,
+                            self.max_step, self.max_chord_error, self.engagement_tolerance, self.broad_phase_cell)).encode())
+        if paths is not None:
+            digest.update(repr(paths).encode())
+        return digest.hexdigest()
+
+    def initial_workpiece(self):
+        """模擬開始時的工件: 載入的工件 (模擬結束後 self.workpiece 為切削後的工件)"""
+        return self.workpiece if self.loaded_workpiece is None else self.loaded_workpiece
+
+    def result_cache(self):
+        directory = self.result_cache_dir or os.path.join(self.base_path, "TemporarySaved", "result_cache")
+        return ResultCache(directory, self.result_cache_size * 1024 * 1024)
+
+    def result_cache_key(self, simulation_mode, tool_dict, tool_offset):
+        """
+        結果快取的鍵: 模擬輸入與設定的 signature (含解析後的路徑) 再加上工件網格的面與刀具檔案的內容，
+        刀具檔案內容改變 (路徑相同) 也不會命中舊的結果
+        """
+        digest = hashlib.sha256(f"{RESULT_CACHE_VERSION}".encode())
+        digest.update(self.run_signature(simulation_mode, tool_dict, tool_offset, self.cut_paths).encode())
+        digest.update(np.ascontiguousarray(self.initial_workpiece().faces, dtype=np.int64).tobytes())
+        for tool_id in sorted(tool_dict):
+            filepath = tool_dict[tool_id][0]
+            digest.update(tool_id.encode())
+            if filepath and os.path.exists(filepath):
+                with open(filepath, 'rb') as f:
+                    digest.update(hashlib.sha256(f.read()).digest())
+        return digest.hexdigest()
+
+    def cached_run(self, max_bytes=None):
+        """
+        序列化完成的模擬結果 (結果快取): cutting parameters、切削後的工件、動畫紀錄與模擬的路徑及 Trajectory。
+        序列化前先估計大小，超過 max_bytes 時返回 None (網格引擎的動畫紀錄每步一份網格，不先轉成陣列)
+        """
+        run = {'cutting_parameters': np.asarray(self.cutting_parameters),
+               'simulated_paths': self.simulated_paths, 'trajectory': self.trajectory,
+               'workpiece': (np.asarray(self.workpiece.vertices), np.asarray(self.workpiece.faces)),
+               'frames': self.workpiece_for_anime, 'tool_frames': list(self.tool_for_anime)}
+        if max_bytes is not None and estimated_nbytes(run) > max_bytes:
+            return None
+        return pickle.dumps(run, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def restore_cached_run(self, cached):
+        self.cutting_parameters = cached['cutting_parameters']
+        vertices, faces = cached['workpiece']
+        self.workpiece = trimesh.Trimesh(vertices=vertices, faces=faces, process=False)
+        self.workpiece_for_anime = cached['frames']
+        self.tool_for_anime = cached['tool_frames']
+        self.simulated_paths = cached['simulated_paths']
+        self.set_trajectory(cached['trajectory'])
+        # 材料模型與快照不在快取中，下一次模擬不能增量接續
+        self.stock = self.kernel = None
+        self.snapshots, self.previous_run = {}, None
+
+    def capture_snapshot(self, path_index, progress_value, current_tool_id):
+        """
+        在第 path_index 段開始前序列化模擬狀態: 材料模型或幾何核心 (不含動畫紀錄)、佔據網格、
+        工件轉換與刀具姿態、Plant 歷史、時間、進度、自適應步長狀態與已完成的步數 (cutting parameters 列數)。
+        """
+        if self.metrics_stage is not None:
+            self.metrics_stage.flush()  # 已送出的步都寫入 cutting_parameters
+        model = self.stock if self.stock is not None else self.kernel
+        frames, model.frames = model.frames, None
+        try:
+            snapshot = {
+                'path_index': path_index,
+                'progress': progress_value,
+                'tool_id': current_tool_id,
+                'row_count': sum(len(rows) for rows in self.cutting_parameters),
+                'stock': self.stock,
+                'kernel': self.kernel,
+                'occupancy': self.occupancy,
+                'workpiece_transform': self.workpiece_transform,
+                'tool_pose': self.tool_pose,
+                'tool': self.tool,
+                'plant': self.plant,
+                'time': self.time,
+                'stepper': self.stepper,
+            }
+            return pickle.dumps(snapshot, protocol=pickle.HIGHEST_PROTOCOL)
+        finally:
+            model.frames = frames
+
+    def restore_snapshot(self, snapshot, tool_dict, tool_offset, frames=None):
+        """
+        由快照還原模擬狀態 (取代依目前設定新建的材料模型或幾何核心)。
+        frames 為沿用的動畫紀錄 (截到快照的步數)，None 時建立空的紀錄。返回快照內容
+        """
+        if snapshot['stock'] is not None:
+            self.stock = snapshot['stock']
+            self.stock.frames = StockFrames(self.stock) if frames is None else frames.truncate(snapshot['row_count'], self.stock)
+            self.workpiece_for_anime = self.stock.frames
+        else:
+            self.kernel = snapshot['kernel']
+            self.kernel.frames = KernelFrames(self.kernel) if frames is None else frames.truncate(snapshot['row_count'], self.kernel)
+            self.workpiece_for_anime = self.kernel.frames
+        self.occupancy = snapshot['occupancy']
+        self.workpiece_transform = snapshot['workpiece_transform']
+        self.plant = snapshot['plant']
+        self.time = snapshot['time']
+        self.stepper = snapshot['stepper']
+
+        current_tool_id = snapshot['tool_id']
+        if current_tool_id:
+            self.alignment_tool_and_offset(tool_dict[current_tool_id][0], tool_offset, tool_dict[current_tool_id][1])
+            self.tool = self.simplify_mesh(self.tool, max_faces=10000, reduction_ratio=0.5)
+            self.update_tool_profile()
+        if self.kernel is not None:
+            self.kernel.set_tool(self.tool)
+        # 刀具輪廓與幾何核心的基準刀具取自載入時的刀具，目前位置的刀具網格直接還原 (避免重新套用姿態的捨入誤差)
+        self.tool = snapshot['tool']
+        self.tool_pose = snapshot['tool_pose']
+        return snapshot
+
+    def save_checkpoint(self, store, signature, snapshot):
+        """檢查點 = 快照 + 已完成的 cutting parameters (模擬中斷後重新開啟時沒有上次的結果可沿用)"""
+        store.save(pickle.dumps({'signature': signature, 'snapshot': snapshot, 'cutting_parameters': self.cutting_parameters},
+                                protocol=pickle.HIGHEST_PROTOCOL))
+
+    def restore_checkpoint(self, checkpoint, tool_dict, tool_offset):
+        """
+        由檢查點還原模擬狀態，檢查點之前的動畫幀以檢查點當時的工件與刀具補齊，使幀數與 cutting parameters 的步數一致。
+        返回: path_index, progress_value, current_tool_id
+        """
+        snapshot = self.restore_snapshot(pickle.loads(checkpoint['snapshot']), tool_dict, tool_offset)
+        self.cutting_parameters = checkpoint['cutting_parameters']
+        for _ in range(snapshot['row_count']):
+            self.workpiece_for_anime.record(self.workpiece_transform)
+            self.tool_for_anime.append((self.tool.vertices, self.tool.faces))
+        return snapshot['path_index'], snapshot['progress'], snapshot['tool_id']
+
+    def keep_snapshot(self, path_index, snapshot):
+        """增量模擬的快照留在記憶體；超過 snapshot_limit 份時由最新往前每隔一份刪除，較舊的快照逐漸變疏"""
+        self.snapshots[path_index] = snapshot
+        if len(self.snapshots) > self.snapshot_limit:
+            for index in sorted(self.snapshots)[-2::-2]:
+                del self.snapshots[index]
+
+    def resume_previous_run(self, signature, tool_dict, tool_offset):
+        """
+        增量模擬: 上一次完成的模擬與這次的設定相同 (不含路徑的 signature) 時，找出第一段與上次不同的路徑，
+        由該段 (含) 之前最近的快照還原，快照之前的 cutting parameters、動畫幀直接沿用上次的結果。
+        之後的快照已失效而刪除。返回: path_index, progress_value, current_tool_id；無法沿用時返回 None
+        """
+        previous, self.previous_run = self.previous_run, None
+        if previous is None or previous['signature'] != signature:
+            self.snapshots = {}
+            return None
+        changed = next((i for i, (old, new) in enumerate(zip(previous['paths'], self.simulated_paths)) if repr(old) != repr(new)),
+                       min(len(previous['paths']), len(self.simulated_paths)))
+        self.snapshots = {i: snapshot for i, snapshot in self.snapshots.items() if i <= changed}
+        if not self.snapshots:
+            return None
+        snapshot = self.restore_snapshot(pickle.loads(self.snapshots[max(self.snapshots)]), tool_dict, tool_offset,
+                                         previous['frames'])
+        count = snapshot['row_count']
+        self.tool_for_anime = previous['tool_frames'][:count]
+        rows = [row for chunk in previous['rows'] for row in chunk][:count]
+        self.cutting_parameters = [rows] if rows else []
+        return snapshot['path_index'], snapshot['progress'], snapshot['tool_id']
+    
+    def move_tool(self, matrix):
+        """移動刀具網格 (動畫與 AABB 用) 並累積刀具姿態，幾何核心以姿態矩陣移動刀具"""
+        self.tool.apply_transform(matrix)
+        self.tool_pose = matrix @ self.tool_pose
             
     def get_rotation_matrix_C(self, angle_rad, center):
         rotation_matrix_C = trimesh.transformations.rotation_matrix(
@@ -414,11 +970,21 @@ class SimpleCam(GcodeParser):
         else:
             raise ValueError(f"Unknown method: {method}")
     
+    def apply_settings(self, settings):
+        """套用 SimulationWidget 的設定字典 (即專案檔的 settings) 中的模擬設定，缺少的鍵使用預設值"""
+        for key, name, default in SIMULATION_SETTINGS:
+            setattr(self, name, settings.get(key, default))
+
     def calculate_cutting_volume(self, simulation_mode, progress, workpiece_filePath, tool_filePath, workpiece_offset, tool_offset, gcode, controller, tool_dict, gcode_is_altered):
+        """progress: QProgressBar 等有 setValue / setFormat 的物件，或回呼 progress(fraction)，或 None"""
+        progress = as_progress(progress)
         self.plant = Plant()
-        filepath = list(tool_dict.values())[0][0]  #第1把刀具檔案路徑
-        self.alignment_tool_and_offset(filepath, tool_offset)
+        # 由載入的工件開始，不再切削上一次模擬切削後的工件 (介面未重新載入工件時)
+        self.workpiece = self.initial_workpiece().copy()
+        filepath, tool_info = list(tool_dict.values())[0]  #第1把刀具檔案路徑與刀具資訊
+        self.alignment_tool_and_offset(filepath, tool_offset, tool_info)
         self.tool = self.simplify_mesh(self.tool, max_faces=10000, reduction_ratio=0.5)
+        self.update_tool_profile()
         self.step = []
         self.final_workpiece_coords = []
         self.workpiece_for_anime = []
@@ -426,10 +992,10 @@ class SimpleCam(GcodeParser):
         self.cutting_distance = []
         self.cutting_parameters = []
         self.epsilon = 1e-6
+        self.control.reset()
+        self.cancelled = False
         self.time = 0
     
-        workpiece_coord = np.array([0.0, 0.0, 0.0])
-        workpiece_angle = np.array([0.0, 0.0])  # C A 軸
         progress_value = 0.0
     
         if gcode:
@@ -437,254 +1003,262 @@ class SimpleCam(GcodeParser):
             if gcode_is_altered:
                 self.parse_gcode(self.gcode, controller)
 
-        total_paths = len(self.cut_paths)
+        # 相同輸入與設定的完整結果已在快取中時直接載入
+        cache = cache_key = None
+        if self.result_cache_size > 0:
+            cache = self.result_cache()
+            cache_key = self.result_cache_key(simulation_mode, tool_dict, tool_offset)
+            cached = cache.load(cache_key)
+            if cached is not None:
+                self.restore_cached_run(cached)
+                print("Simulation results loaded from the result cache.")
+                self.export_results()
+                progress.setValue(1000)
+                progress.setFormat(f"{1000 / 10:.1f} %")
+                return True
+
+        self.stock = self.create_stock_model(self.resolved_stock_engine(tool_dict))
+        self.workpiece_transform = np.eye(4)
+        self.occupancy = OccupancyGrid(self.workpiece, self.broad_phase_cell)
+        self.tool_pose = np.eye(4)
+        if self.stock is not None:
+            self.kernel = None
+            self.workpiece_for_anime = self.stock.frames
+            if isinstance(self.stock, DomainDecomposedStock):
+                self.stock.set_tool(self.tool, self.tool_profile)
+        else:
+            self.kernel = self.create_geometry_kernel()
+            self.kernel.set_tool(self.tool)
+            self.workpiece_for_anime = self.kernel.frames
+
+        # 管線: 主執行緒 (運動學已預先算好) 負責材料移除 -> 量測階段 (切寬/切深/切削力) -> 儲存階段
+        self.metrics_stage = None
+        if self.pipelined:
+            storage_stage = PipelineStage('storage', self.store_row, maxsize=self.pipeline_queue_size)
+            self.metrics_stage = PipelineStage('metrics', self.measure_row, storage_stage, maxsize=self.pipeline_queue_size)
+
+        self.stepper = None
+        if self.adaptive_step:
+            # 格點引擎的步長小於格點間距時切削量只剩量化雜訊，最小步長不小於 stock_resolution
+            min_step = self.min_step
+            if self.stock is not None and self.stock_engine != 'Tiled Mesh':
+                min_step = max(min_step, self.stock_resolution)
+            self.stepper = AdaptiveStepper(min_step, self.max_step, self.max_chord_error, self.engagement_tolerance)
+            self.update_tool_profile()
+        # 路徑壓縮 (選用): 微小 G1 合併為直線/圓弧後再模擬，逐步的行號仍對應回原始 G-code
+        self.simulated_paths = (compress_cut_paths(self.cut_paths, self.path_tolerance) if self.path_tolerance > 0
+                                else self.cut_paths)
+        self.set_trajectory(self.plan_trajectory(self.simulated_paths))
+        trajectory = self.trajectory
+
+        total_paths = len(self.simulated_paths)
         current_tool_id = ''
+
+        # 檢查點與快照 (平行模式的材料模型在工作程序中，不支援): 有相同輸入與設定的未完成模擬時由最新的檢查點接續，
+        # 否則與上一次完成的模擬比對路徑，由第一段變動之前最近的快照接續 (增量模擬)
+        store = signature = settings_signature = None
+        start_index = steps_since_checkpoint = 0
+        if self.checkpoint_interval > 0 and not isinstance(self.stock, DomainDecomposedStock):
+            settings_signature = self.run_signature(simulation_mode, tool_dict, tool_offset)
+            signature = self.run_signature(simulation_mode, tool_dict, tool_offset, self.cut_paths)
+            store = self.checkpoint_store(signature)
+            checkpoint = store.load(signature) if self.resume_checkpoint else None
+            resumed = None
+            if checkpoint is not None:
+                self.snapshots, self.previous_run = {}, None
+                resumed = self.restore_checkpoint(checkpoint, tool_dict, tool_offset)
+                print(f"Resuming simulation from checkpoint at G-code line {self.simulated_paths[resumed[0]]['line_number']}.")
+            elif self.incremental:
+                resumed = self.resume_previous_run(settings_signature, tool_dict, tool_offset)
+                if resumed is not None:
+                    print(f"Re-simulating from G-code line {self.simulated_paths[resumed[0]]['line_number']} "
+                          f"(earlier results reused).")
+            else:
+                self.snapshots, self.previous_run = {}, None
+            if resumed is not None:
+                start_index, progress_value, current_tool_id = resumed
+        else:
+            self.snapshots, self.previous_run = {}, None
         # try:
-        for i, path_info in enumerate(self.cut_paths):
+        for i, path_info in enumerate(self.simulated_paths):
+            if i < start_index:
+                continue
+            if not self.control.proceed():
+                self.cancelled = True
+                break
+            if store is not None and i > start_index and (steps_since_checkpoint >= self.checkpoint_interval or
+                                                           path_info['current_tool'] not in (None, current_tool_id)):
+                snapshot = self.capture_snapshot(i, progress_value, current_tool_id)
+                self.save_checkpoint(store, signature, snapshot)
+                if self.incremental:
+                    self.keep_snapshot(i, snapshot)
+                steps_since_checkpoint = 0
             # 从新的数据结构中提取信息
             command = path_info['motion_mode']
-            gcode_lineNumber = path_info['line_number']
-            target_pose = path_info['target_pose']
             FeedCommand = path_info['feed']
             SpindleSpeed = path_info['spindle_speed']
-            arc_params = path_info['arc_params']  # 圆弧参数
             current_tool = path_info['current_tool']  # 当前刀具的刀號字串
+            workpiece_coord = trajectory.start[i][:3]
             if current_tool != None:
                 if current_tool_id != current_tool:
                     current_tool_id = current_tool
-                    self.alignment_tool_and_offset(tool_dict[current_tool_id][0], tool_offset)
+                    self.alignment_tool_and_offset(tool_dict[current_tool_id][0], tool_offset, tool_dict[current_tool_id][1])
                     self.tool = self.simplify_mesh(self.tool, max_faces=10000, reduction_ratio=0.5)
-                    self.tool.apply_translation(workpiece_coord)
+                    self.update_tool_profile()
+                    self.tool_pose = np.eye(4)
+                    if self.kernel is not None:
+                        self.kernel.set_tool(self.tool)
+                    elif isinstance(self.stock, DomainDecomposedStock):
+                        self.stock.set_tool(self.tool, self.tool_profile)
+                    self.move_tool(trimesh.transformations.translation_matrix(workpiece_coord))
                     
                     
             self.feed, self.spindle_speed = FeedCommand, SpindleSpeed
             max_progress_increase = 1000.0 / total_paths
-            vector = target_pose[:3] - workpiece_coord
-            angle = target_pose[3:] - workpiece_angle
-            magnitude = norm(vector)
-            
-            radius_c = norm(np.array([self.workpiece.bounds[1][0], self.workpiece.centroid[1], self.workpiece.centroid[2]]) - self.c_center)
-            C_movement = radius_c * deg2rad(abs(angle[0]))
-    
-            radius_a = norm(np.array([self.workpiece.centroid[0], self.workpiece.centroid[1], self.workpiece.bounds[1][2]]) - self.a_center)
-            A_movement = radius_a * deg2rad(abs(angle[1]))
+            steps = trajectory.steps(i)
+            steps_since_checkpoint += len(steps)
     
-            if magnitude == 0 and C_movement == 0 and A_movement == 0:
+            if len(steps) == 0:
                 progress_value = max(0.0, progress_value + max_progress_increase)
                 progress.setValue(min(int(round(progress_value)), 1000))
                 progress.setFormat(f"{progress_value / 10:.1f} %")  # 顯示小數點一位
                 continue
     
+            # 平行模式的結果會晚於迴圈取回，先把此段的列表放入 cutting_parameters
             temp_cutting_parameters = []
-    
-            # 处理圆弧插补
-            is_arc_move = command in ['G2', 'G3', 'G02', 'G03'] and arc_params
-            
-            if command == 'G0':
-                step = 5
-                effective_distance = max(magnitude, C_movement, A_movement)  # For G0, use magnitude
-                scale = effective_distance / step
-                step_vector = vector / step
-                step_angle = angle / step
-                angle_per_step_for_tool = 0
-            elif is_arc_move:
-                # 圓弧插補處理 (G2/G3)
-                start_point = workpiece_coord
-                end_point = target_pose[:3]
-
-                # 1. 統一計算圓弧參數，並處理 IJK/R 特殊情況
-                center, radius, sweep_angle_rad, arc_distance, is_linear_move = self.get_arc_params(
-                    start_point, end_point, arc_params, command
-                )
-                
-                if is_linear_move:
-                    # 圓弧退化為 G1 (直線) 或 R 模式 d > 2R 的簡化處理
-                    is_arc_move = False # 確保進入 G1 邏輯
-                    effective_distance = max(magnitude, C_movement, A_movement) # 直線距離
-                else:
-                    # 正常圓弧路徑
-                    effective_distance = max(arc_distance, C_movement, A_movement)
-
-                if is_arc_move:
-                    # 2. 確定步數和每一小步的參數 (使用弧長 arc_distance)
-                    step = ceil(effective_distance / self.simulation_step)
-                    step = max(1, int(step))  # 防止 step = 0
-                    
-                    scale = arc_distance / step # 每一小步的弧長 (用於時間和體積計算)
-                    step_angle_rad = sweep_angle_rad / step # 每一小步的掃掠角度 (XY 平面)
-                    
-                    # Z 軸的線性變化
-                    step_z = vector[2] / step
-                    
-                    # C 軸和 A 軸的線性變化
-                    step_angle = angle / step
-                    
-                    time = scale / (self.feed / 60)
-                    angle_per_step_for_tool = self.spindle_speed / 60 * 360 * time
-                    
-                    self.cutting_distance.append(arc_distance)
-                    self.step.append(scale)
-                    # print(f"圓弧插補: {command}, 半徑: {radius:.3f}, 弧長: {arc_distance:.3f}, 步數: {step}")
-                
-            if not is_arc_move:
-                # G1 或 G2/G3 退化為 G1 的情況
-                effective_distance = max(magnitude, C_movement, A_movement)
-                step = ceil(effective_distance / self.simulation_step)
-                step = max(1, int(step))  # 防止 step = 0
-                scale = effective_distance / step
-                step_vector = vector / step
-                step_angle = angle / step
-                if self.feed and self.feed > 0:
-                    time = scale / (self.feed / 60)
-                else:
-                    time = 0
-                angle_per_step_for_tool = self.spindle_speed / 60 * 360 * time
-                
-                self.cutting_distance.append(effective_distance)
-                self.step.append(scale)
+            self.cutting_parameters.append(temp_cutting_parameters)
+            step_progress = max_progress_increase / (trajectory.scale[i] * len(steps))  # 每 mm 的進度
 
-            step_progress = max_progress_increase / step
+            # 掃掠體積模式: 刀具姿態都在工件座標系，含 C/A 旋轉的路徑也可合併步數
+            sweep_batch = 0
+            if self.stock is None and self.sweep_batch_steps != 1:
+                sweep_batch = len(steps) if self.sweep_batch_steps <= 0 else int(self.sweep_batch_steps)
+                sweep_start = self.tool_pose_in_workpiece()
+                sweep_steps = []
             
-            for step_index in range(int(step)):
-                
-                if command in ['G2', 'G3', 'G02', 'G03'] and is_arc_move:
-                    # G2/G3 圓弧模擬
-                    
-                    # 1. 計算旋轉矩陣 (繞圓心)
-                    rotation_matrix_xy_for_tool = trimesh.transformations.rotation_matrix(
-                        step_angle_rad,  # 掃掠角度
-                        [0, 0, 1],      # 繞 Z 軸旋轉 (假設 G17: XY 平面) 順時針
-                        point=self.tool.centroid + (center - workpiece_coord)     # 圓心
-                    )
-                    
-                    
-                    # 2. 應用旋轉和平移
-                    self.tool.apply_transform(rotation_matrix_xy_for_tool)
-                    self.tool.apply_translation([0, 0, step_z])
-                    
-                    # 3. 計算實際移動向量 (用於更新 workpiece_coord)
-                    # 找到目前刀具位置
-                    current_tool_position = workpiece_coord
-                    
-                    point_to_rotate = np.array([current_tool_position]) 
-                    
-                    rotation_matrix_xy_for_coord_track = trimesh.transformations.rotation_matrix(
-                        step_angle_rad,  # 掃掠角度
-                        [0, 0, 1],      # 繞 Z 軸旋轉 (假設 G17: XY 平面) 順時針
-                        point=center     # 圓心
-                    )
-                    # 旋轉後的 XY 位置
-                    # 註：transform_points 返回的也是 N x 3 數組，我們取第一個點的 XYZ
-                    rotated_point = trimesh.transformations.transform_points(
-                        point_to_rotate, 
-                        rotation_matrix_xy_for_coord_track
-                    )[0] # [0] 取得單個點的 [X, Y, Z] 陣列
-                    
-                    # 新的刀具位置 (旋轉後的 XY + Z 平移)
-                    new_tool_position = rotated_point + np.array([0, 0, step_z])
-                    
-                    step_vector_actual = new_tool_position - current_tool_position
-                    
-                else:
-                    # G0/G1 (或 G2/G3 退化) 的線性模擬
-                    self.tool.apply_translation(step_vector)
-                    step_vector_actual = step_vector
+            for current_pose, step_vector_actual, step_angle, spin, step_time, step_line, scale, is_last in \
+                    self.step_sequence(trajectory, steps):
+                # 暫停 / 取消 (掃掠體積模式在一批步數之間才處理，已移動的刀具都有對應的切削結果)
+                if not (sweep_batch and sweep_steps) and not self.control.proceed():
+                    self.cancelled = True
+                    break
+                # 刀具移動取自預先算好的軌跡 (G17 圓弧時刀具隨圓弧繞自身刀軸轉動)
+                if spin:
+                    self.move_tool(trimesh.transformations.rotation_matrix(spin, [0, 0, 1],
+                                                                           point=self.tool_tip_offset + workpiece_coord))
+                self.move_tool(trimesh.transformations.translation_matrix(step_vector_actual))
                 
                 # 刀具主軸旋轉 (C 軸)
                 if simulation_mode == 'Accurate':
                     # ... (刀具主軸旋轉代碼不變)
                     time = scale / (self.feed / 60) # 使用弧長或有效距離
                     angle_per_step_for_tool = self.spindle_speed / 60 * 360 * time
-                    self.tool.apply_transform(self.get_rotation_matrix_C(deg2rad(angle_per_step_for_tool), self.tool.centroid))
+                    if self.cutter is None:  # 參數化刀具為迴轉體，主軸旋轉不改變刀具幾何
+                        self.move_tool(self.get_rotation_matrix_C(deg2rad(angle_per_step_for_tool), self.tool.centroid))
                 
-                # 工件 C/A 軸旋轉
-                self.workpiece.apply_transform(
-                    self.get_rotation_matrix_C(deg2rad(step_angle[0]), self.c_center) @
-                    self.get_rotation_matrix_A(deg2rad(step_angle[1]), self.a_center)
-                )
-
-                # ... (時間計算)
-                if command == 'G0':
-                    self.time += norm(step_vector_actual) / (3000 / 60) # 使用實際移動距離
-                else:
-                    self.time += scale / (self.feed / 60) # 使用弧長或有效距離
+                # 工件 C/A 軸旋轉 (工件不動，只累積轉換矩陣；刀具以其逆轉換轉到工件座標系)
+                rotation_matrix_CA = (self.get_rotation_matrix_C(deg2rad(step_angle[0]), self.c_center) @
+                                      self.get_rotation_matrix_A(deg2rad(step_angle[1]), self.a_center))
+                self.workpiece_transform = rotation_matrix_CA @ self.workpiece_transform
 
-                # 更新工件座標 (即刀具的絕對位置)
-                workpiece_coord += step_vector_actual
-                workpiece_angle += step_angle
-                current_pose = concatenate((workpiece_coord, workpiece_angle))
-                self.final_workpiece_coords.append(current_pose)
+                # 時間與工件座標 (即刀具的絕對位置) 取自軌跡
+                self.time = step_time
+                workpiece_coord = current_pose[:3]
     
                 # try:
-                intersection = boolean_manifold([self.workpiece, self.tool], operation='intersection', check_volume=False)
-
-                if intersection.is_empty:
-                    temp_cutting_parameters.append(concatenate((current_pose, [0, 0, 0, gcode_lineNumber, self.time, 0])))
-                else:
-                    self.workpiece = self.simplify_mesh(self.workpiece)
-                    self.workpiece = boolean_manifold([self.workpiece, self.tool], operation='difference', check_volume=False)
-
-                    # Modified width and depth calculation
-                    tool_axis = np.array([0.0, 0.0, 1.0])
-                    omega_C = np.array([0.0, 0.0, deg2rad(step_angle[0])])
-                    omega_A = np.array([deg2rad(step_angle[1]), 0.0, 0.0])
-                    inter_centroid = intersection.centroid
-                    disp_C = np.cross(omega_C, inter_centroid - self.c_center)
-                    disp_A = np.cross(omega_A, inter_centroid - self.a_center)
-                    feed_vector = disp_C + disp_A - step_vector_actual
-                    feed_norm = np.linalg.norm(feed_vector)
-
-                    if feed_norm < self.epsilon:
-                        width = 0.0
-                        depth = 0.0
-                        cross_area = 0.0  # Optional: set volume to 0 if no movement
-                    else:
-                        projs_z = np.dot(intersection.vertices, tool_axis)
-                        depth = np.max(projs_z) - np.min(projs_z)
-
-                        volume = intersection.volume
-                        cross_area = volume / scale  # cross area
-                        if simulation_mode == 'Accurate':
-                            width = cross_area / depth
+                if sweep_batch:
+                    # 先暫存此步，滿一批 (或路徑結束) 時一次做布林運算
+                    sweep_steps.append((current_pose.copy(), (step_time, step_line, scale, step_angle), step_vector_actual,
+                                        self.tool_pose_in_workpiece(), self.tool_is_air(), self.workpiece_transform.copy()))
+                    if len(sweep_steps) == sweep_batch or is_last:
+                        if all(s[4] for s in sweep_steps):
+                            removals = [None] * len(sweep_steps)
                         else:
-                            unit_vector = feed_vector / feed_norm
-                            cross_dir = np.cross(tool_axis, unit_vector)
-                            cross_norm = np.linalg.norm(cross_dir)
-                            verts = intersection.vertices
-                            if cross_norm < self.epsilon:
-                                width = 0.0  # Plunging case
-                            else:
-                                width_dir = cross_dir / cross_norm
-                                projs = np.dot(verts, width_dir)
-                                width = np.max(projs) - np.min(projs)
-                    if self.spindle_speed == 0:
-                        self.current_simulated_cutting_force = 0 
+                            removals = self.kernel.sweep([sweep_start] + [s[3] for s in sweep_steps], self.epsilon)
+                        for (pose, (time_stamp, line, step_scale, angle_step), vector_actual, _, _, transform), removal in \
+                                zip(sweep_steps, removals):
+                            if removal is not None:
+                                self.clear_occupancy(pose[:3], transform)
+                            self.emit_row(simulation_mode, pose, removal, transform, angle_step, vector_actual, step_scale, line,
+                                          time_stamp, temp_cutting_parameters, self.feed, self.spindle_speed)
+                            self.workpiece_for_anime.record(transform)
+                        sweep_start = sweep_steps[-1][3]
+                        sweep_steps = []
+                elif isinstance(self.stock, DomainDecomposedStock):
+                    self.submit_domain_step(simulation_mode, current_pose, step_angle, step_vector_actual, scale, step_line,
+                                            temp_cutting_parameters)
+                else:
+                    if self.tool_is_air():
+                        removal = None
+                    elif self.stock is None:
+                        removal = self.kernel.cut(self.tool_pose_in_workpiece())
                     else:
-                        self.current_simulated_cutting_force = self.plant.run_plant(width, depth, self.spindle_speed, self.feed)
-                    temp_cutting_parameters.append(concatenate((current_pose, [width, depth, cross_area, gcode_lineNumber, self.time, self.current_simulated_cutting_force])))
+                        removal = self.stock_remove_tool(workpiece_coord)
+                    if removal is not None:
+                        self.clear_occupancy(workpiece_coord)
+                    # 切寬/切深/切削力交給量測階段，主執行緒直接進行下一步的材料移除
+                    self.emit_row(simulation_mode, current_pose, removal, self.workpiece_transform, step_angle, step_vector_actual,
+                                  scale, step_line, self.time, temp_cutting_parameters, self.feed, self.spindle_speed)
+    
+                    # 儲存動畫資料 (只記錄工件參考或狀態差異與轉換矩陣，顯示時才重建網格)
+                    self.workpiece_for_anime.record(self.workpiece_transform)
     
                 # except Exception as e:
                 #     print(e)
-    
-                # 儲存動畫資料
-                self.workpiece_for_anime.append((self.workpiece.vertices, self.workpiece.faces))
                 self.tool_for_anime.append((self.tool.vertices, self.tool.faces))
     
                 # 修正：避免負數，使用 round
-                progress_value = max(0.0, progress_value + step_progress)
+                progress_value = max(0.0, progress_value + step_progress * scale)
                 progress.setValue(min(int(round(progress_value)), 1000))
                 progress.setFormat(f"{progress_value / 10:.1f} %")  # 顯示小數點一位
-    
-            if temp_cutting_parameters:
-                self.cutting_parameters.append(temp_cutting_parameters)
+            if self.cancelled:
+                break
         # except Exception as e:
         #     print('2',e)
             # parent = QApplication.activeWindow()  # 自動抓目前的活動視窗
-            # QMessageBox.critical(parent, "錯誤", f"{gcode_lineNumber}發生例外：{e}")
+            # QMessageBox.critical(parent, "錯誤", f"{path_info['line_number']}發生例外：{e}")
         
+        if isinstance(self.stock, DomainDecomposedStock):
+            self.collect_domain_steps(simulation_mode)
+            self.stock.finish()
+        if self.metrics_stage is not None:
+            self.metrics_stage.close()  # 等待量測與儲存階段處理完所有步
+            self.metrics_stage = None
+        if self.cancelled:
+            # 保留已完成的結果與檢查點 (下次以相同輸入模擬時由檢查點接續)
+            print(f"Simulation cancelled at G-code line {path_info['line_number']}.")
+        elif store is not None:
+            store.clear()  # 模擬已完成，不再需要接續
+            if self.incremental:
+                self.previous_run = {'signature': settings_signature, 'paths': self.simulated_paths,
+                                     'rows': self.cutting_parameters, 'frames': self.workpiece_for_anime,
+                                     'tool_frames': self.tool_for_anime}
+        self.workpiece = self.kernel.to_trimesh() if self.stock is None else self.stock.to_trimesh()
+        self.workpiece.apply_transform(self.workpiece_transform)
+        self.export_results()
+        if cache is not None and not self.cancelled:
+            try:
+                run = self.cached_run(cache.max_bytes)
+                if run is None:
+                    print("Simulation results exceed 'Result Cache Size' and are not cached.")
+                else:
+                    cache.save(cache_key, run)
+            except Exception as e:
+                print(f"Simulation results could not be stored in the result cache: {e}")
+    
+        if self.cancelled:
+            progress.setFormat(f"Cancelled ({progress_value / 10:.1f} %)")
+            return False
+
+        # 強制收尾到 100%
+        progress.setValue(1000)
+        progress.setFormat(f"{1000 / 10:.1f} %")  # 顯示小數點一位
+        return True
+
+    def export_results(self):
+        """匯出切削後的工件 (STL) 與 cutting parameters (CSV)，cutting parameters 轉成陣列並建立查詢"""
         try:
-            base_path = self.pj_manager.get_base_path()
-            save_dir = os.path.join(base_path, "TemporarySaved", "3d_model")
+            save_dir = os.path.join(self.base_path, "TemporarySaved", "3d_model")
             os.makedirs(save_dir, exist_ok=True)  # 自動建立資料夾
             export_filepath = os.path.join(save_dir, "cutted_workpiece.stl")
             self.workpiece.export(export_filepath)
@@ -692,8 +1266,7 @@ class SimpleCam(GcodeParser):
             if isinstance(self.cutting_parameters, list):
                 self.cutting_parameters = np.concatenate(self.cutting_parameters, axis=0)
         
-            base_path = self.pj_manager.get_base_path()
-            save_dir = os.path.join(base_path, "TemporarySaved", "data")
+            save_dir = os.path.join(self.base_path, "TemporarySaved", "data")
             os.makedirs(save_dir, exist_ok=True)  # 自動建立資料夾
             export_filepath = os.path.join(save_dir, "all_cutting_parameters.csv")
             columns = ['X', 'Y', 'Z', 'C', 'A', 'Width', 'Depth', 'cross_area', 'GcodeLineNumber', 'Time', 'Simulated Cutting Force']
@@ -704,8 +1277,61 @@ class SimpleCam(GcodeParser):
             print('3', e)
             # parent = QApplication.activeWindow()  # 自動抓目前的活動視窗
             # QMessageBox.critical(parent, "錯誤", f"發生例外：{e}")
-    
-        # 強制收尾到 100%
-        progress.setValue(1000)
-        progress.setFormat(f"{1000 / 10:.1f} %")  # 顯示小數點一位
-        return True
\ No newline at end of file
+
+    def preview_model(self):
+        """
+        粗略預覽用的複本: 步長放大 preview_step_factor 倍、格點間距 preview_resolution 的 Z-map
+        (含 C/A 旋轉的程式改用 Tri-dexel)，固定步長、不平行、不存檢查點與快照，不影響本身的設定與增量模擬狀態。
+        本身的結果、材料模型與快照不帶入，其餘可變的狀態 (工件、路徑與解析結果) 為深複製，不與本身共用；
+        控制以本身的控制為上層: 完整模擬的暫停 / 取消也作用在預覽，預覽的不影響完整模擬。
+        """
+        preview = copy.copy(self)
+        preview.step, preview.cutting_distance, preview.final_workpiece_coords = [], [], []
+        preview.workpiece_for_anime, preview.tool_for_anime, preview.cutting_parameters = [], [], []
+        preview.simulated_paths = []
+        preview.stock = preview.kernel = preview.stepper = preview.metrics_stage = preview.trajectory = None
+        preview.plant = preview.CuttingPara_query = None
+        preview.snapshots, preview.previous_run = {}, None
+        for name, value in list(vars(preview).items()):
+            if isinstance(value, (list, dict, set, np.ndarray, trimesh.Trimesh)):
+                setattr(preview, name, copy.deepcopy(value))
+        preview.control = RunControl(self.control)
+        preview.cancelled = False
+        preview.simulation_step = self.simulation_step * self.preview_step_factor
+        preview.stock_engine = 'Tri-dexel' if self.has_rotary_motion() else 'Z-map'
+        preview.stock_resolution = max(self.stock_resolution, self.preview_resolution)
+        preview.adaptive_step = False
+        preview.parallel_workers = 1
+        preview.checkpoint_interval = 0
+        preview.result_cache_size = 0
+        return preview
+
+    def calculate_progressive(self, simulation_mode, progress, workpiece_filePath, tool_filePath, workpiece_offset, tool_offset, gcode, controller, tool_dict, gcode_is_altered, on_preview):
+        """
+        漸進模擬: 先以 preview_model 在數秒內模擬整個程式，on_preview(預覽的 SimpleCam) 顯示粗略結果，
+        再以原設定完整模擬 (結果在本身，完成後由呼叫端取代預覽結果)。進度條在兩次模擬各走一次 0 -> 1000。
+        """
+        progress = as_progress(progress)
+        if gcode:
+            self.gcode = gcode
+            if gcode_is_altered:
+                self.parse_gcode(self.gcode, controller)  # 只解析一次，預覽與完整模擬共用 cut_paths
+        self.control.reset()
+        preview = self.preview_model()
+        preview.calculate_cutting_volume(simulation_mode, progress, workpiece_filePath, tool_filePath, workpiece_offset,
+                                         tool_offset, gcode, controller, tool_dict, False)
+        on_preview(preview)
+        if preview.cancelled or self.control.cancelled:  # 預覽時就取消，不做完整模擬
+            self.cancelled = True
+            return False
+        progress.setValue(0)
+        progress.setFormat(f"{0:.1f} %")
+        return self.calculate_cutting_volume(simulation_mode, progress, workpiece_filePath, tool_filePath, workpiece_offset,
+                                             tool_offset, gcode, controller, tool_dict, False)
+
+
+if __name__ == '__main__':
+    # 無介面執行: python -m simulate run project.camproj
+    import sys
+    from headlessRunner import main
+    sys.exit(main())
@@ -0,0 +1,1151 @@
+import numpy as np
+import trimesh
+from trimesh.boolean import boolean_manifold
+from numpy import ceil, floor
+from skimage.measure import marching_cubes
+from scipy.ndimage import distance_transform_edt, binary_dilation
+
+
+def axis_crossings(mesh, axis, origin_uv, pitch, shape_uv, chunk_pairs=2000000):
+    """
+    沿 axis 方向 (0:X, 1:Y, 2:Z) 對規則格點射線求與網格三角形的交點。
+    射線位於 origin_uv + index * pitch (另外兩軸)。
+
+    返回: column (展平後的格點索引), coord (交點在 axis 上的座標)，已依 (column, coord) 排序
+    """
+    u_ax, v_ax = [a for a in range(3) if a != axis]
+    nu, nv = shape_uv
+    # 微小偏移，避免射線剛好穿過三角形共用邊而重複計數
+    u0 = origin_uv[0] + pitch * 1.234567e-5
+    v0 = origin_uv[1] + pitch * 2.345678e-5
+
+    tri = np.asarray(mesh.triangles, dtype=np.float64)
+    pu, pv, pw = tri[:, :, u_ax], tri[:, :, v_ax], tri[:, :, axis]
+
+    iu0 = np.clip(ceil((pu.min(axis=1) - u0) / pitch), 0, nu).astype(np.int64)
+    iu1 = np.clip(floor((pu.max(axis=1) - u0) / pitch), -1, nu - 1).astype(np.int64)
+    iv0 = np.clip(ceil((pv.min(axis=1) - v0) / pitch), 0, nv).astype(np.int64)
+    iv1 = np.clip(floor((pv.max(axis=1) - v0) / pitch), -1, nv - 1).astype(np.int64)
+    cu = np.maximum(iu1 - iu0 + 1, 0)
+    cv = np.maximum(iv1 - iv0 + 1, 0)
+    counts = cu * cv
+
+    # 2D 投影面積為 0 的三角形 (平行於射線) 不會產生交點
+    area2 = ((pu[:, 1] - pu[:, 0]) * (pv[:, 2] - pv[:, 0]) -
+             (pu[:, 2] - pu[:, 0]) * (pv[:, 1] - pv[:, 0]))
+    tri_ids = np.nonzero((counts > 0) & (np.abs(area2) > 1e-12))[0]
+
+    columns, coords = [], []
+    start = 0
+    while start < len(tri_ids):
+        # 依累積格點數切塊，限制暫存記憶體
+        cum = np.cumsum(counts[tri_ids[start:]])
+        stop = start + max(1, int(np.searchsorted(cum, chunk_pairs, side='right')))
+        ids = tri_ids[start:stop]
+        start = stop
+
+        n = counts[ids]
+        t = np.repeat(ids, n)
+        offs = np.arange(n.sum()) - np.repeat(np.cumsum(n) - n, n)
+        iu = iu0[t] + offs // cv[t]
+        iv = iv0[t] + offs % cv[t]
+        qu = u0 + iu * pitch
+        qv = v0 + iv * pitch
+
+        au, av = pu[t, 0], pv[t, 0]
+        bu, bv = pu[t, 1] - au, pv[t, 1] - av
+        cu_, cv_ = pu[t, 2] - au, pv[t, 2] - av
+        du, dv = qu - au, qv - av
+        d = area2[t]
+        w1 = (du * cv_ - dv * cu_) / d
+        w2 = (bu * dv - bv * du) / d
+        w0 = 1.0 - w1 - w2
+        inside = (w0 >= 0) & (w1 >= 0) & (w2 >= 0)
+
+        w = w0 * pw[t, 0] + w1 * pw[t, 1] + w2 * pw[t, 2]
+        columns.append((iu * nv + iv)[inside])
+        coords.append(w[inside])
+
+    if not columns:
+        return np.zeros(0, dtype=np.int64), np.zeros(0)
+    columns = np.concatenate(columns)
+    coords = np.concatenate(coords)
+    order = np.lexsort((coords, columns))
+    return columns[order], coords[order]
+
+
+class ToolProfile:
+    """
+    刀具迴轉輪廓：以刀尖為原點、刀軸為 +Z，描述高度 t 處的刀具半徑 r(t)。
+    非網格引擎 (Z-map / dexel / SDF) 以此計算刀具包絡，不需每步做網格布林運算。
+    """
+    def __init__(self, t, r):
+        self.t = np.asarray(t, dtype=np.float64)
+        self.r = np.asarray(r, dtype=np.float64)
+        self.length = float(self.t[-1])
+        self.radius = float(self.r.max())
+        # 下包絡：半徑 rho 處刀具的最低高度 (r 取累積最大值後反查)
+        self._t_fine = np.linspace(0.0, self.length, 512)
+        self._r_cummax = np.maximum.accumulate(np.interp(self._t_fine, self.t, self.r))
+
+    @classmethod
+    def from_mesh(cls, mesh):
+        """
+        由刀具網格擷取迴轉輪廓。刀軸假設平行 Z 軸並通過 bounds 的 XY 中心。
+
+        返回: profile, tip (刀尖在目前座標系的位置)
+        """
+        bounds = mesh.bounds
+        tip = np.array([(bounds[0][0] + bounds[1][0]) / 2,
+                        (bounds[0][1] + bounds[1][1]) / 2,
+                        bounds[0][2]])
+        rel = mesh.vertices - tip
+        rho = norm_xy(rel)
+        levels = np.round(rel[:, 2], 6)
+        t, inverse = np.unique(levels, return_inverse=True)
+        r = np.zeros(len(t))
+        np.maximum.at(r, inverse.ravel(), rho)
+        return cls(t, r), tip
+
+    def radius_at(self, t):
+        """高度 t 處的刀具半徑，超出刀長為 0"""
+        t = np.asarray(t, dtype=np.float64)
+        r = np.interp(t, self.t, self.r)
+        return np.where((t < 0) | (t > self.length), 0.0, r)
+
+    def envelope(self, rho):
+        """半徑 rho 處刀具的最低高度 (相對刀尖)，超出刀具半徑為 inf"""
+        rho = np.asarray(rho, dtype=np.float64)
+        idx = np.searchsorted(self._r_cummax, rho, side='left')
+        idx_c = np.clip(idx, 1, len(self._t_fine) - 1)
+        r0, r1 = self._r_cummax[idx_c - 1], self._r_cummax[idx_c]
+        t0, t1 = self._t_fine[idx_c - 1], self._t_fine[idx_c]
+        frac = np.where(r1 - r0 > 1e-12, (rho - r0) / np.maximum(r1 - r0, 1e-12), 1.0)
+        z = t0 + np.clip(frac, 0.0, 1.0) * (t1 - t0)
+        z = np.where(idx == 0, 0.0, z)
+        return np.where(idx >= len(self._t_fine), np.inf, z)
+
+    def min_radius(self, t0, t1):
+        """高度區間 [t0, t1] 內的最小刀具半徑 (逐一區間向量化)"""
+        t0, t1 = np.asarray(t0, dtype=np.float64), np.asarray(t1, dtype=np.float64)
+        ends = np.minimum(self.radius_at(t0), self.radius_at(t1))
+        inside = (self.t[None, :] > t0[:, None]) & (self.t[None, :] < t1[:, None])
+        return np.minimum(ends, np.where(inside, self.r[None, :], np.inf).min(axis=1))
+
+
+def norm_xy(points):
+    return np.sqrt(points[..., 0] ** 2 + points[..., 1] ** 2)
+
+
+def ray_tool_intervals(origins, direction, tip, axis, profile, eps=1e-12):
+    """
+    計算平行射線 origins + s * direction 穿過迴轉刀具的區間 [enter, exit]。
+    刀具輪廓視為一疊圓錐台 (frustum)，每段為凸體，射線與各段的交集取聯集的外包區間。
+
+    返回: enter, exit (enter > exit 表示沒有交集)
+    """
+    direction = np.asarray(direction, dtype=np.float64)
+    axis = np.asarray(axis, dtype=np.float64)
+    rel = origins - tip
+    t0 = rel @ axis                                    # (n,)
+    dw = float(direction @ axis)
+    P = rel - t0[:, None] * axis                       # 徑向分量
+    Q = direction - dw * axis
+    PP = np.einsum('ij,ij->i', P, P)[:, None]
+    PQ = (P @ Q)[:, None]
+    QQ = float(Q @ Q)
+
+    ta, tb = profile.t[:-1][None, :], profile.t[1:][None, :]
+    ra, rb = profile.r[:-1][None, :], profile.r[1:][None, :]
+    k = (rb - ra) / np.maximum(tb - ta, eps)
+    t0c = t0[:, None]
+    c0 = ra + k * (t0c - ta)
+    c1 = k * dw
+
+    # 軸向區間 (slab)
+    if abs(dw) > eps:
+        s_a, s_b = (ta - t0c) / dw, (tb - t0c) / dw
+        lo, hi = np.minimum(s_a, s_b), np.maximum(s_a, s_b)
+    else:
+        inside = (t0c >= ta) & (t0c <= tb)
+        lo = np.where(inside, -np.inf, np.inf)
+        hi = np.where(inside, np.inf, -np.inf)
+    # 半徑為正的那一側圓錐 (c0 + c1 * s >= 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        s_c = -c0 / np.where(np.abs(c1) > eps, c1, 1.0)
+    lo = np.where(c1 > eps, np.maximum(lo, s_c), lo)
+    hi = np.where(c1 < -eps, np.minimum(hi, s_c), hi)
+    hi = np.where((np.abs(c1) <= eps) & (c0 < 0), -np.inf, hi)
+
+    # |P + sQ|^2 - (c0 + c1 s)^2 <= 0
+    A = QQ - c1 ** 2
+    B = 2 * (PQ - c0 * c1)
+    C = PP - c0 ** 2
+    disc = B ** 2 - 4 * A * C
+    sq = np.sqrt(np.maximum(disc, 0.0))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        A_safe = np.where(np.abs(A) > eps, A, 1.0)
+        r1 = np.minimum((-B - sq) / (2 * A_safe), (-B + sq) / (2 * A_safe))
+        r2 = np.maximum((-B - sq) / (2 * A_safe), (-B + sq) / (2 * A_safe))
+        s_lin = -C / np.where(np.abs(B) > eps, B, 1.0)
+
+    enter, exit_ = lo.copy(), hi.copy()
+    # A > 0: 兩根之間
+    pos = A > eps
+    enter = np.where(pos, np.maximum(lo, r1), enter)
+    exit_ = np.where(pos, np.minimum(hi, r2), exit_)
+    exit_ = np.where(pos & (disc < 0), -np.inf, exit_)
+    # A < 0: 兩根之外，凸體保證最多只有一側與 [lo, hi] 相交
+    neg = (A < -eps) & (disc >= 0)
+    left_ok = np.minimum(hi, r1) >= lo
+    enter = np.where(neg, np.where(left_ok, lo, np.maximum(lo, r2)), enter)
+    exit_ = np.where(neg, np.where(left_ok, np.minimum(hi, r1), hi), exit_)
+    # A = 0: 線性不等式 B s + C <= 0
+    lin = np.abs(A) <= eps
+    enter = np.where(lin & (B < -eps), np.maximum(lo, s_lin), enter)
+    exit_ = np.where(lin & (B > eps), np.minimum(hi, s_lin), exit_)
+    exit_ = np.where(lin & (np.abs(B) <= eps) & (C > 0), -np.inf, exit_)
+
+    hit = exit_ > enter
+    enter = np.where(hit, enter, np.inf).min(axis=1)
+    exit_ = np.where(hit, exit_, -np.inf).max(axis=1)
+    return enter, exit_
+
+
+def subtract_intervals(start, end, cut_start, cut_end, eps=1e-9):
+    """
+    由每條 dexel 的線段 (start, end，形狀 (n, K)) 減去區間 [cut_start, cut_end]。
+    空線段以 start = inf, end = -inf 表示；短於 eps 的殘留線段 (刀痕間的細縫) 直接捨棄。
+
+    返回: new_start, new_end, removed_start, removed_end (被移除的部分，未切到為空), overflow (線段數超過 K)
+    """
+    a, b = cut_start[:, None], cut_end[:, None]
+    removed_start = np.maximum(start, a)
+    removed_end = np.minimum(end, b)
+    cut = removed_end > removed_start + eps
+    removed_start = np.where(cut, removed_start, np.inf)
+    removed_end = np.where(cut, removed_end, -np.inf)
+
+    left_s, left_e = start, np.minimum(end, a)
+    right_s, right_e = np.maximum(start, b), end
+    cand_s = np.concatenate([left_s, right_s], axis=1)
+    cand_e = np.concatenate([left_e, right_e], axis=1)
+    valid = cand_e > cand_s + eps
+    cand_s = np.where(valid, cand_s, np.inf)
+    cand_e = np.where(valid, cand_e, -np.inf)
+    order = np.argsort(cand_s, axis=1, kind='stable')
+    K = start.shape[1]
+    new_start = np.take_along_axis(cand_s, order, axis=1)[:, :K]
+    new_end = np.take_along_axis(cand_e, order, axis=1)[:, :K]
+    overflow = bool(np.any(valid.sum(axis=1) > K))
+    return new_start, new_end, removed_start, removed_end, overflow
+
+
+def remesh_region(mesh, lower, upper, tolerance=0.01):
+    """
+    局部邊塌縮簡化：只處理頂點全在 [lower, upper] 內的面，區域外的面與區域邊界頂點保持不動。
+    頂點 v 塌縮到相鄰頂點 u 的條件：累積誤差 (先前塌縮的誤差加上 v 到塌縮後各面平面的距離) <= tolerance、
+    面法向不翻轉，且 u, v 恰有 2 個共同鄰點 (保持封閉流形，布林運算才能繼續使用)。
+
+    返回: 新的 trimesh (沒有可塌縮的邊時返回原網格)
+    """
+    vertices = np.asarray(mesh.vertices, dtype=np.float64)
+    faces = np.asarray(mesh.faces, dtype=np.int64)
+    inside = np.all((vertices >= lower) & (vertices <= upper), axis=1)
+    region = inside[faces].all(axis=1)
+    if region.sum() < 4:
+        return mesh
+    locked = np.zeros(len(vertices), dtype=bool)
+    locked[faces[~region].ravel()] = True
+
+    # 預先篩選：邊長乘上頂點周圍法向的最大偏角，估計塌縮誤差
+    normals = mesh.face_normals
+    vertex_normals = np.zeros_like(vertices)
+    np.add.at(vertex_normals, faces[region].ravel(), np.repeat(normals[region], 3, axis=0))
+    vertex_normals /= np.maximum(np.linalg.norm(vertex_normals, axis=1), 1e-12)[:, None]
+    min_dot = np.ones(len(vertices))
+    np.minimum.at(min_dot, faces[region].ravel(), np.einsum('ij,ij->i', np.repeat(normals[region], 3, axis=0),
+                                                            vertex_normals[faces[region].ravel()]))
+    spread = np.sqrt(np.clip(1.0 - min_dot ** 2, 0.0, 1.0))
+    edges = np.sort(faces[region][:, [0, 1, 1, 2, 2, 0]].reshape(-1, 2), axis=1)
+    edges = np.unique(edges, axis=0)
+    length = np.linalg.norm(vertices[edges[:, 0]] - vertices[edges[:, 1]], axis=1)
+    free = ~locked[edges]
+    estimate = np.minimum(np.where(free[:, 0], length * spread[edges[:, 0]], np.inf),
+                          np.where(free[:, 1], length * spread[edges[:, 1]], np.inf))
+    candidate = estimate <= tolerance
+    if not candidate.any():
+        return mesh
+    edges = edges[candidate][np.argsort(length[candidate])]
+
+    # 工作集合：所有碰到區域頂點的面 (區域頂點的一環鄰域因此完整)
+    work = np.flatnonzero(inside[faces].any(axis=1))
+    F = faces[work].tolist()
+    alive = np.ones(len(F), dtype=bool)
+    vertex_faces = {}
+    for f, tri in enumerate(F):
+        for v in tri:
+            vertex_faces.setdefault(v, set()).add(f)
+    locked, inside = locked.tolist(), inside.tolist()
+    removed = np.zeros(len(vertices), dtype=bool)
+    error = np.zeros(len(vertices))     # 各頂點周圍面相對原始曲面的誤差上限
+
+    def ring(v):
+        return set().union(*[F[f] for f in vertex_faces[v]]) - {v}
+
+    def cross(p, q):
+        return np.stack([p[:, 1] * q[:, 2] - p[:, 2] * q[:, 1],
+                         p[:, 2] * q[:, 0] - p[:, 0] * q[:, 2],
+                         p[:, 0] * q[:, 1] - p[:, 1] * q[:, 0]], axis=1)
+
+    for a, b in edges.tolist():
+        for v, u in ((a, b), (b, a)):
+            if locked[v] or removed[v] or removed[u] or not inside[u]:
+                continue
+            faces_v = vertex_faces[v]
+            shared = [f for f in faces_v if u in F[f]]
+            if len(shared) != 2 or len(ring(v) & ring(u)) != 2:
+                continue
+            changed = [f for f in faces_v if f not in shared]
+            old_tri = np.array([F[f] for f in changed])
+            new_tri = np.where(old_tri == v, u, old_tri)
+            old = vertices[old_tri]
+            new = vertices[new_tri]
+            n_old = cross(old[:, 1] - old[:, 0], old[:, 2] - old[:, 0])
+            n_new = cross(new[:, 1] - new[:, 0], new[:, 2] - new[:, 0])
+            area = np.sqrt((n_new ** 2).sum(axis=1))
+            if np.any(area < 1e-12):
+                continue
+            n_new = n_new / area[:, None]
+            if np.any((n_old * n_new).sum(axis=1) <= 0.5 * np.sqrt((n_old ** 2).sum(axis=1))):
+                continue
+            bound = max(error[v], error[new_tri].max()) + np.abs(((vertices[v] - new[:, 0]) * n_new).sum(axis=1)).max()
+            if bound > tolerance:
+                continue
+            error[new_tri.ravel()] = np.maximum(error[new_tri.ravel()], bound)
+            for f in shared:
+                alive[f] = False
+                for w in F[f]:
+                    vertex_faces[w].discard(f)
+            for f, tri in zip(changed, new_tri.tolist()):
+                F[f] = tri
+                vertex_faces[u].add(f)
+            vertex_faces[v] = set()
+            removed[v] = True
+            break
+
+    if not removed.any():
+        return mesh
+    keep = np.ones(len(faces), dtype=bool)
+    keep[work] = False
+    new_faces = np.concatenate([faces[keep], np.array(F, dtype=np.int64).reshape(-1, 3)[alive]])
+    used = np.zeros(len(vertices), dtype=bool)
+    used[new_faces.ravel()] = True
+    remap = np.cumsum(used) - 1
+    return trimesh.Trimesh(vertices=vertices[used], faces=remap[new_faces], process=False)
+
+
+class OccupancyGrid:
+    """
+    粗格佔據網格 (broad phase)：可能含有材料的格子標記為佔據 (保守估計，體素化後再向外膨脹一格)。
+    刀具 AABB 沒有碰到任何佔據格即為空切，可跳過布林運算；移除材料後完全落在刀具內的格子清為空。
+    座標為工件 (材料模型) 座標系。
+    """
+    def __init__(self, mesh, cell=2.0):
+        self.cell = float(cell)
+        voxels = mesh.voxelized(pitch=self.cell).fill()
+        self.occupied = binary_dilation(np.pad(voxels.matrix, 1), iterations=1)
+        self.origin = voxels.translation - 1.5 * self.cell   # 第 0 格的下角 (含補上的一層)
+
+    def cell_range(self, lower, upper):
+        lo = np.maximum(floor((np.asarray(lower) - self.origin) / self.cell), 0).astype(int)
+        hi = np.minimum(floor((np.asarray(upper) - self.origin) / self.cell) + 1, self.occupied.shape).astype(int)
+        return lo, hi
+
+    def is_air(self, lower, upper):
+        """AABB [lower, upper] 內沒有佔據格"""
+        lo, hi = self.cell_range(lower, upper)
+        if np.any(hi <= lo):
+            return True
+        return not self.occupied[lo[0]:hi[0], lo[1]:hi[1], lo[2]:hi[2]].any()
+
+    def clear_tool(self, tip, axis, profile):
+        """
+        清除完全落在刀具內的格子。格子八個角點的最大徑向距離不超過其軸向範圍內的最小刀具半徑即在刀具內；
+        網格刀具截面為多邊形，半徑保留 2% 餘量。
+        """
+        top = tip + axis * profile.length
+        lo, hi = self.cell_range(np.minimum(tip, top) - profile.radius, np.maximum(tip, top) + profile.radius)
+        if np.any(hi <= lo):
+            return
+        sub = self.occupied[lo[0]:hi[0], lo[1]:hi[1], lo[2]:hi[2]]
+        cells = np.argwhere(sub) + lo
+        if len(cells) == 0:
+            return
+        corners = self.origin + (cells[:, None, :] + np.argwhere(np.ones((2, 2, 2)))[None]) * self.cell
+        rel = corners - tip
+        t = rel @ axis
+        radial = np.linalg.norm(rel - t[..., None] * axis, axis=-1)
+        t0, t1 = t.min(axis=1), t.max(axis=1)
+        inside = (t0 >= 0) & (t1 <= profile.length) & (radial.max(axis=1) <= 0.98 * profile.min_radius(t0, t1))
+        cleared = cells[inside]
+        self.occupied[cleared[:, 0], cleared[:, 1], cleared[:, 2]] = False
+
+
+class StockFrames:
+    """
+    材料模型的逐步動畫紀錄 (取代每步存整個網格)。
+    每 keyframe_interval 步存一份完整狀態，其餘只存材料模型回報的變動索引 (稀疏差異)；
+    讀取某一幀時才重建狀態並轉成網格，介面與 workpiece_for_anime 的 (vertices, faces) 相同。
+    transform 為該幀材料模型座標系到機台座標系的 4x4 矩陣 (C/A 旋轉)。
+    """
+    def __init__(self, stock):
+        self.stock = stock
+        self._records = []      # ('key', state) 或 ('delta', {name: (index, values)})
+        self._transforms = []
+        self._shapes = None
+        self._cache_index = None
+        self._cache_mesh = None
+
+    def record(self, transform=None):
+        self._transforms.append(None if transform is None else np.array(transform, dtype=np.float64))
+        state = self.stock.state_arrays()
+        changes = self.stock.pop_changes()
+        shapes = {k: v.shape for k, v in state.items()}
+        if len(self._records) % self.stock.keyframe_interval == 0 or shapes != self._shapes:
+            self._records.append(('key', {k: v.copy() for k, v in state.items()}))
+            self._shapes = shapes
+        else:
+            delta = {}
+            for k, index in changes.items():
+                # 單次標記的索引本身不重複，只有多次標記時才需去重
+                index = index[0] if len(index) == 1 else np.unique(np.concatenate(index))
+                delta[k] = (index, state[k].ravel()[index].copy())
+            self._records.append(('delta', delta))
+
+    def truncate(self, count, stock):
+        """只保留前 count 幀，之後的幀改由 stock (還原到第 count 幀狀態的材料模型) 繼續記錄。返回自身"""
+        del self._records[count:]
+        del self._transforms[count:]
+        self.stock = stock
+        self._cache_index = None
+        self._cache_mesh = None
+        return self
+
+    def snapshot(self):
+        """目前紀錄的複本 (快取獨立)，可在另一執行緒讀取，不受之後的記錄或 truncate 影響"""
+        frames = StockFrames(self.stock)
+        # record 先加入轉換矩陣再加入紀錄，先複製紀錄確保每一幀都有轉換矩陣
+        frames._records = list(self._records)
+        frames._transforms = list(self._transforms)
+        return frames
+
+    def state(self, index):
+        if index < 0:
+            index += len(self._records)
+        key_index = index
+        while self._records[key_index][0] != 'key':
+            key_index -= 1
+        state = {k: v.copy() for k, v in self._records[key_index][1].items()}
+        for kind, delta in self._records[key_index + 1:index + 1]:
+            for k, (idx, values) in delta.items():
+                state[k].ravel()[idx] = values
+        return state
+
+    def __len__(self):
+        return len(self._records)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self._records)
+        if not 0 <= index < len(self._records):
+            raise IndexError(index)
+        if index != self._cache_index:
+            vertices, faces = self.stock.mesh_from_state(self.state(index))
+            if self._transforms[index] is not None:
+                vertices = trimesh.transformations.transform_points(vertices, self._transforms[index])
+            self._cache_mesh = (vertices, faces)
+            self._cache_index = index
+        return self._cache_mesh
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
+class StockModel:
+    """
+    非網格布林運算的工件材料模型基底類別。
+    子類別需實作 remove_tool / state_arrays / mesh_from_state。
+    remove_tool 返回 None (未切到材料) 或 dict: volume, centroid, points (切削區域取樣點，用於寬度/深度投影)
+    狀態陣列被修改時須以 mark_changed 登記展平後的索引，供動畫紀錄只存差異。
+    report_bounds 不為 None 時只回報該範圍 [lower, upper) 內格點的切削量 (空間分解時重疊的邊界格只由擁有的區域回報)。
+    """
+    keyframe_interval = 200
+    report_bounds = None
+
+    def __init__(self):
+        self.frames = StockFrames(self)
+        self._changes = {}
+
+    def mark_changed(self, name, flat_index):
+        self._changes.setdefault(name, []).append(np.asarray(flat_index, dtype=np.int64).ravel())
+
+    def pop_changes(self):
+        changes, self._changes = self._changes, {}
+        return changes
+
+    def reported(self, points):
+        """取樣點 (N, 2 或 3) 是否在 report_bounds 內"""
+        if self.report_bounds is None:
+            return np.ones(len(points), dtype=bool)
+        lower, upper = (np.asarray(b)[:points.shape[1]] for b in self.report_bounds)
+        return np.all((points >= lower) & (points < upper), axis=1)
+
+    def remove_tool(self, tip, profile, axis=None):
+        raise NotImplementedError
+
+    def state_arrays(self):
+        raise NotImplementedError
+
+    def mesh_from_state(self, state):
+        raise NotImplementedError
+
+    def to_trimesh(self):
+        vertices, faces = self.mesh_from_state(self.state_arrays())
+        return trimesh.Trimesh(vertices=vertices, faces=faces, process=False)
+
+
+class ZMapStock(StockModel):
+    """
+    Z-map (高度場 dexel) 材料模型，適用 3 軸加工。
+    工件以 XY 規則格點上的柱狀高度 [bottom, top] 表示，刀具以下包絡直接削減 top。
+    """
+    def __init__(self, mesh, pitch=0.5):
+        super().__init__()
+        self.pitch = float(pitch)
+        bounds = mesh.bounds
+        self.shape = tuple(int(n) for n in np.maximum(ceil((bounds[1][:2] - bounds[0][:2]) / self.pitch), 1))
+        self.origin = bounds[0][:2] + self.pitch / 2  # 第 (0, 0) 格中心
+        self.z_floor = bounds[0][2]
+
+        columns, coords = axis_crossings(mesh, 2, self.origin, self.pitch, self.shape)
+        top = np.full(self.shape[0] * self.shape[1], self.z_floor)
+        bottom = np.full(self.shape[0] * self.shape[1], self.z_floor)
+        if len(columns):
+            np.maximum.at(top, columns, coords)
+            bottom[:] = np.inf
+            np.minimum.at(bottom, columns, coords)
+            bottom[np.isinf(bottom)] = self.z_floor
+        self.top = top.reshape(self.shape)
+        self.bottom = bottom.reshape(self.shape)
+
+    def cell_window(self, center, radius):
+        lo = np.maximum(floor((center[:2] - radius - self.origin) / self.pitch), 0).astype(int)
+        hi = np.minimum(ceil((center[:2] + radius - self.origin) / self.pitch) + 1, self.shape).astype(int)
+        return lo, hi
+
+    def remove_tool(self, tip, profile, axis=None):
+        lo, hi = self.cell_window(tip, profile.radius)
+        if np.any(hi <= lo):
+            return None
+        xs = self.origin[0] + np.arange(lo[0], hi[0]) * self.pitch
+        ys = self.origin[1] + np.arange(lo[1], hi[1]) * self.pitch
+        gx, gy = np.meshgrid(xs, ys, indexing='ij')
+        rho = np.hypot(gx - tip[0], gy - tip[1])
+        tool_z = tip[2] + profile.envelope(rho)
+
+        top = self.top[lo[0]:hi[0], lo[1]:hi[1]]
+        bottom = self.bottom[lo[0]:hi[0], lo[1]:hi[1]]
+        new_top = np.maximum(np.minimum(top, tool_z), bottom)
+        removed = top - new_top > 1e-9
+        if not removed.any():
+            return None
+
+        old = top[removed]
+        new = new_top[removed]
+        top[removed] = new
+        ii, jj = np.nonzero(removed)
+        self.mark_changed('top', np.ravel_multi_index((ii + lo[0], jj + lo[1]), self.shape))
+        cx, cy = gx[removed], gy[removed]
+        report = self.reported(np.column_stack((cx, cy)))
+        if not report.any():
+            return None
+        old, new, cx, cy = old[report], new[report], cx[report], cy[report]
+        cell_area = self.pitch ** 2
+        volume = float(np.sum(old - new) * cell_area)
+        weights = old - new
+        centroid = np.array([np.average(cx, weights=weights),
+                             np.average(cy, weights=weights),
+                             np.average((old + new) / 2, weights=weights)])
+        # 以格子四角 × 上下高度作為切削區域取樣點
+        h = self.pitch / 2
+        corners = [(-h, -h), (-h, h), (h, -h), (h, h)]
+        points = np.concatenate([
+            np.column_stack((cx + dx, cy + dy, z))
+            for dx, dy in corners for z in (old, new)
+        ])
+        return {'volume': volume, 'centroid': centroid, 'points': points}
+
+    def state_arrays(self):
+        return {'top': self.top}
+
+    def split_pinch_vertices(self, faces, n):
+        """
+        兩塊材料只以對角格點相連時，該頂點會被兩組三角扇共用而不是流形；
+        把第二組以後的三角扇改接到複製的新頂點。
+
+        返回: faces, copies (新頂點對應的原頂點索引)
+        """
+        edges = faces[:, [0, 1, 1, 2, 2, 0]].reshape(-1, 2)
+        boundary = trimesh.grouping.group_rows(np.sort(edges, axis=1), require_count=1)
+        starts, counts = np.unique(edges[boundary, 0], return_counts=True)
+        pinch = starts[counts > 1]
+        copies = []
+        if len(pinch) == 0:
+            return faces, np.array(copies, dtype=np.int64)
+        faces = faces.copy()
+        for v in pinch:
+            incident = np.nonzero((faces == v).any(axis=1))[0]
+            # 以共用含 v 的邊把三角形分組 (三角扇)
+            group = {f: f for f in incident}
+            def find(f):
+                while group[f] != f:
+                    f = group[f]
+                return f
+            for i, f in enumerate(incident):
+                for g in incident[i + 1:]:
+                    if len(set(faces[f]) & set(faces[g])) >= 2:
+                        group[find(f)] = find(g)
+            fans = {}
+            for f in incident:
+                fans.setdefault(find(f), []).append(f)
+            for fan in list(fans.values())[1:]:
+                fan = np.array(fan)
+                faces[fan] = np.where(faces[fan] == v, n + len(copies), faces[fan])
+                copies.append(v)
+        return faces, np.array(copies, dtype=np.int64)
+
+    def mesh_from_state(self, state):
+        """以格點中心為頂點建立封閉的高度場網格 (上表面 + 底面 + 邊界側壁)"""
+        top = state['top']
+        nx, ny = self.shape
+        valid = top - self.bottom > 1e-9
+        xs = self.origin[0] + np.arange(nx) * self.pitch
+        ys = self.origin[1] + np.arange(ny) * self.pitch
+        gx, gy = np.meshgrid(xs, ys, indexing='ij')
+        n = nx * ny
+        vertices = np.concatenate([
+            np.column_stack((gx.ravel(), gy.ravel(), top.ravel())),
+            np.column_stack((gx.ravel(), gy.ravel(), self.bottom.ravel())),
+        ])
+        if nx < 2 or ny < 2:
+            return vertices[:0], np.zeros((0, 3), dtype=np.int64)
+
+        idx = np.arange(n).reshape(nx, ny)
+        v00, v10 = idx[:-1, :-1], idx[1:, :-1]
+        v01, v11 = idx[:-1, 1:], idx[1:, 1:]
+        quad = valid[:-1, :-1] & valid[1:, :-1] & valid[:-1, 1:] & valid[1:, 1:]
+        a, b, c, d = v00[quad], v10[quad], v11[quad], v01[quad]
+        top_faces = np.concatenate([np.column_stack((a, b, c)), np.column_stack((a, c, d))])
+        if len(top_faces) == 0:
+            return vertices[:0], np.zeros((0, 3), dtype=np.int64)
+        top_faces, copies = self.split_pinch_vertices(top_faces, n)
+        if len(copies):
+            vertices = np.concatenate([vertices[:n], vertices[copies], vertices[n:], vertices[n + copies]])
+            n += len(copies)
+        bottom_faces = top_faces[:, ::-1] + n
+
+        # 上表面的邊界邊 (只屬於一個三角形) 拉出側壁
+        edges = top_faces[:, [0, 1, 1, 2, 2, 0]].reshape(-1, 2)
+        boundary = trimesh.grouping.group_rows(np.sort(edges, axis=1), require_count=1)
+        u, v = edges[boundary, 0], edges[boundary, 1]
+        wall_faces = np.concatenate([np.column_stack((v, u, u + n)),
+                                     np.column_stack((v, u + n, v + n))])
+
+        faces = np.concatenate([top_faces, bottom_faces, wall_faces])
+        used = np.unique(faces)
+        remap = np.full(len(vertices), -1, dtype=np.int64)
+        remap[used] = np.arange(len(used))
+        return vertices[used], remap[faces]
+
+
+class TriDexelStock(StockModel):
+    """
+    Tri-dexel 材料模型：沿 X、Y、Z 三個方向的規則射線，每條射線存最多 K 段材料區間。
+    可表示倒扣 (undercut)，適用 4/5 軸 C/A 加工；工件固定在自身座標系，刀具姿態由外部轉入。
+    """
+    keyframe_interval = 500
+
+    def __init__(self, mesh, pitch=0.5, max_segments=6):
+        super().__init__()
+        self.pitch = float(pitch)
+        self.max_segments = int(max_segments)
+        self.overflow_reported = False
+        bounds = mesh.bounds
+        self.origin = bounds[0] + self.pitch / 2     # 格點 (0, 0, 0) 的座標
+        self.shape = tuple(int(n) for n in np.maximum(ceil((bounds[1] - bounds[0]) / self.pitch), 1))
+        self.start = []
+        self.end = []
+        for axis in range(3):
+            u_ax, v_ax = [a for a in range(3) if a != axis]
+            shape_uv = (self.shape[u_ax], self.shape[v_ax])
+            columns, coords = axis_crossings(mesh, axis, self.origin[[u_ax, v_ax]], self.pitch, shape_uv)
+            start, end = self.pair_crossings(columns, coords, shape_uv[0] * shape_uv[1])
+            self.start.append(start)
+            self.end.append(end)
+
+    def pair_crossings(self, columns, coords, n_rays):
+        """依序把每條射線的交點兩兩配成 [進入, 離開] 區間"""
+        K = self.max_segments
+        start = np.full((n_rays, K), np.inf)
+        end = np.full((n_rays, K), -np.inf)
+        if len(columns) == 0:
+            return start, end
+        first = np.searchsorted(columns, columns, side='left')
+        rank = np.arange(len(columns)) - first
+        seg = rank // 2
+        keep = seg < K
+        is_start = (rank % 2 == 0) & keep
+        is_end = (rank % 2 == 1) & keep
+        start[columns[is_start], seg[is_start]] = coords[is_start]
+        end[columns[is_end], seg[is_end]] = coords[is_end]
+        # 交點數為奇數 (網格不封閉) 時捨棄未配對的起點
+        unpaired = np.isfinite(start) & ~np.isfinite(end)
+        start[unpaired] = np.inf
+        return start, end
+
+    def ray_origins(self, axis, index):
+        u_ax, v_ax = [a for a in range(3) if a != axis]
+        nv = self.shape[v_ax]
+        origins = np.zeros((len(index), 3))
+        origins[:, u_ax] = self.origin[u_ax] + (index // nv) * self.pitch
+        origins[:, v_ax] = self.origin[v_ax] + (index % nv) * self.pitch
+        return origins
+
+    def rays_in_box(self, axis, box_min, box_max):
+        u_ax, v_ax = [a for a in range(3) if a != axis]
+        lo = np.maximum(ceil((box_min - self.origin) / self.pitch), 0).astype(int)
+        hi = np.minimum(floor((box_max - self.origin) / self.pitch) + 1, self.shape).astype(int)
+        if hi[u_ax] <= lo[u_ax] or hi[v_ax] <= lo[v_ax]:
+            return np.zeros(0, dtype=np.int64)
+        iu, iv = np.meshgrid(np.arange(lo[u_ax], hi[u_ax]), np.arange(lo[v_ax], hi[v_ax]), indexing='ij')
+        return (iu * self.shape[v_ax] + iv).ravel()
+
+    def remove_tool(self, tip, profile, axis=None):
+        axis = np.array([0.0, 0.0, 1.0]) if axis is None else np.asarray(axis, dtype=np.float64)
+        axis = axis / np.linalg.norm(axis)
+        top = tip + axis * profile.length
+        box_min = np.minimum(tip, top) - profile.radius
+        box_max = np.maximum(tip, top) + profile.radius
+
+        volume = 0.0
+        points = []
+        weighted = np.zeros(3)
+        for dexel_axis in range(3):
+            index = self.rays_in_box(dexel_axis, box_min, box_max)
+            if len(index) == 0:
+                continue
+            start, end = self.start[dexel_axis][index], self.end[dexel_axis][index]
+            occupied = np.isfinite(start).any(axis=1)
+            index, start, end = index[occupied], start[occupied], end[occupied]
+            if len(index) == 0:
+                continue
+            direction = np.zeros(3)
+            direction[dexel_axis] = 1.0
+            origins = self.ray_origins(dexel_axis, index)
+            origins[:, dexel_axis] = 0.0
+            enter, exit_ = ray_tool_intervals(origins, direction, tip, axis, profile)
+            hit = exit_ > enter
+            if not hit.any():
+                continue
+            index, start, end, origins = index[hit], start[hit], end[hit], origins[hit]
+            new_start, new_end, rem_s, rem_e, overflow = subtract_intervals(start, end, enter[hit], exit_[hit],
+                                                                            eps=0.05 * self.pitch)
+            if overflow and not self.overflow_reported:
+                print(f"Tri-dexel: more than {self.max_segments} segments on a ray, extra material ignored.")
+                self.overflow_reported = True
+            cut = np.isfinite(rem_s)
+            if not cut.any():
+                continue
+            self.start[dexel_axis][index] = new_start
+            self.end[dexel_axis][index] = new_end
+            flat = index[:, None] * self.max_segments + np.arange(self.max_segments)
+            name = 'xyz'[dexel_axis]
+            self.mark_changed('start_' + name, flat)
+            self.mark_changed('end_' + name, flat)
+
+            ray_id, seg_id = np.nonzero(cut)
+            for s in (rem_s[ray_id, seg_id], rem_e[ray_id, seg_id]):
+                p = origins[ray_id].copy()
+                p[:, dexel_axis] = s
+                points.append(p[self.reported(p)])
+            if dexel_axis == 2:
+                report = self.reported(origins[ray_id])
+                ray_id, seg_id = ray_id[report], seg_id[report]
+                # 體積與重心由 Z 方向 dexel 計算
+                length = rem_e[ray_id, seg_id] - rem_s[ray_id, seg_id]
+                volume = float(length.sum() * self.pitch ** 2)
+                mid = origins[ray_id].copy()
+                mid[:, 2] = (rem_s[ray_id, seg_id] + rem_e[ray_id, seg_id]) / 2
+                weighted = (mid * length[:, None]).sum(axis=0)
+
+        if not points or volume <= 0:
+            return None
+        return {'volume': volume, 'centroid': weighted / (volume / self.pitch ** 2),
+                'points': np.concatenate(points)}
+
+    def state_arrays(self):
+        return {'start_x': self.start[0], 'end_x': self.end[0],
+                'start_y': self.start[1], 'end_y': self.end[1],
+                'start_z': self.start[2], 'end_z': self.end[2]}
+
+    def axis_field(self, axis, start, end):
+        """沿 axis 方向 dexel 在格點上的帶號距離 (內部為正，截斷於 ±pitch)"""
+        u_ax, v_ax = [a for a in range(3) if a != axis]
+        coords = self.origin[axis] + np.arange(self.shape[axis]) * self.pitch
+        field = np.empty((self.shape[u_ax] * self.shape[v_ax], self.shape[axis]), dtype=np.float32)
+        for k, c in enumerate(coords):
+            inside = ((start <= c) & (c <= end)).any(axis=1)
+            dist = np.minimum(np.abs(c - start), np.abs(c - end))
+            dist = np.where(np.isfinite(dist), dist, np.inf).min(axis=1)
+            field[:, k] = np.where(inside, 1.0, -1.0) * np.minimum(dist, self.pitch)
+        field = field.reshape(self.shape[u_ax], self.shape[v_ax], self.shape[axis])
+        order = np.argsort([u_ax, v_ax, axis])
+        return np.transpose(field, order)
+
+    def mesh_from_state(self, state):
+        """三個方向的 dexel 合成帶號距離場後以 Marching Cubes 萃取表面"""
+        fields = [self.axis_field(0, state['start_x'], state['end_x']),
+                  self.axis_field(1, state['start_y'], state['end_y']),
+                  self.axis_field(2, state['start_z'], state['end_z'])]
+        votes = sum(np.sign(f) for f in fields)
+        magnitude = np.minimum(np.minimum(np.abs(fields[0]), np.abs(fields[1])), np.abs(fields[2]))
+        field = np.where(votes > 0, 1.0, -1.0) * magnitude
+        return extract_surface(field, self.origin, self.pitch)
+
+
+def nudge_iso_level(field, pitch):
+    """格點值幾乎為 0 時 Marching Cubes 會產生退化三角形，將其推離等值面"""
+    eps = 1e-3 * pitch
+    return np.where(np.abs(field) < eps, -eps, field).astype(np.float32)
+
+
+def extract_surface(field, origin, pitch):
+    """對帶號距離場 (內部為正) 做 Marching Cubes，外圍補一層外部值使表面封閉"""
+    padded = nudge_iso_level(np.pad(field, 1, mode='constant', constant_values=-pitch), pitch)
+    if padded.max() <= 0:
+        return np.zeros((0, 3)), np.zeros((0, 3), dtype=np.int64)
+    vertices, faces, _, _ = marching_cubes(padded, level=0.0, spacing=(pitch, pitch, pitch))
+    vertices = vertices + origin - pitch
+    # skimage 的三角形方向朝向數值較大側 (內部)，反轉使法向朝外
+    return vertices, faces[:, ::-1].astype(np.int64)
+
+
+def tool_field(points, tip, axis, profile):
+    """刀具的近似帶號距離 (內部為正)：徑向距離與刀尖/刀長兩端平面距離取最小"""
+    rel = points - tip
+    t = rel @ axis
+    rho = np.linalg.norm(rel - t[..., None] * axis, axis=-1)
+    return np.minimum(np.minimum(profile.radius_at(t) - rho, t), profile.length - t)
+
+
+class SparseSDFStock(StockModel):
+    """
+    窄帶稀疏帶號距離場 (SDF) 材料模型。
+    格點分成 B^3 的區塊，只有表面附近的區塊配置記憶體 (pool)，其餘區塊只記錄為實心或空；
+    距離值內部為正並截斷於 ±band。刀具移除為受影響區塊上的向量化 min 運算，
+    網格只在顯示或匯出時逐區塊以 Marching Cubes 萃取。
+    """
+    keyframe_interval = 1000
+    EMPTY, SOLID, SURFACE = 0, 1, 2
+
+    def __init__(self, mesh, pitch=0.5, block_size=8):
+        super().__init__()
+        self.pitch = float(pitch)
+        self.B = int(block_size)
+        self.band = 2 * self.pitch
+        bounds = mesh.bounds
+        self.origin = bounds[0] - 2 * self.pitch
+        n_nodes = ceil((bounds[1] - bounds[0]) / self.pitch) + 5
+        self.block_shape = tuple(int(n) for n in ceil(n_nodes / self.B))
+        self.node_shape = tuple(n * self.B for n in self.block_shape)
+
+        self.block_state = np.zeros(self.block_shape, dtype=np.int8)
+        self.block_slot = np.full(self.block_shape, -1, dtype=np.int32)
+        self.pool = np.zeros((0, self.B, self.B, self.B), dtype=np.float32)
+        self.free_slots = []
+        self.build_from_mesh(mesh)
+
+    def build_from_mesh(self, mesh):
+        """以 Z 方向射線交點的奇偶判斷格點內外，再只對表面附近的區塊計算局部距離場"""
+        nx, ny, nz = self.node_shape
+        columns, coords = axis_crossings(mesh, 2, self.origin[:2], self.pitch, (nx, ny))
+        toggles = np.zeros((nx * ny, nz + 1), dtype=np.int8)
+        k0 = np.clip(ceil((coords - self.origin[2]) / self.pitch), 0, nz).astype(np.int64)
+        np.add.at(toggles, (columns, k0), 1)
+        occ = (np.cumsum(toggles, axis=1)[:, :nz] % 2).astype(bool).reshape(nx, ny, nz)
+
+        B = self.B
+        blocks = occ.reshape(self.block_shape[0], B, self.block_shape[1], B, self.block_shape[2], B)
+        block_any = blocks.any(axis=(1, 3, 5))
+        block_all = blocks.all(axis=(1, 3, 5))
+        self.block_state[block_all] = self.SOLID
+        # 內外混合的區塊與其相鄰區塊都可能落在窄帶內
+        mixed = block_any & ~block_all
+        candidate = mixed.copy()
+        for axis in range(3):
+            for shift in (-1, 1):
+                candidate |= np.roll(mixed, shift, axis=axis)
+        candidate |= block_any != np.roll(block_all, -1, axis=0)
+        candidate |= block_any != np.roll(block_all, -1, axis=1)
+        candidate |= block_any != np.roll(block_all, -1, axis=2)
+
+        halo = int(ceil(self.band / self.pitch)) + 1
+        padded = np.pad(occ, halo, mode='constant', constant_values=False)
+        for bi, bj, bk in np.argwhere(candidate):
+            region = padded[bi * B:bi * B + B + 2 * halo, bj * B:bj * B + B + 2 * halo, bk * B:bk * B + B + 2 * halo]
+            if region.all() or not region.any():
+                continue
+            inside = distance_transform_edt(region) - 0.5
+            outside = distance_transform_edt(~region) - 0.5
+            field = np.where(region, inside, -outside) * self.pitch
+            field = np.clip(field[halo:halo + B, halo:halo + B, halo:halo + B], -self.band, self.band)
+            slot = self.allocate((bi, bj, bk))
+            self.pool[slot] = field
+        self.classify(np.argwhere(self.block_state == self.SURFACE))
+        self.pop_changes()
+
+    def allocate(self, block):
+        if self.free_slots:
+            slot = self.free_slots.pop()
+        else:
+            slot = len(self.pool)
+            capacity = max(64, 2 * len(self.pool))
+            grown = np.zeros((capacity, self.B, self.B, self.B), dtype=np.float32)
+            grown[:len(self.pool)] = self.pool
+            self.free_slots.extend(range(capacity - 1, slot, -1))
+            self.pool = grown
+        fill = self.band if self.block_state[block] == self.SOLID else -self.band
+        self.pool[slot] = fill
+        self.block_slot[block] = slot
+        self.block_state[block] = self.SURFACE
+        return slot
+
+    def release(self, block, state):
+        self.free_slots.append(int(self.block_slot[block]))
+        self.block_slot[block] = -1
+        self.block_state[block] = state
+
+    def gather(self, nodes, slot=None, state=None, pool=None):
+        """依全域格點索引 (..., 3) 取距離值；未配置的區塊以 ±band 表示"""
+        slot = self.block_slot if slot is None else slot
+        state = self.block_state if state is None else state
+        pool = self.pool if pool is None else pool
+        B = self.B
+        block = nodes // B
+        local = nodes % B
+        inside_grid = ((block >= 0) & (block < np.array(self.block_shape))).all(axis=-1)
+        flat_block = np.ravel_multi_index(np.moveaxis(block, -1, 0), self.block_shape, mode='clip')
+        s = slot.ravel()[flat_block]
+        st = state.ravel()[flat_block]
+        flat_local = (local[..., 0] * B + local[..., 1]) * B + local[..., 2]
+        values = pool.reshape(-1)[np.maximum(s, 0) * B ** 3 + flat_local] if len(pool) else np.zeros(s.shape, np.float32)
+        fill = np.where(st == self.SOLID, self.band, -self.band).astype(np.float32)
+        values = np.where(s >= 0, values, fill)
+        return np.where(inside_grid, values, np.float32(-self.band))
+
+    def region_nodes(self, blocks):
+        """每個區塊加上 +1 層相鄰格點的全域索引 (Marching Cubes 需要跨區塊的一層)"""
+        r = np.arange(self.B + 1)
+        local = np.stack(np.meshgrid(r, r, r, indexing='ij'), axis=-1)
+        return blocks[:, None, None, None, :] * self.B + local[None]
+
+    def classify(self, blocks):
+        """區塊 (含 +1 層) 全部 >= band 則視為實心、全部 <= -band 則視為空，釋放記憶體"""
+        if len(blocks) == 0:
+            return
+        values = self.gather(self.region_nodes(blocks))
+        lo = values.reshape(len(blocks), -1).min(axis=1)
+        hi = values.reshape(len(blocks), -1).max(axis=1)
+        for block, vmin, vmax in zip(map(tuple, blocks), lo, hi):
+            if self.block_state[block] != self.SURFACE:
+                continue
+            if vmin >= self.band:
+                self.release(block, self.SOLID)
+            elif vmax <= -self.band:
+                self.release(block, self.EMPTY)
+            else:
+                continue
+            self.mark_changed('slot', np.ravel_multi_index(block, self.block_shape))
+            self.mark_changed('state', np.ravel_multi_index(block, self.block_shape))
+
+    def remove_tool(self, tip, profile, axis=None):
+        axis = np.array([0.0, 0.0, 1.0]) if axis is None else np.asarray(axis, dtype=np.float64)
+        axis = axis / np.linalg.norm(axis)
+        top = tip + axis * profile.length
+        margin = profile.radius + self.band + self.pitch
+        box_min = np.minimum(tip, top) - margin
+        box_max = np.maximum(tip, top) + margin
+        lo = np.maximum(floor((box_min - self.origin) / (self.pitch * self.B)), 0).astype(int)
+        hi = np.minimum(floor((box_max - self.origin) / (self.pitch * self.B)) + 1, self.block_shape).astype(int)
+        if np.any(hi <= lo):
+            return None
+        sub = self.block_state[lo[0]:hi[0], lo[1]:hi[1], lo[2]:hi[2]]
+        blocks = np.argwhere(sub != self.EMPTY) + lo
+        if len(blocks) == 0:
+            return None
+
+        # 區塊內格點的刀具距離場
+        r = np.arange(self.B)
+        local = np.stack(np.meshgrid(r, r, r, indexing='ij'), axis=-1)
+        nodes = blocks[:, None, None, None, :] * self.B + local[None]
+        positions = self.origin + nodes * self.pitch
+        cut_field = -tool_field(positions, tip, axis, profile)
+        touched = (cut_field < self.band).reshape(len(blocks), -1).any(axis=1)
+        if not touched.any():
+            return None
+        blocks, cut_field, positions = blocks[touched], cut_field[touched], positions[touched]
+
+        for block in map(tuple, blocks):
+            if self.block_state[block] == self.SOLID:
+                self.allocate(block)
+                self.mark_changed('slot', np.ravel_multi_index(block, self.block_shape))
+                self.mark_changed('state', np.ravel_multi_index(block, self.block_shape))
+        slots = self.block_slot[blocks[:, 0], blocks[:, 1], blocks[:, 2]]
+        old = self.pool[slots]
+        new = np.maximum(np.minimum(old, cut_field), -self.band).astype(np.float32)
+        self.pool[slots] = new
+        block_size = self.B ** 3
+        self.mark_changed('pool', slots[:, None] * block_size + np.arange(block_size))
+
+        # 以 0.5 + d / pitch 作為格點的材料佔比，求移除體積
+        removed = (np.clip(0.5 + old / self.pitch, 0, 1) - np.clip(0.5 + new / self.pitch, 0, 1))
+        # 受影響區塊與其下方相鄰區塊 (其 +1 層落在受影響區塊內) 重新分類
+        offsets = np.argwhere(np.ones((2, 2, 2), dtype=bool))
+        neighbors = (blocks[:, None, :] - offsets[None]).reshape(-1, 3)
+        neighbors = np.unique(np.ravel_multi_index(neighbors[(neighbors >= 0).all(axis=1)].T, self.block_shape))
+        self.classify(np.column_stack(np.unravel_index(neighbors, self.block_shape)))
+        mask = (removed > 1e-6) & self.reported(positions.reshape(-1, 3)).reshape(removed.shape)
+        if not mask.any():
+            return None
+        weights = removed[mask]
+        volume = float(weights.sum() * self.pitch ** 3)
+        points = positions[mask]
+        return {'volume': volume, 'centroid': np.average(points, axis=0, weights=weights), 'points': points}
+
+    def state_arrays(self):
+        return {'slot': self.block_slot, 'state': self.block_state, 'pool': self.pool}
+
+    def mesh_from_state(self, state):
+        """逐個表面區塊 (含 +1 層) 做 Marching Cubes 後合併共用頂點"""
+        blocks = np.argwhere(state['state'] == self.SURFACE)
+        if len(blocks) == 0:
+            return np.zeros((0, 3)), np.zeros((0, 3), dtype=np.int64)
+        values = nudge_iso_level(self.gather(self.region_nodes(blocks), state['slot'], state['state'], state['pool']), self.pitch)
+        all_vertices, all_faces = [], []
+        offset = 0
+        for block, field in zip(blocks, values):
+            if field.min() >= 0 or field.max() <= 0:
+                continue
+            vertices, faces, _, _ = marching_cubes(field, level=0.0, spacing=(self.pitch,) * 3)
+            all_vertices.append(vertices + self.origin + block * self.B * self.pitch)
+            all_faces.append(faces[:, ::-1] + offset)
+            offset += len(vertices)
+        if not all_vertices:
+            return np.zeros((0, 3)), np.zeros((0, 3), dtype=np.int64)
+        mesh = trimesh.Trimesh(np.concatenate(all_vertices), np.concatenate(all_faces), process=False)
+        mesh.merge_vertices(digits_vertex=6)
+        return mesh.vertices, mesh.faces.astype(np.int64)
+
+
+class TiledMeshStock(StockModel):
+    """
+    分塊網格工件：把工件切成規則格的獨立封閉網格 (tile)，布林運算只作用在與刀具 AABB 重疊的 tile，
+    每步成本只和切削區域大小有關。顯示時直接串接各 tile，匯出時才以聯集縫合成單一網格。
+    與其他材料模型不同，材料移除使用實際刀具網格 (remove_mesh)，而非迴轉輪廓。
+    remesh_tolerance > 0 時，被切到的 tile 在刀具範圍內做局部簡化 (remesh_region)。
+    """
+    def __init__(self, mesh, tile_size=20.0, remesh_tolerance=0.0):
+        super().__init__()
+        self.tile_size = float(tile_size)
+        self.remesh_tolerance = float(remesh_tolerance)
+        bounds = mesh.bounds
+        self.origin = bounds[0] - 1e-3
+        shape = tuple(int(n) for n in np.maximum(ceil((bounds[1] + 1e-3 - self.origin) / self.tile_size), 1))
+        self.tiles = np.empty(shape, dtype=object)
+        for index in np.ndindex(shape):
+            lower = self.origin + np.array(index) * self.tile_size
+            box = trimesh.creation.box(bounds=[lower, lower + self.tile_size])
+            tile = boolean_manifold([mesh, box], operation='intersection', check_volume=False)
+            self.tiles[index] = None if tile.is_empty else tile
+        self.pop_changes()
+
+    def remove_mesh(self, tool):
+        """
+        由重疊的 tile 減去刀具網格 (材料模型座標系)。
+        返回: None 或 dict: volume, centroid, points (各 tile 交集的合併結果)
+        """
+        lower, upper = tool.bounds
+        lo = np.maximum(floor((lower - self.origin) / self.tile_size), 0).astype(int)
+        hi = np.minimum(floor((upper - self.origin) / self.tile_size) + 1, self.tiles.shape).astype(int)
+        pieces = []
+        for index in np.ndindex(*np.maximum(hi - lo, 0)):
+            index = tuple(np.array(index) + lo)
+            tile = self.tiles[index]
+            if tile is None or np.any(tile.bounds[0] > upper) or np.any(tile.bounds[1] < lower):
+                continue
+            intersection = boolean_manifold([tile, tool], operation='intersection', check_volume=False)
+            if intersection.is_empty:
+                continue
+            pieces.append(intersection)
+            tile = boolean_manifold([tile, tool], operation='difference', check_volume=False)
+            if self.remesh_tolerance > 0 and not tile.is_empty:
+                tile = remesh_region(tile, lower - 1e-3, upper + 1e-3, self.remesh_tolerance)
+            self.tiles[index] = None if tile.is_empty else tile
+            self.mark_changed('tiles', np.ravel_multi_index(index, self.tiles.shape))
+        if not pieces:
+            return None
+        volumes = np.array([piece.volume for piece in pieces])
+        if volumes.max() > 1e-9:
+            # 刀具貼著相鄰 tile 的切面時會得到零體積交集，不納入切削區域
+            pieces = [piece for piece, volume in zip(pieces, volumes) if volume > 1e-9]
+            volumes = volumes[volumes > 1e-9]
+            centroid = np.average([piece.center_mass for piece in pieces], axis=0, weights=volumes)
+            points = np.concatenate([piece.vertices for piece in pieces])
+        else:
+            points = np.concatenate([piece.vertices for piece in pieces])
+            centroid = points.mean(axis=0)
+        return {'volume': float(volumes.sum()), 'centroid': centroid, 'points': points}
+
+    def state_arrays(self):
+        # tile 只會被整個替換、不會就地修改，動畫紀錄只需保存參考
+        return {'tiles': self.tiles}
+
+    def mesh_from_state(self, state):
+        tiles = [tile for tile in state['tiles'].ravel() if tile is not None]
+        if not tiles:
+            return np.zeros((0, 3)), np.zeros((0, 3), dtype=np.int64)
+        offsets = np.cumsum([0] + [len(tile.vertices) for tile in tiles[:-1]])
+        vertices = np.concatenate([tile.vertices for tile in tiles])
+        faces = np.concatenate([tile.faces + offset for tile, offset in zip(tiles, offsets)])
+        return vertices, faces
+
+    def to_trimesh(self):
+        tiles = [tile for tile in self.tiles.ravel() if tile is not None]
+        if len(tiles) < 2:
+            return tiles[0].copy() if tiles else trimesh.Trimesh()
+        return boolean_manifold(tiles, operation='union', check_volume=False)
+
+
+def build_stock_model(engine, mesh, resolution=0.5, tile_size=20.0, remesh_tolerance=0.0):
+    """依引擎名稱建立材料模型，'Mesh' (或未知名稱) 返回 None"""
+    if engine == 'Z-map':
+        return ZMapStock(mesh, resolution)
+    if engine == 'Tri-dexel':
+        return TriDexelStock(mesh, resolution)
+    if engine == 'SDF':
+        return SparseSDFStock(mesh, resolution)
+    if engine == 'Tiled Mesh':
+        return TiledMeshStock(mesh, tile_size, remesh_tolerance)
+    return None
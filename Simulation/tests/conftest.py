@@ -0,0 +1,5 @@
+import os
+import sys
+
+# 模組皆位於 Simulation/ 下，以平面方式匯入
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,26 @@
+import os
+import pickle
+from checkpointStore import CheckpointStore
+
+
+def checkpoint(signature):
+    return pickle.dumps({'signature': signature, 'snapshot': None, 'cutting_parameters': []})
+
+
+def test_save_load_and_signature(tmp_path):
+    store = CheckpointStore(str(tmp_path), 'abc')
+    assert store.load('abc') is None
+    store.save(checkpoint('abc'))
+    assert store.load('abc')['signature'] == 'abc'
+    assert store.load('other') is None
+
+
+def test_clear_only_own_file_and_prune(tmp_path):
+    stores = [CheckpointStore(str(tmp_path), f"sig{i}", max_files=3) for i in range(4)]
+    for i, store in enumerate(stores):
+        store.save(checkpoint(store.path))
+        os.utime(store.path, (i, i))
+    # 寫入第 4 份時刪除最舊的 sig0
+    assert sorted(os.listdir(tmp_path)) == ['sig1.pkl', 'sig2.pkl', 'sig3.pkl']
+    stores[2].clear()
+    assert sorted(os.listdir(tmp_path)) == ['sig1.pkl', 'sig3.pkl']
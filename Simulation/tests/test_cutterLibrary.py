@@ -0,0 +1,29 @@
+import pytest
+from cutterLibrary import CutterSpec
+
+
+def test_from_toolname_bull_nose():
+    spec = CutterSpec.from_toolname("(toolname=D10R1-50_100_MST)")
+    assert spec.kind == 'bull-nose'
+    assert (spec.diameter, spec.corner_radius, spec.flute_length, spec.length) == (10, 1, 50, 100)
+    assert spec.name == 'D10R1-50_100_MST'
+
+
+def test_from_toolname_ball_and_defaults():
+    spec = CutterSpec.from_toolname("B6")
+    assert spec.kind == 'ball'
+    assert spec.corner_radius == 3
+    # 未指定時刃長 3D，全長再加 2D
+    assert (spec.flute_length, spec.length) == (18, 30)
+
+
+def test_from_toolname_flat_and_taper():
+    assert CutterSpec.from_toolname("D10-30_75").kind == 'flat'
+    taper = CutterSpec.from_toolname("D6R3A2-20_60")
+    assert taper.kind == 'taper'
+    assert taper.cutting_radius > 3
+
+
+@pytest.mark.parametrize('text', [None, '', 'T1 M6', 'D0', 'D6R4-20_60'])
+def test_from_toolname_invalid(text):
+    assert CutterSpec.from_toolname(text) is None
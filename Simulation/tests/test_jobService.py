@@ -0,0 +1,43 @@
+import pytest
+
+jobService = pytest.importorskip('jobService', exc_type=ImportError)  # 需要 simulate 的相依套件 (open3d)
+
+
+def test_job_state_transitions(tmp_path):
+    jobs = jobService.JobQueue(str(tmp_path / 'jobs.db'))
+    first = jobs.submit('first', {'a': 1})
+    second = jobs.submit('second', {'a': 2})
+    assert [job['status'] for job in jobs.list()] == ['queued', 'queued']
+
+    assert jobs.claim() == (first, {'a': 1})
+    jobs.set_progress(first, 0.5)
+    assert jobs.get(first)['status'] == 'running' and jobs.get(first)['progress'] == 0.5
+    jobs.finish(first, 'done', summary={'steps': 3})
+    job = jobs.get(first)
+    assert (job['status'], job['progress'], job['summary']) == ('done', 1, {'steps': 3})
+    # 已結束的工作不再改變
+    jobs.finish(first, 'failed', error='late')
+    assert jobs.get(first)['status'] == 'done'
+
+    assert jobs.cancel(second)
+    assert jobs.get(second)['status'] == 'cancelled'
+    assert jobs.claim() is None
+    assert not jobs.cancel(999)
+
+
+def test_cancel_running_and_requeue_on_restart(tmp_path):
+    path = str(tmp_path / 'jobs.db')
+    jobs = jobService.JobQueue(path)
+    job_id = jobs.submit('job', {})
+    jobs.claim()
+    assert jobs.cancel_requested() == set()
+    assert jobs.cancel(job_id)
+    assert jobs.get(job_id)['status'] == 'running'
+    assert jobs.cancel_requested() == {job_id}
+
+    other = jobs.submit('other', {})
+    jobs.claim()
+    # 服務重新啟動時執行中的工作重新排入佇列
+    jobs = jobService.JobQueue(path)
+    assert jobs.get(other)['status'] == 'queued'
+    assert jobs.claim()[0] == job_id
@@ -0,0 +1,38 @@
+import numpy as np
+from pathCompressor import compress_cut_paths
+
+
+def path(line, mode, x, y, z=0.0, c=0.0, feed=1000):
+    return {'motion_mode': mode, 'line_number': line, 'target_pose': np.array([x, y, z, c, 0.0]),
+            'feed': feed, 'spindle_speed': 8000, 'arc_params': None, 'plane': 'G17', 'current_tool': 1}
+
+
+def test_collinear_moves_merge_into_line():
+    paths = [path(1, 'G0', 0, 0)] + [path(2 + i, 'G1', i + 1, 0) for i in range(10)]
+    compressed = compress_cut_paths(paths)
+    assert len(compressed) == 2
+    merged = compressed[1]
+    assert merged['motion_mode'] == 'G1'
+    np.testing.assert_allclose(merged['target_pose'], [10, 0, 0, 0, 0])
+    assert merged['source_lines'] == list(range(2, 12))
+    np.testing.assert_allclose(merged['source_breaks'], np.arange(1, 11) / 10)
+
+
+def test_points_on_circle_fit_arc():
+    angles = np.linspace(0, np.pi / 2, 31)[1:]
+    paths = [path(1, 'G0', 10, 0)] + [path(2 + i, 'G1', 10 * np.cos(t), 10 * np.sin(t))
+                                      for i, t in enumerate(angles)]
+    compressed = compress_cut_paths(paths, tolerance=0.005)
+    assert len(compressed) == 2
+    arc = compressed[1]
+    assert arc['motion_mode'] == 'G3'
+    np.testing.assert_allclose([arc['arc_params']['I'], arc['arc_params']['J']], [-10, 0], atol=1e-6)
+
+
+def test_unmergeable_paths_kept():
+    paths = [path(1, 'G0', 0, 0), path(2, 'G1', 1, 0), path(3, 'G1', 2, 0, feed=500),
+             path(4, 'G1', 3, 0, c=90), path(5, 'G1', 4, 0, c=90)]
+    compressed = compress_cut_paths(paths)
+    # 進給不同與 C 軸移動都會中斷合併
+    assert [p['line_number'] for p in compressed] == [1, 2, 3, 4, 5]
+    assert all('source_lines' not in p for p in compressed)
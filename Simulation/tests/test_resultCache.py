@@ -0,0 +1,41 @@
+import os
+import pickle
+import numpy as np
+from resultCache import ResultCache, estimated_nbytes
+
+
+def test_save_and_load(tmp_path):
+    cache = ResultCache(str(tmp_path), max_bytes=1000)
+    assert cache.load('missing') is None
+    cache.save('a', pickle.dumps(1))
+    assert cache.load('a') == 1
+    assert not [name for name in os.listdir(tmp_path) if name.endswith('.tmp')]
+
+
+def test_eviction_least_recently_used(tmp_path):
+    cache = ResultCache(str(tmp_path), max_bytes=250)
+    for i, key in enumerate(('a', 'b')):
+        cache.save(key, pickle.dumps(bytes(90)))
+        os.utime(cache.path(key), (i, i))
+    cache.load('a')                      # 命中更新使用時間，b 變為最久未使用
+    cache.save('c', pickle.dumps(bytes(90)))
+    assert os.path.exists(cache.path('a'))
+    assert not os.path.exists(cache.path('b'))
+    assert os.path.exists(cache.path('c'))
+
+
+def test_oversized_and_clear(tmp_path):
+    cache = ResultCache(str(tmp_path), max_bytes=50)
+    cache.save('big', pickle.dumps(bytes(90)))
+    assert not os.path.exists(cache.path('big'))
+    cache.save('small', pickle.dumps(0))
+    cache.clear()
+    assert os.listdir(tmp_path) == []
+
+
+def test_estimated_nbytes_counts_shared_arrays_once():
+    array = np.zeros(1000)
+    run = {'a': array, 'frames': [(array, array)] * 10, 'rows': np.ones((50, 11))}
+    estimate = estimated_nbytes(run)
+    assert array.nbytes + run['rows'].nbytes <= estimate < array.nbytes + run['rows'].nbytes + 1000
+    assert abs(estimate - len(pickle.dumps(run))) < 1000
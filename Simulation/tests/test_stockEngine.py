@@ -0,0 +1,55 @@
+import numpy as np
+import trimesh
+from stockEngine import axis_crossings, subtract_intervals
+
+INF = np.inf
+
+
+def test_axis_crossings_box():
+    box = trimesh.creation.box(extents=(2.0, 2.0, 2.0))
+    # 4 x 4 格點，間距 1，涵蓋 [-1.5, 1.5]：中間 2 x 2 條射線穿過方塊
+    column, coord = axis_crossings(box, 2, (-1.5, -1.5), 1.0, (4, 4))
+    assert sorted(set(column.tolist())) == [5, 6, 9, 10]
+    assert len(coord) == 8
+    np.testing.assert_allclose(coord.reshape(4, 2), [[-1.0, 1.0]] * 4)
+
+
+def test_axis_crossings_sorted_and_empty():
+    sphere = trimesh.creation.icosphere(subdivisions=2, radius=1.0)
+    column, coord = axis_crossings(sphere, 0, (-1.0, -1.0), 0.25, (9, 9), chunk_pairs=10)
+    order = np.lexsort((coord, column))
+    assert np.array_equal(order, np.arange(len(column)))
+    # 每條射線穿過封閉網格的交點數為偶數
+    assert np.all(np.bincount(column) % 2 == 0)
+
+    column, coord = axis_crossings(sphere, 2, (5.0, 5.0), 0.25, (3, 3))
+    assert len(column) == 0 and len(coord) == 0
+
+
+def test_subtract_intervals_split():
+    start = np.array([[0.0, INF]])
+    end = np.array([[10.0, -INF]])
+    new_start, new_end, removed_start, removed_end, overflow = subtract_intervals(
+        start, end, np.array([3.0]), np.array([5.0]))
+    np.testing.assert_array_equal(new_start, [[0.0, 5.0]])
+    np.testing.assert_array_equal(new_end, [[3.0, 10.0]])
+    np.testing.assert_array_equal(removed_start, [[3.0, INF]])
+    np.testing.assert_array_equal(removed_end, [[5.0, -INF]])
+    assert not overflow
+
+
+def test_subtract_intervals_miss_remove_and_overflow():
+    start = np.array([[0.0], [0.0]])
+    end = np.array([[10.0], [10.0]])
+    # 第一條未切到，第二條整段移除
+    new_start, new_end, removed_start, removed_end, overflow = subtract_intervals(
+        start, end, np.array([20.0, -1.0]), np.array([30.0, 11.0]))
+    np.testing.assert_array_equal(new_start, [[0.0], [INF]])
+    np.testing.assert_array_equal(new_end, [[10.0], [-INF]])
+    np.testing.assert_array_equal(removed_start, [[INF], [0.0]])
+    np.testing.assert_array_equal(removed_end, [[-INF], [10.0]])
+    assert not overflow
+
+    # K = 1 時中間切開需要兩段，回報 overflow
+    *_, overflow = subtract_intervals(start[:1], end[:1], np.array([3.0]), np.array([5.0]))
+    assert overflow
@@ -0,0 +1,27 @@
+import numpy as np
+import pytest
+from trajectory import Trajectory, RAPID_FEED, RAPID_STEPS
+
+
+def path(line, mode, x, y, z=0.0, feed=600):
+    return {'motion_mode': mode, 'line_number': line, 'target_pose': np.array([x, y, z, 0.0, 0.0]),
+            'feed': feed, 'spindle_speed': 8000, 'arc_params': None, 'plane': 'G17', 'current_tool': 1}
+
+
+def plan(paths, step=0.5):
+    return Trajectory.plan(paths, step, arc_solver=None, radius_c=0.0, radius_a=0.0)
+
+
+def test_rapid_fixed_steps_and_feed_time():
+    # 程式開頭的 G0 尚未指定 F
+    trajectory = plan([path(1, 'G0', 100, 0, feed=0), path(2, 'G1', 100, 10)])
+    assert list(trajectory.step_count) == [RAPID_STEPS, 20]
+    np.testing.assert_allclose(trajectory.pose[RAPID_STEPS - 1, :3], [100, 0, 0])
+    np.testing.assert_allclose(trajectory.time[-1], 100 / (RAPID_FEED / 60) + 10 / (600 / 60))
+
+
+def test_cutting_move_without_feed_rejected():
+    with pytest.raises(ValueError, match='line 2'):
+        plan([path(1, 'G0', 10, 0, feed=0), path(2, 'G1', 20, 0, feed=0)])
+    # 沒有位移的段不需要進給
+    assert len(plan([path(1, 'G1', 0, 0, feed=0)])) == 0
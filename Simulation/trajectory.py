@@ -0,0 +1,232 @@
+import numpy as np
+from numpy.linalg import norm
+
+ARC_COMMANDS = ('G2', 'G3', 'G02', 'G03')
+# 圓弧平面 -> (u, v, w) 軸索引：圓弧在 u-v 平面 (u x v = w)，w 為螺旋插補的直線軸
+PLANE_AXES = {'G17': (0, 1, 2), 'G18': (2, 0, 1), 'G19': (1, 2, 0)}
+CENTER_WORDS = 'IJK'    # X/Y/Z 軸對應的圓心偏移量
+RAPID_FEED = 3000       # G0 的模擬進給 (mm/min)
+RAPID_STEPS = 5         # G0 不論距離都分成固定的步數
+
+
+class Trajectory:
+    """
+    整個程式的逐步刀具軌跡，模擬前一次算出，材料移除、時間模型與繪圖共用同一份資料。
+
+    逐步 (N): pose (X,Y,Z,C,A，該步結束時)、step_vector / step_angle (該步位移)、
+              spin (G17 圓弧時刀具隨圓弧轉動的角度，rad)、time (累積時間)、segment (對應 cut_paths 的索引)、
+              step_line (該步對應的原始 G-code 行號，壓縮合併的路徑依 source_lines / source_breaks 對應)
+    逐段 (len(cut_paths)): start (段起點姿態)、offset / step_count (該段在逐步陣列的範圍)、
+              scale (每步距離)、distance (該段距離)、line_number、feed
+    """
+    def __init__(self, start, offset, step_count, scale, distance, line_number, feed,
+                 pose, step_vector, step_angle, spin, time, segment, step_line):
+        self.start = start
+        self.offset = offset
+        self.step_count = step_count
+        self.scale = scale
+        self.distance = distance
+        self.line_number = line_number
+        self.feed = feed
+        self.pose = pose
+        self.step_vector = step_vector
+        self.step_angle = step_angle
+        self.spin = spin
+        self.time = time
+        self.segment = segment
+        self.step_line = step_line
+
+    def __len__(self):
+        return len(self.pose)
+
+    def steps(self, index):
+        """第 index 段在逐步陣列中的範圍"""
+        return range(self.offset[index], self.offset[index] + self.step_count[index])
+
+    @classmethod
+    def plan(cls, cut_paths, simulation_step, arc_solver, radius_c, radius_a, start_pose=None, stepper=None):
+        """
+        由 cut_paths 算出整個程式的軌跡。
+        逐段只求步數與圓弧幾何 (圓心、半徑、掃掠角)，逐步的姿態與時間以 NumPy 一次展開。
+
+        arc_solver: (start, end, arc_params, command) -> center, radius, sweep_angle, arc_length, is_linear_move，
+                    在圓弧平面座標 (u, v, w) 下計算 (即 SimpleCam.get_arc_params)
+        radius_c, radius_a: 將 C/A 旋轉角換算為移動距離的半徑
+        stepper: AdaptiveStepper，None 時每段都以 simulation_step 為步長 (G0 固定 RAPID_STEPS 步)
+        G1/G2/G3 的進給 F 不大於 0 時 raise ValueError
+        """
+        count = len(cut_paths)
+        pose = np.zeros(5) if start_pose is None else np.array(start_pose, dtype=np.float64)
+        start = np.zeros((count, 5))
+        end = np.zeros((count, 5))
+        step_count = np.zeros(count, dtype=np.int64)
+        scale = np.zeros(count)
+        distance = np.zeros(count)
+        rapid = np.zeros(count, dtype=bool)
+        # 圓弧段: 平面軸、圓心 (u, v)、起始角、半徑、掃掠角、是否為 G17
+        arc = np.zeros(count, dtype=bool)
+        axes = np.tile(np.arange(3), (count, 1))
+        center = np.zeros((count, 2))
+        phi0 = np.zeros(count)
+        radius = np.zeros(count)
+        sweep = np.zeros(count)
+        xy_plane = np.zeros(count, dtype=bool)
+
+        for k, path_info in enumerate(cut_paths):
+            target = np.asarray(path_info['target_pose'], dtype=np.float64)
+            start[k] = pose
+            vector = target[:3] - pose[:3]
+            angle = target[3:] - pose[3:]
+            magnitude = norm(vector)
+            C_movement = radius_c * np.deg2rad(abs(angle[0]))
+            A_movement = radius_a * np.deg2rad(abs(angle[1]))
+            if magnitude == 0 and C_movement == 0 and A_movement == 0:
+                end[k] = pose
+                continue
+
+            command = path_info['motion_mode']
+            rapid[k] = command == 'G0'
+            if not rapid[k] and not path_info['feed'] > 0:
+                raise ValueError(f"G-code line {path_info['line_number']}: {command} move without a positive feed rate "
+                                 f"(F{path_info['feed']:g}).")
+            # C/A 旋轉時刀具在工件座標系走的是半徑 radius_c / radius_a 的曲線
+            rotary_radius = min([np.inf] + [rr for rr, moved in ((radius_c, C_movement), (radius_a, A_movement)) if moved > 0])
+            end[k] = target
+            arc_params = path_info['arc_params']
+            if command in ARC_COMMANDS and arc_params:
+                plane = path_info.get('plane', 'G17')
+                uvw = PLANE_AXES.get(plane, PLANE_AXES['G17'])
+                local_params = {}
+                if 'R' in arc_params:
+                    local_params['R'] = arc_params['R']
+                words = [CENTER_WORDS[i] for i in uvw[:2]]
+                if any(word in arc_params for word in words):
+                    # 圓弧平面的兩個圓心偏移量，省略的一個視為 0
+                    local_params['I'], local_params['J'] = (arc_params.get(word, 0.0) for word in words)
+                p0, p1 = pose[:3][list(uvw)], target[:3][list(uvw)]
+                c, r, sweep_angle, arc_distance, is_linear_move = arc_solver(p0, p1, local_params, command)
+                if not is_linear_move:
+                    arc[k] = True
+                    axes[k] = uvw
+                    center[k] = c[:2]
+                    phi0[k] = np.arctan2(p0[1] - c[1], p0[0] - c[0])
+                    radius[k] = norm(p0[:2] - c[:2])
+                    sweep[k] = sweep_angle
+                    xy_plane[k] = plane == 'G17'
+                    effective_distance = max(arc_distance, C_movement, A_movement)
+                    step_length = simulation_step if stepper is None else stepper.planned_step(min(r, rotary_radius))
+                    step_count[k] = max(1, int(np.ceil(effective_distance / step_length)))
+                    scale[k] = arc_distance / step_count[k]
+                    distance[k] = arc_distance
+                    # 圓弧終點為起點繞圓心轉過掃掠角 (半徑以起點為準)，w 軸直線插補
+                    u = c[0] + radius[k] * np.cos(phi0[k] + sweep_angle)
+                    v = c[1] + radius[k] * np.sin(phi0[k] + sweep_angle)
+                    end[k, list(uvw)] = [u, v, p1[2]]
+                    pose = end[k].copy()
+                    continue
+
+            effective_distance = max(magnitude, C_movement, A_movement)
+            if rapid[k]:
+                step_count[k] = RAPID_STEPS
+            else:
+                step_length = simulation_step if stepper is None else stepper.planned_step(rotary_radius)
+                step_count[k] = max(1, int(np.ceil(effective_distance / step_length)))
+            scale[k] = effective_distance / step_count[k]
+            distance[k] = effective_distance
+            pose = end[k].copy()
+
+        # 逐步展開: 第 j 步 (1..n) 的插補比例 j / n
+        segment = np.repeat(np.arange(count), step_count)
+        offset = np.concatenate(([0], np.cumsum(step_count)[:-1])).astype(np.int64)
+        j = np.arange(len(segment)) - offset[segment] + 1
+        frac = j / step_count[segment]
+
+        steps_pose = start[segment] + frac[:, None] * (end[segment] - start[segment])
+        on_arc = arc[segment]
+        if on_arc.any():
+            seg = segment[on_arc]
+            phi = phi0[seg] + frac[on_arc] * sweep[seg]
+            uvw = axes[seg]
+            rows = np.nonzero(on_arc)[0]
+            steps_pose[rows, uvw[:, 0]] = center[seg, 0] + radius[seg] * np.cos(phi)
+            steps_pose[rows, uvw[:, 1]] = center[seg, 1] + radius[seg] * np.sin(phi)
+
+        previous = np.vstack((start[segment[:1]], steps_pose[:-1])) if len(segment) else steps_pose
+        # 段與段之間沒有跳躍 (跳過的段起終點相同)，上一步的結束姿態即為這一步的起點
+        step_vector = steps_pose[:, :3] - previous[:, :3]
+        step_angle = steps_pose[:, 3:] - previous[:, 3:]
+        spin = np.where(on_arc & xy_plane[segment], sweep[segment] / np.maximum(step_count[segment], 1), 0.0)
+
+        feed = np.array([path_info['feed'] for path_info in cut_paths], dtype=np.float64)
+        # G0 的進給可能為 0 (程式開頭尚未指定 F)，只有非 G0 的步以 F 計算時間
+        on_rapid = rapid[segment]
+        dt = np.empty(len(segment))
+        dt[on_rapid] = norm(step_vector[on_rapid], axis=1) / (RAPID_FEED / 60)
+        dt[~on_rapid] = scale[segment[~on_rapid]] / (feed[segment[~on_rapid]] / 60)
+        line_number = np.array([path_info['line_number'] for path_info in cut_paths], dtype=np.int64)
+        step_line = line_number[segment]
+        for k, path_info in enumerate(cut_paths):
+            if 'source_lines' in path_info and step_count[k]:
+                rows = np.arange(offset[k], offset[k] + step_count[k])
+                index = np.searchsorted(path_info['source_breaks'], frac[rows] - 1e-9)
+                step_line[rows] = np.asarray(path_info['source_lines'])[np.minimum(index, len(path_info['source_lines']) - 1)]
+        return cls(start, offset, step_count, scale, distance, line_number, feed,
+                   steps_pose, step_vector, step_angle, spin, np.cumsum(dt), segment, step_line)
+
+
+class AdaptiveStepper:
+    """
+    自適應步長。
+    規劃時: 每段以 max_step 為步長，圓弧與 C/A 旋轉依弦高誤差 max_error 限制步長 (step <= sqrt(8 r e))，不小於 min_step。
+    離散刀具姿態之間會留下殘料 (scallop)，切削中的步長也以刀具半徑 tool_radius 限制殘料高度不超過 max_error
+    (掃掠體積模式沒有殘料，tool_radius 設為 inf)。
+    模擬時: 空切的連續步合併 (最長 max_air_step)；切削截面積相對變化超過 engagement_tolerance 時，
+    之後的規劃步立即細分到最細 (min_step)，切削量穩定後每步細分數減半，逐漸回到規劃步長。
+    """
+    def __init__(self, min_step=0.1, max_step=3.0, max_error=0.02, engagement_tolerance=0.2, tool_radius=np.inf,
+                 max_air_step=50.0):
+        self.min_step = min_step
+        self.max_step = max(max_step, min_step)
+        self.max_air_step = max(max_air_step, self.max_step)
+        self.max_error = max_error
+        self.engagement_tolerance = engagement_tolerance
+        self.tool_radius = tool_radius
+        self.refine = 1
+        self.last_engagement = None
+        self.peak_engagement = 0.0
+        self.after_air = False
+
+    def chord_step(self, radius):
+        """半徑 radius 的圓上，弦高不超過 max_error 的步長"""
+        if 0 < radius < np.inf:
+            return max(np.sqrt(8 * radius * self.max_error), self.min_step)
+        return self.max_step
+
+    def planned_step(self, radius=np.inf):
+        """半徑 radius 的曲線路徑上的規劃步長 (空切的步在模擬時再合併)"""
+        return max(min(self.max_step, self.chord_step(radius), self.chord_step(self.tool_radius)), self.min_step)
+
+    def subdivisions(self, scale):
+        """長度 scale 的規劃步目前要細分的步數 (至少滿足目前刀具的殘料高度)"""
+        finest = int(np.ceil(scale / self.min_step - 1e-9))
+        scallop = int(np.ceil(scale / self.chord_step(self.tool_radius) - 1e-9))
+        return max(1, scallop, min(self.refine, finest))
+
+    def enter_material(self):
+        """上一步為空切 (broad phase) 而這一步會碰到材料: 切入是切削量變化最大的地方，直接細分到最細"""
+        if self.after_air:
+            self.refine = int(np.ceil(self.max_step / self.min_step))
+            self.after_air = False
+
+    def observe(self, engagement):
+        """每一步的切削截面積 (空切為 0) 回饋給步長控制"""
+        self.peak_engagement = max(self.peak_engagement, engagement)
+        if self.last_engagement is not None:
+            # 相對變化以目前為止最大截面積的 5% 為下限，避免只擦到薄片時的微小數值也觸發細分
+            change = abs(engagement - self.last_engagement) / max(engagement, self.last_engagement,
+                                                                   0.05 * self.peak_engagement, 1e-9)
+            if change > self.engagement_tolerance:
+                self.refine = int(np.ceil(self.max_step / self.min_step))
+            elif change < self.engagement_tolerance / 2:
+                self.refine = max(1, self.refine // 2)
+        self.last_engagement = engagement